@@ -0,0 +1,222 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+import metrics
+
+log = logging.getLogger("aurora.answer_cache")
+
+# ──────────────────────────────
+# Configuration
+# ──────────────────────────────
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL_SEC = float(os.getenv("ANSWER_CACHE_TTL_SEC", "3600"))
+# Cosine similarity needed for a semantic (near-duplicate question) hit
+ANSWER_CACHE_SIM_THRESHOLD = float(os.getenv("ANSWER_CACHE_SIM_THRESHOLD", "0.92"))
+# Optional SQLite file; empty keeps the cache in memory only
+ANSWER_CACHE_DB = os.getenv("ANSWER_CACHE_DB", "")
+
+# ──────────────────────────────
+# Keys
+# ──────────────────────────────
+def normalize_question(question):
+    """Lowercase, drop punctuation and collapse whitespace."""
+    question = question.replace("’", "'").lower()
+    question = re.sub(r"[^a-z0-9' ]+", " ", question)
+    return re.sub(r"\s+", " ", question).strip()
+
+
+def context_fingerprint(context):
+    """Order-independent hash of the retrieved message ids."""
+    ids = sorted(str(c.get("id") or c.get("text")) for c in context)
+    return hashlib.sha1("\x1f".join(ids).encode("utf-8")).hexdigest()
+
+# ──────────────────────────────
+# Two-tier answer cache
+# ──────────────────────────────
+class AnswerCache:
+    """
+    Caches LLM answers in front of `generate_answer`.
+      1️⃣ Exact tier — normalized question + context fingerprint.
+      2️⃣ Semantic tier — nearest cached question embedding above
+         `sim_threshold`, accepted only if its context fingerprint matches.
+    Entries expire after `ttl` seconds and are evicted LRU beyond `max_size`.
+    `invalidate_users` drops entries whose context involved those members.
+    SQLite writes run on one background thread, so callers (the event loop)
+    never wait on disk or on another worker's lock, and a failed write is
+    logged rather than failing the request.
+    """
+
+    def __init__(self, max_size=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL_SEC,
+                 sim_threshold=ANSWER_CACHE_SIM_THRESHOLD, db_path=ANSWER_CACHE_DB):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.sim_threshold = sim_threshold
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_writer = None
+        if db_path:
+            self._open_db(db_path)
+            self._db_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="answer-cache-db")
+
+    # ──────────────────────────────
+    # Lookup / insert
+    # ──────────────────────────────
+    def get(self, question, context, query_embedding=None):
+        """Return `(answer, tier)` on a hit, `(None, None)` on a miss."""
+        fingerprint = context_fingerprint(context)
+        key = self._key(question, fingerprint)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and not self._expired(entry, now):
+                self._entries.move_to_end(key)
+                metrics.inc("answer_cache_hits_exact")
+                return entry["answer"], "exact"
+
+            if query_embedding is not None:
+                best_key, best_sim = None, self.sim_threshold
+                q = np.asarray(query_embedding, dtype=np.float32)
+                for k, e in self._entries.items():
+                    if e["fingerprint"] != fingerprint or e["embedding"] is None or self._expired(e, now):
+                        continue
+                    sim = float(np.dot(q, e["embedding"]))
+                    if sim >= best_sim:
+                        best_key, best_sim = k, sim
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    metrics.inc("answer_cache_hits_semantic")
+                    return self._entries[best_key]["answer"], "semantic"
+
+        metrics.inc("answer_cache_misses")
+        return None, None
+
+    def put(self, question, context, answer, query_embedding=None):
+        fingerprint = context_fingerprint(context)
+        entry = {
+            "question": normalize_question(question),
+            "fingerprint": fingerprint,
+            "users": sorted({c.get("user_name") for c in context if c.get("user_name")}),
+            "answer": answer,
+            "embedding": None if query_embedding is None else np.asarray(query_embedding, dtype=np.float32),
+            "created": time.time(),
+        }
+        key = self._key(question, fingerprint)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            evicted = []
+            while len(self._entries) > self.max_size:
+                evicted.append(self._entries.popitem(last=False)[0])
+        self._persist(self._db_write, key, entry, evicted)
+
+    def invalidate_users(self, user_names):
+        """Drop every entry whose context came from any of `user_names`."""
+        user_names = set(user_names or [])
+        if not user_names:
+            return 0
+        with self._lock:
+            stale = [k for k, e in self._entries.items() if user_names.intersection(e["users"])]
+            for k in stale:
+                del self._entries[k]
+        self._persist(self._db_delete, stale)
+        if stale:
+            log.info(f"🧹 Invalidated {len(stale)} cached answers for {len(user_names)} members.")
+        metrics.inc("answer_cache_invalidations", len(stale))
+        return len(stale)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def close(self):
+        """Flush pending SQLite writes (app shutdown)."""
+        if self._db_writer is not None:
+            self._db_writer.shutdown(wait=True)
+            self._db_writer = None
+
+    def _key(self, question, fingerprint):
+        return hashlib.sha1(f"{normalize_question(question)}|{fingerprint}".encode("utf-8")).hexdigest()
+
+    def _expired(self, entry, now):
+        return self.ttl > 0 and now - entry["created"] > self.ttl
+
+    # ──────────────────────────────
+    # SQLite persistence
+    # ──────────────────────────────
+    def _open_db(self, path):
+        # Several workers may share the file: wait on their locks (timeout)
+        # and let readers proceed during writes (WAL)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "key TEXT PRIMARY KEY, question TEXT, fingerprint TEXT, users TEXT, "
+            "answer TEXT, embedding BLOB, created REAL)"
+        )
+        if self.ttl > 0:
+            self._db.execute("DELETE FROM answers WHERE created < ?", (time.time() - self.ttl,))
+        self._db.commit()
+
+        rows = self._db.execute(
+            "SELECT key, question, fingerprint, users, answer, embedding, created "
+            "FROM answers ORDER BY created DESC LIMIT ?",
+            (self.max_size,),
+        ).fetchall()
+        for key, question, fingerprint, users, answer, emb, created in reversed(rows):
+            self._entries[key] = {
+                "question": question,
+                "fingerprint": fingerprint,
+                "users": json.loads(users),
+                "answer": answer,
+                "embedding": None if emb is None else np.frombuffer(emb, dtype=np.float32),
+                "created": created,
+            }
+        log.info(f"💾 Loaded {len(rows)} cached answers from {path}.")
+
+    def _persist(self, fn, *args):
+        """Run a SQLite write on the background writer thread."""
+        if self._db_writer is None or not any(args):
+            return
+        self._db_writer.submit(self._guarded, fn, *args)
+
+    def _guarded(self, fn, *args):
+        try:
+            fn(*args)
+        except sqlite3.Error as e:  # e.g. "database is locked" — the in-memory tier still has it
+            metrics.inc("answer_cache_db_errors")
+            log.warning(f"⚠️ Answer cache write failed ({fn.__name__}): {e}")
+            try:
+                self._db.rollback()
+            except sqlite3.Error:
+                pass
+
+    def _db_write(self, key, entry, evicted):
+        if self._db is None:
+            return
+        emb = entry["embedding"]
+        self._db.execute(
+            "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                key, entry["question"], entry["fingerprint"], json.dumps(entry["users"]),
+                entry["answer"], None if emb is None else emb.tobytes(), entry["created"],
+            ),
+        )
+        self._db_delete(evicted, commit=False)
+        self._db.commit()
+
+    def _db_delete(self, keys, commit=True):
+        if self._db is None or not keys:
+            return
+        self._db.executemany("DELETE FROM answers WHERE key = ?", [(k,) for k in keys])
+        if commit:
+            self._db.commit()
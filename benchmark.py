@@ -0,0 +1,361 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import hashlib
+import resource
+import tempfile
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# ──────────────────────────────
+# Offline benchmark for the /ask pipeline
+# ──────────────────────────────
+# Replays a labeled question set through detect_user_name →
+# retrieve_relevant_messages → a stubbed generate_answer against a
+# synthetic corpus (the cached messages scaled N×), without touching
+# chroma_store/ or calling OpenAI. Results are written to JSON so runs
+# can be diffed with `--compare`.
+BENCH_DIR = "bench_results"
+STOPWORDS = {
+    "a", "an", "the", "to", "for", "of", "in", "on", "at", "my", "me", "i", "i'd", "i'm", "you", "your",
+    "can", "could", "would", "please", "need", "like", "want", "is", "are", "be", "and", "or", "with",
+    "this", "that", "it", "we", "our", "us", "do", "have", "has", "get", "make", "ensure", "arrange",
+    "book", "confirm", "let", "know", "what", "when", "from", "will", "just", "so", "as", "by", "any",
+}
+
+
+def rss_mb():
+    """Peak resident set size of this process so far (ru_maxrss is KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+# ──────────────────────────────
+# Synthetic corpus
+# ──────────────────────────────
+_SYLLABLES = ("ka", "lo", "mi", "ren", "tor", "vas", "el", "qui", "dar", "ny", "sol", "bri", "zen", "ath", "mor", "ul")
+
+
+def _synthetic_names(count, taken, rng):
+    """`count` unique two-part names sharing no token with `taken` (so name detection stays unambiguous)."""
+    names, used = [], set(taken)
+    while len(names) < count:
+        first = "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+        last = "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+        if first.lower() in used or last.lower() in used:
+            continue
+        used.update((first.lower(), last.lower()))
+        names.append(f"{first} {last}")
+    return names
+
+
+def scale_corpus(messages, scale, seed=0):
+    """
+    Copy 0 is the real corpus; copies 1…scale-1 repeat every message under
+    synthetic members, so each labeled question faces (scale - 1)× distractors.
+    Texts are reused verbatim, which lets their embeddings be reused too.
+    """
+    rng = random.Random(seed)
+    members = sorted({(m["user_id"], m["user_name"]) for m in messages})
+    taken = {part.lower() for _, name in members for part in re.findall(r"[A-Za-z0-9]+", name)}
+    fake_names = iter(_synthetic_names(len(members) * (scale - 1), taken, rng))
+
+    corpus = list(messages)
+    for copy in range(1, scale):
+        renamed = {uid: (str(uuid.uuid5(uuid.NAMESPACE_OID, f"{uid}/{copy}")), next(fake_names)) for uid, _ in members}
+        for m in messages:
+            user_id, user_name = renamed[m["user_id"]]
+            corpus.append({
+                **m,
+                "id": str(uuid.uuid5(uuid.NAMESPACE_OID, f"{m['id']}/{copy}")),
+                "user_id": user_id,
+                "user_name": user_name,
+            })
+    return corpus
+
+
+def load_source_messages():
+    """The locally cached messages (store, else legacy pickle); only syncs from the API when neither exists."""
+    import pickle
+    from message_store import MessageStore
+    from utils import STORE_PATH, CACHE_FILE, load_messages
+
+    if MessageStore.exists(STORE_PATH):
+        return list(MessageStore(STORE_PATH))
+    if os.path.exists(CACHE_FILE):
+        with open(CACHE_FILE, "rb") as f:
+            return pickle.load(f)
+    return list(load_messages())
+
+# ──────────────────────────────
+# Labeled questions
+# ──────────────────────────────
+def _topic(text, max_words=5):
+    words = [w for w in re.findall(r"[A-Za-z0-9'’-]+", text) if w.lower() not in STOPWORDS]
+    return " ".join(words[:max_words])
+
+
+def generate_questions(messages, count, seed=0):
+    """
+    One question per sampled message ("What did <member> say about <content words>?"),
+    labeled with every message by that member carrying the same text.
+    """
+    rng = random.Random(seed)
+    same_text = {}
+    for m in messages:
+        same_text.setdefault((m["user_name"], m["message"].strip().lower()), []).append(m["id"])
+
+    questions = []
+    for m in rng.sample(list(messages), min(count, len(messages))):
+        topic = _topic(m["message"])
+        if not topic:
+            continue
+        questions.append({
+            "question": f"What did {m['user_name']} say about {topic}?",
+            "user_name": m["user_name"],
+            "relevant_ids": same_text[(m["user_name"], m["message"].strip().lower())],
+        })
+    return questions
+
+
+def load_questions(path):
+    """JSONL with `question` and optional `user_name` / `relevant_ids` labels."""
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+# ──────────────────────────────
+# Index setup (isolated from chroma_store/)
+# ──────────────────────────────
+def encode_unique_texts(retriever, texts, cache_dir):
+    """Encode each distinct text once; cached on disk per model + backend + text set."""
+    unique = sorted(set(texts))
+    key = hashlib.sha1(f"{retriever.EMBED_MODEL}@{retriever.EMBED_BACKEND}".encode())
+    for t in unique:
+        key.update(t.encode("utf-8"))
+    path = os.path.join(cache_dir, f"embeddings-{key.hexdigest()[:16]}.npy")
+    if os.path.exists(path):
+        return dict(zip(unique, np.load(path))), 0.0
+
+    t0 = time.perf_counter()
+    vectors = retriever.get_model().encode(
+        unique, batch_size=64, show_progress_bar=False, normalize_embeddings=True
+    ).astype(np.float32)
+    encode_sec = time.perf_counter() - t0
+    os.makedirs(cache_dir, exist_ok=True)
+    np.save(path, vectors)
+    return dict(zip(unique, vectors)), encode_sec
+
+
+def build_bench_index(retriever, corpus, vectors_by_text, backend, workdir):
+    """Point `retriever` at a throwaway index over `corpus`; returns the message store."""
+    from message_store import MessageStore
+
+    store = MessageStore.write(os.path.join(workdir, "message_store"), corpus)
+    store = store.write_embeddings(
+        {m["id"]: vectors_by_text[m["message"]] for m in corpus}, f"{retriever.EMBED_MODEL}@bench"
+    )
+
+    if backend == "chroma":
+        import chromadb
+
+        collection = chromadb.PersistentClient(path=os.path.join(workdir, "chroma")).get_or_create_collection(
+            name="member_messages", metadata={"hnsw:space": "cosine"}
+        )
+        for i in range(0, len(corpus), 5000):
+            batch = corpus[i:i + 5000]
+            collection.add(
+                ids=[m["id"] for m in batch],
+                documents=[m["message"] for m in batch],
+                embeddings=[vectors_by_text[m["message"]].tolist() for m in batch],
+                metadatas=[retriever.message_metadata(m) for m in batch],
+            )
+        retriever._collection = collection
+    # Both backends get the BM25 index, so they replay the same hybrid pipeline
+    retriever.use_message_store(store)
+    return store
+
+# ──────────────────────────────
+# Replay
+# ──────────────────────────────
+def stub_generate_answer(llm, question, context, latency_ms):
+    """Stand-in for generate_answer: real prompt assembly, fixed sleep instead of the API call."""
+    stats = {}
+    llm.build_messages(question, context, stats)
+    if latency_ms:
+        time.sleep(latency_ms / 1000)
+    return "benchmark answer", stats
+
+
+def run_one(item, retriever, llm, metrics, user_names, top_k, llm_latency_ms):
+    with metrics.collect_spans() as spans:
+        with metrics.span("total"):
+            with metrics.span("user_detection"):
+                user = retriever.detect_user_name(item["question"], user_names)
+            with metrics.span("retrieval"):
+                context = retriever.retrieve_relevant_messages(item["question"], top_k=top_k, user_name=user)
+            with metrics.span("llm_stub"):
+                _, prompt_stats = stub_generate_answer(llm, item["question"], context, llm_latency_ms)
+    return {
+        "spans": dict(spans),
+        "detected_user": user,
+        "retrieved_ids": [c["id"] for c in context],
+        # The context is newest-first; recall@k is taken over the k best reciprocal-rank scores
+        "ranked_ids": [c["id"] for c in sorted(context, key=lambda c: c["score"])],
+        "context_tokens": prompt_stats.get("context_tokens", 0),
+    }
+
+
+def percentiles(values):
+    arr = np.asarray(values, dtype=np.float64) * 1000
+    return {
+        "count": len(values),
+        "mean_ms": round(float(arr.mean()), 3),
+        "p50_ms": round(float(np.percentile(arr, 50)), 3),
+        "p95_ms": round(float(np.percentile(arr, 95)), 3),
+        "p99_ms": round(float(np.percentile(arr, 99)), 3),
+    }
+
+
+def summarize(questions, outcomes, k):
+    by_stage = {}
+    for out in outcomes:
+        for stage, sec in out["spans"].items():
+            by_stage.setdefault(stage, []).append(sec)
+
+    labeled = [(q, o) for q, o in zip(questions, outcomes) if q.get("relevant_ids")]
+    recalls = [
+        len(set(q["relevant_ids"]) & set(o["ranked_ids"][:k])) / len(q["relevant_ids"])
+        for q, o in labeled
+    ]
+    with_user = [(q, o) for q, o in zip(questions, outcomes) if q.get("user_name")]
+    return {
+        "stages": {stage: percentiles(v) for stage, v in sorted(by_stage.items())},
+        "quality": {
+            f"recall@{k}": round(float(np.mean(recalls)), 4) if recalls else None,
+            f"hit_rate@{k}": round(float(np.mean([r > 0 for r in recalls])), 4) if recalls else None,
+            "user_detection_accuracy": (
+                round(float(np.mean([o["detected_user"] == q["user_name"] for q, o in with_user])), 4)
+                if with_user else None
+            ),
+            "labeled_questions": len(labeled),
+            "mean_context_tokens": round(float(np.mean([o["context_tokens"] for o in outcomes])), 1),
+        },
+    }
+
+
+def run_benchmark(scale=1, concurrency=4, n_questions=200, k=5, backend="numpy",
+                  llm_latency_ms=0, questions_file=None, workdir=None, seed=0):
+    os.environ["RETRIEVAL_BACKEND"] = backend  # read by retriever at import
+    import retriever
+    import llm
+    import metrics
+
+    rss_start = rss_mb()
+    messages = load_source_messages()
+    questions = load_questions(questions_file) if questions_file else generate_questions(messages, n_questions, seed)
+
+    t0 = time.perf_counter()
+    corpus = scale_corpus(messages, scale, seed)
+    workdir = workdir or tempfile.mkdtemp(prefix="aurora-bench-")
+    vectors_by_text, encode_sec = encode_unique_texts(retriever, [m["message"] for m in corpus], BENCH_DIR)
+    t1 = time.perf_counter()
+    store = build_bench_index(retriever, corpus, vectors_by_text, backend, workdir)
+    user_names = store.user_names()
+    retriever.build_name_index(user_names)
+    # Warm the encoder and the index without opening the real chroma_store/
+    q_emb = retriever.query_encoder.encode("warmup: upcoming trips").tolist()
+    retriever.search_backend().query(query_embeddings=[q_emb], n_results=1, include=retriever.QUERY_INCLUDE)
+    t2 = time.perf_counter()
+    rss_loaded = rss_mb()
+
+    print(f"🏁 Replaying {len(questions)} questions over {len(corpus)} messages "
+          f"({backend}, {concurrency} concurrent)…")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench") as pool:
+        outcomes = list(pool.map(
+            lambda q: run_one(q, retriever, llm, metrics, user_names, k, llm_latency_ms), questions
+        ))
+    wall = time.perf_counter() - start
+
+    return {
+        "run_at": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "scale": scale,
+            "corpus_messages": len(corpus),
+            "members": len(user_names),
+            "questions": len(questions),
+            "question_source": questions_file or "generated",
+            "concurrency": concurrency,
+            "k": k,
+            "backend": backend,
+            "embed_backend": retriever.EMBED_BACKEND,
+            "llm_latency_ms": llm_latency_ms,
+            "seed": seed,
+        },
+        "setup": {
+            "corpus_and_encode_sec": round(t1 - t0, 3),
+            "encode_sec": round(encode_sec, 3),
+            "index_build_sec": round(t2 - t1, 3),
+        },
+        "throughput": {"wall_sec": round(wall, 3), "qps": round(len(questions) / wall, 2) if wall else None},
+        "memory": {"rss_start_mb": rss_start, "rss_after_index_mb": rss_loaded, "peak_rss_mb": rss_mb()},
+        **summarize(questions, outcomes, k),
+    }
+
+
+def compare(current, previous):
+    """Print p50/p95 and quality deltas against an earlier result file."""
+    print(f"\n📊 vs {previous.get('run_at')} (scale {previous['config']['scale']}, "
+          f"concurrency {previous['config']['concurrency']}):")
+    for stage, cur in current["stages"].items():
+        old = previous["stages"].get(stage)
+        if old:
+            print(f"  {stage:<20} p50 {cur['p50_ms']:>9.2f}ms ({cur['p50_ms'] - old['p50_ms']:+.2f})"
+                  f"   p95 {cur['p95_ms']:>9.2f}ms ({cur['p95_ms'] - old['p95_ms']:+.2f})")
+    for key, value in current["quality"].items():
+        old = previous["quality"].get(key)
+        if isinstance(value, (int, float)) and isinstance(old, (int, float)):
+            print(f"  {key:<20} {value} ({value - old:+.4f})")
+    print(f"  {'qps':<20} {current['throughput']['qps']} ({current['throughput']['qps'] - previous['throughput']['qps']:+.2f})")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Offline throughput / latency / recall benchmark of the /ask pipeline.")
+    ap.add_argument("--scale", type=int, default=1, help="corpus multiplier (e.g. 10 or 100)")
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--questions", type=int, default=200, help="generated questions (ignored with --questions-file)")
+    ap.add_argument("--questions-file", help="labeled JSONL: question, user_name, relevant_ids")
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--backend", choices=("numpy", "chroma"), default="numpy")
+    ap.add_argument("--llm-latency-ms", type=float, default=0, help="sleep in the stubbed LLM call")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--workdir", help="where the throwaway index is built (default: a temp dir)")
+    ap.add_argument("--out", help=f"result file (default: {BENCH_DIR}/bench-<time>.json)")
+    ap.add_argument("--compare", help="earlier result file to diff against")
+    args = ap.parse_args()
+
+    result = run_benchmark(
+        scale=args.scale, concurrency=args.concurrency, n_questions=args.questions, k=args.k,
+        backend=args.backend, llm_latency_ms=args.llm_latency_ms, questions_file=args.questions_file,
+        workdir=args.workdir, seed=args.seed,
+    )
+
+    out = args.out or os.path.join(BENCH_DIR, f"bench-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+
+    print(json.dumps({k: result[k] for k in ("throughput", "memory", "quality")}, indent=2))
+    for stage, p in result["stages"].items():
+        print(f"  {stage:<20} p50 {p['p50_ms']:>9.2f}ms   p95 {p['p95_ms']:>9.2f}ms   p99 {p['p99_ms']:>9.2f}ms")
+    print(f"💾 Wrote {out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(result, json.load(f))
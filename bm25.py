@@ -0,0 +1,154 @@
+import numpy as np
+
+from name_index import normalize_text, word_tokens
+
+# ──────────────────────────────
+# Tokenization
+# ──────────────────────────────
+# Question scaffolding (and relative-date words, handled by time_window)
+# that says nothing about the messages themselves
+STOPWORDS = frozenset("""
+a an the and or but of to in on at for from by with about as is are was were be been am do does did
+done have has had i me my mine you your we our us he him his she her they them their it its this that
+these those what when where which who whom whose why how can could would should will shall may might
+please need want like any some all s t d ll re ve m let know tell say said ask asked
+last next recent recently ago today yesterday week weeks month months year years
+""".split())
+
+
+def tokenize(text):
+    """Lower-cased word tokens with stopwords removed (same normalization as name matching)."""
+    return [t for t in word_tokens(normalize_text(text or "")) if t not in STOPWORDS]
+
+# ──────────────────────────────
+# Partitioned BM25 index
+# ──────────────────────────────
+class BM25Index:
+    """
+    Inverted BM25 index over message text, partitioned by member.
+      1️⃣ One partition per `user_name` (a contiguous row range) plus a
+         global one, each with its own document frequencies and length norm.
+      2️⃣ Postings store precomputed per-document term weights, so a query
+         is a concatenate + `bincount` over the postings of its few tokens.
+    Rows are positions in the source table (e.g. MessageStore rows).
+    """
+
+    GLOBAL = None
+
+    def __init__(self, texts, slices=None, ts_epoch=None, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.ts_epoch = ts_epoch
+
+        # One pass over the corpus → flat (row, token id, tf) triples in row order
+        vocab, rows, tok_ids, tfs = {}, [], [], []
+        size = 0
+        for r, text in enumerate(texts):
+            size += 1
+            counts = {}
+            for tok in tokenize(text):
+                counts[tok] = counts.get(tok, 0) + 1
+            for tok, tf in counts.items():
+                rows.append(r)
+                tok_ids.append(vocab.setdefault(tok, len(vocab)))
+                tfs.append(tf)
+        self.size = size
+        self.vocab = list(vocab)
+        self._rows = np.asarray(rows, dtype=np.int32)
+        self._tok_ids = np.asarray(tok_ids, dtype=np.int32)
+        self._tfs = np.asarray(tfs, dtype=np.float32)
+        self._lengths = np.bincount(self._rows, weights=self._tfs, minlength=size).astype(np.float32)
+
+        self.partitions = {self.GLOBAL: self._build(0, size)}
+        for name, (start, stop) in (slices or {}).items():
+            self.partitions[name] = self._build(start, stop)
+
+    def _build(self, start, stop):
+        """token → (rows int32, weights float32) for rows start…stop-1."""
+        n = stop - start
+        lo, hi = np.searchsorted(self._rows, [start, stop])
+        if n <= 0 or lo == hi:
+            return {}
+        rows, tok_ids, tfs = self._rows[lo:hi], self._tok_ids[lo:hi], self._tfs[lo:hi]
+        avgdl = float(self._lengths[start:stop].mean()) or 1.0
+
+        df = np.bincount(tok_ids, minlength=len(self.vocab))
+        idf = np.log1p((n - df + 0.5) / (df + 0.5))
+        norm = self.k1 * (1.0 - self.b + self.b * self._lengths[rows] / avgdl)
+        weights = (idf[tok_ids] * tfs * (self.k1 + 1.0) / (tfs + norm)).astype(np.float32)
+
+        order = np.argsort(tok_ids, kind="stable")  # stable → rows stay sorted per token
+        tok_sorted = tok_ids[order]
+        bounds = np.flatnonzero(np.diff(tok_sorted)) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [len(order)]))
+        return {
+            self.vocab[tok_sorted[a]]: (rows[order[a:e]], weights[order[a:e]])
+            for a, e in zip(starts, ends)
+        }
+
+    def query_tokens(self, query, user_name=None):
+        """Distinct query tokens; inside a member's partition their own name parts are dropped."""
+        tokens = set(tokenize(query))
+        if user_name:
+            tokens -= set(tokenize(user_name))
+        return tokens
+
+    def search(self, query, user_name=None, k=10, window=None):
+        """
+        Top-`k` `(row, score)` pairs, best first, within `user_name`'s
+        partition (global when None) and an optional `(start, end)` epoch window.
+        """
+        postings = self.partitions.get(user_name)
+        if not postings:
+            return []
+        hits = [postings[t] for t in self.query_tokens(query, user_name) if t in postings]
+        if not hits:
+            return []
+
+        rows = np.concatenate([h[0] for h in hits])
+        weights = np.concatenate([h[1] for h in hits])
+        if len(hits) > 1:
+            rows, inverse = np.unique(rows, return_inverse=True)
+            scores = np.bincount(inverse, weights=weights)
+        else:
+            scores = weights.astype(np.float64)
+
+        if window and self.ts_epoch is not None:
+            epochs = self.ts_epoch[rows]
+            keep = (epochs >= window[0]) & (epochs <= window[1])
+            rows, scores = rows[keep], scores[keep]
+            if not len(rows):
+                return []
+
+        if k < len(rows):
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+        else:
+            top = np.argsort(-scores)
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+    def is_confident(self, query, hits, user_name=None, min_score=8.0):
+        """
+        True when the best hit scores at least `min_score` and contains
+        every query token, i.e. the lexical match alone answers the lookup.
+        """
+        if not hits or hits[0][1] < min_score:
+            return False
+        postings = self.partitions.get(user_name) or {}
+        best = hits[0][0]
+        for tok in self.query_tokens(query, user_name):
+            rows = postings.get(tok)
+            if rows is None:
+                return False
+            pos = np.searchsorted(rows[0], best)  # postings rows are sorted
+            if pos >= len(rows[0]) or rows[0][pos] != best:
+                return False
+        return True
+
+    @classmethod
+    def from_message_store(cls, store):
+        """Index a MessageStore's messages; `index.store` keeps rows resolvable to ids / text."""
+        index = cls(store.column("message"), slices=store.user_name_slices(), ts_epoch=np.asarray(store.ts_epoch))
+        index.store = store
+        return index
@@ -0,0 +1,161 @@
+import os
+import time
+import logging
+import queue
+import threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+log = logging.getLogger("aurora.bulk_index")
+
+# ──────────────────────────────
+# Configuration
+# ──────────────────────────────
+# Encoder processes used for bulk (re)indexing; 0/1 keeps the serial path.
+INDEX_WORKERS = int(os.getenv("INDEX_WORKERS", "0"))
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "64"))
+# Incremental syncs smaller than this encode in-process: spawning the pool
+# loads one model per worker, which costs far more than a few batches.
+INDEX_POOL_MIN_DOCS = int(os.getenv("INDEX_POOL_MIN_DOCS", "5000"))
+# Encoded batches waiting to be written; bounds memory when writes fall behind.
+WRITE_QUEUE_SIZE = int(os.getenv("INDEX_WRITE_QUEUE", "8"))
+
+# ──────────────────────────────
+# Worker process
+# ──────────────────────────────
+# Deliberately does not import `retriever`: each spawned worker loads
+# only the encoder, not the Chroma client or the parent's model.
+_worker_model = None
+
+
+def _init_worker(model_name, backend, threads):
+    global _worker_model
+    from embeddings import load_embedder
+
+    _worker_model = load_embedder(model_name, backend, threads=threads)
+
+
+def _encode_batch(batch_no, texts):
+    embs = _worker_model.encode(texts, show_progress_bar=False, normalize_embeddings=True)
+    return batch_no, embs.astype("float32", copy=False)  # an ndarray pickles as one buffer
+
+# ──────────────────────────────
+# Pipelined bulk indexer
+# ──────────────────────────────
+def bulk_index(messages, write, model_name, metadata_fn, backend=None,
+               workers=None, batch_size=None, queue_size=None):
+    """
+    Embed `messages` across a pool of encoder processes and stream the
+    vectors into `write` (e.g. `collection.upsert`) from a writer thread.
+      1️⃣ Sort by text length so each batch pads to a similar size.
+      2️⃣ Shard batches across `workers` processes (spawned, one model each).
+      3️⃣ Overlap encoding with insertion through a bounded queue.
+    Returns throughput stats so workers / batch size can be tuned.
+    """
+    workers = workers or max(INDEX_WORKERS, 1)
+    batch_size = batch_size or INDEX_BATCH_SIZE
+    queue_size = queue_size or WRITE_QUEUE_SIZE
+
+    ordered = sorted(messages, key=lambda m: len(m["message"]))
+    batches = [ordered[i:i + batch_size] for i in range(0, len(ordered), batch_size)]
+    threads_per_worker = max((os.cpu_count() or 1) // workers, 1)
+
+    log.info(f"⚙️ Bulk indexing {len(ordered)} messages: {workers} workers × "
+             f"{threads_per_worker} threads, batch size {batch_size}.")
+
+    pending = queue.Queue(maxsize=queue_size)
+    write_errors = []
+    write_time = [0.0]
+
+    def writer():
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            batch, embeddings = item
+            if write_errors:
+                continue  # drain without writing after a failure
+            t0 = time.perf_counter()
+            try:
+                write(
+                    documents=[m["message"] for m in batch],
+                    embeddings=embeddings,
+                    ids=[m["id"] for m in batch],
+                    metadatas=[metadata_fn(m) for m in batch],
+                )
+            except Exception as e:
+                write_errors.append(e)
+            write_time[0] += time.perf_counter() - t0
+
+    writer_thread = threading.Thread(target=writer, name="index-writer", daemon=True)
+    writer_thread.start()
+
+    start = time.perf_counter()
+    done_docs = 0
+    max_in_flight = workers * 2
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, backend, threads_per_worker),
+        ) as pool:
+            in_flight = set()
+            next_batch = 0
+            while next_batch < len(batches) or in_flight:
+                while next_batch < len(batches) and len(in_flight) < max_in_flight:
+                    texts = [m["message"] for m in batches[next_batch]]
+                    in_flight.add(pool.submit(_encode_batch, next_batch, texts))
+                    next_batch += 1
+
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    batch_no, embeddings = fut.result()
+                    pending.put((batches[batch_no], embeddings))  # blocks when the writer lags
+                    done_docs += len(batches[batch_no])
+
+                elapsed = time.perf_counter() - start
+                log.debug(f"  … {done_docs}/{len(ordered)} encoded ({done_docs / elapsed:.1f} docs/s)")
+    finally:
+        pending.put(None)
+        writer_thread.join()
+
+    if write_errors:
+        raise RuntimeError(f"Index write failed: {write_errors[0]}") from write_errors[0]
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "docs": len(ordered),
+        "workers": workers,
+        "batch_size": batch_size,
+        "seconds": round(elapsed, 3),
+        "docs_per_sec": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        "write_seconds": round(write_time[0], 3),
+    }
+    log.info(f"✅ Bulk indexed {stats['docs']} messages in {stats['seconds']}s "
+             f"({stats['docs_per_sec']} docs/s, {stats['write_seconds']}s writing).")
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Cold rebuild of the message index with parallel encoders.")
+    ap.add_argument("--workers", type=int, default=max(INDEX_WORKERS, os.cpu_count() or 1))
+    ap.add_argument("--batch-size", type=int, default=INDEX_BATCH_SIZE)
+    ap.add_argument("--queue-size", type=int, default=WRITE_QUEUE_SIZE)
+    args = ap.parse_args()
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+
+    from utils import load_messages
+    import retriever
+
+    retriever.build_index(
+        load_messages(),
+        batch_size=args.batch_size,
+        workers=args.workers,
+        queue_size=args.queue_size,
+    )
@@ -0,0 +1,98 @@
+import os
+import time
+import contextvars
+from contextlib import contextmanager
+
+import metrics
+
+# ──────────────────────────────
+# Configuration
+# ──────────────────────────────
+# Server default for /ask when the caller sends no `deadline_ms` (0 = no deadline)
+ASK_DEADLINE_MS = int(os.getenv("ASK_DEADLINE_MS", "0"))
+# Time held back for the LLM call when deciding whether an optional stage fits
+LLM_RESERVE_SEC = float(os.getenv("DEADLINE_LLM_RESERVE_MS", "1500")) / 1000
+# Never hand the OpenAI client a timeout shorter than this, even past the deadline
+LLM_MIN_TIMEOUT_SEC = float(os.getenv("DEADLINE_LLM_MIN_TIMEOUT_MS", "500")) / 1000
+# Cost assumed for a stage until `stage_seconds` has observations of it
+DEFAULT_STAGE_COST_SEC = {
+    "query_encode": 0.03,
+    "search_fallback": 0.02,
+    "centroid_expansion": 0.02,
+}
+
+# ──────────────────────────────
+# Per-request deadline
+# ──────────────────────────────
+class Deadline:
+    """
+    Time budget for one request.
+    Optional stages ask `allows(stage)` before running: a stage fits when
+    its average observed cost still leaves LLM_RESERVE_SEC for the answer.
+    Stages that did not fit are listed in `skipped`.
+    """
+
+    def __init__(self, budget_sec):
+        self.budget = budget_sec
+        self.start = time.perf_counter()
+        self.skipped = []
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def remaining(self):
+        return self.budget - self.elapsed()
+
+    def expected_cost(self, stage):
+        observed = metrics.mean("stage_seconds", labels={"stage": stage})
+        return observed if observed is not None else DEFAULT_STAGE_COST_SEC.get(stage, 0.0)
+
+    def allows(self, stage):
+        """True if `stage` fits in the remaining budget; otherwise records it as skipped."""
+        if self.remaining() - self.expected_cost(stage) >= LLM_RESERVE_SEC:
+            return True
+        self.skipped.append(stage)
+        metrics.inc("deadline_skipped_stages", labels={"stage": stage})
+        return False
+
+    def llm_timeout(self):
+        """Seconds the LLM call may take: whatever is left, floored at LLM_MIN_TIMEOUT_SEC."""
+        return max(self.remaining(), LLM_MIN_TIMEOUT_SEC)
+
+    def report(self):
+        return {
+            "deadline_ms": round(self.budget * 1000),
+            "elapsed_ms": round(self.elapsed() * 1000, 1),
+            "exceeded": self.remaining() < 0,
+            "skipped_stages": list(self.skipped),
+        }
+
+
+# Carried like the metric spans: set per request, copied into the retrieval executor
+_current = contextvars.ContextVar("deadline", default=None)
+
+
+def current():
+    """The deadline of the request being served, or None when it has none."""
+    return _current.get()
+
+
+def allows(stage):
+    """`Deadline.allows` for the current request; always True without a deadline."""
+    d = _current.get()
+    return d is None or d.allows(stage)
+
+
+@contextmanager
+def request_deadline(budget_ms=None):
+    """
+    Run the block under a `budget_ms` deadline (ASK_DEADLINE_MS when None).
+    Yields the Deadline, or None when neither sets one.
+    """
+    budget_ms = ASK_DEADLINE_MS if budget_ms is None else budget_ms
+    d = Deadline(budget_ms / 1000) if budget_ms and budget_ms > 0 else None
+    token = _current.set(d)
+    try:
+        yield d
+    finally:
+        _current.reset(token)
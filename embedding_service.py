@@ -0,0 +1,103 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+import metrics
+
+# ──────────────────────────────
+# Configuration
+# ──────────────────────────────
+# Max time the first request in a batch waits for company (0 disables batching).
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "4"))
+EMBED_BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX", "32"))
+
+# ──────────────────────────────
+# Cross-request micro-batcher
+# ──────────────────────────────
+class EmbeddingBatcher:
+    """
+    Collects single-text encode requests from concurrent callers and runs
+    them through `encode_fn` as one batch.
+    A batch is flushed when it reaches `max_batch` texts or when its
+    oldest request has waited `max_wait_ms`, whichever comes first.
+    """
+
+    def __init__(self, encode_fn, max_batch=EMBED_BATCH_MAX, max_wait_ms=EMBED_BATCH_WAIT_MS):
+        self.encode_fn = encode_fn
+        self.max_batch = max(max_batch, 1)
+        self.max_wait = max(max_wait_ms, 0) / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_wait > 0 and self.max_batch > 1
+
+    def submit(self, text):
+        """Queue `text` for encoding; returns a Future resolving to its vector."""
+        fut = Future()
+        if not self.enabled:
+            try:
+                fut.set_result(self.encode_fn([text])[0])
+            except Exception as e:
+                fut.set_exception(e)
+            return fut
+
+        self._ensure_started()
+        self._queue.put((text, fut, time.perf_counter()))
+        return fut
+
+    def encode(self, text):
+        """Blocking convenience wrapper around `submit`."""
+        return self.submit(text).result()
+
+    def encode_many(self, texts):
+        """Encode a caller-assembled batch in one forward pass, bypassing the queue."""
+        texts = list(texts)
+        started = time.perf_counter()
+        vectors = self.encode_fn(texts)
+        metrics.observe("embed_batch_size", len(texts), buckets=metrics.SIZE_BUCKETS)
+        metrics.observe("embed_batch_encode_seconds", time.perf_counter() - started)
+        return vectors
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = batch[0][2] + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch):
+        started = time.perf_counter()
+        for _, _, enqueued in batch:
+            metrics.observe("embed_queue_wait_seconds", started - enqueued)
+        metrics.observe("embed_batch_size", len(batch), buckets=metrics.SIZE_BUCKETS)
+
+        try:
+            vectors = self.encode_fn([text for text, _, _ in batch])
+        except Exception as e:
+            for _, fut, _ in batch:
+                fut.set_exception(e)
+            return
+
+        metrics.observe("embed_batch_encode_seconds", time.perf_counter() - started)
+        for (_, fut, _), vec in zip(batch, vectors):
+            fut.set_result(vec)
@@ -0,0 +1,162 @@
+import os
+import time
+import logging
+import importlib.util
+import numpy as np
+
+log = logging.getLogger("aurora.embeddings")
+
+# ──────────────────────────────
+# Configuration
+# ──────────────────────────────
+# "torch" (PyTorch fp32), "onnx" (ONNX Runtime fp32) or "onnx-int8"
+# (ONNX Runtime, dynamically int8-quantized weights).
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch").lower()
+# Device for the torch backend, e.g. "cpu" or "cuda" (empty = automatic: a GPU when present).
+# The ONNX backends always run on the CPU execution provider.
+EMBED_DEVICE = os.getenv("EMBED_DEVICE", "") or None
+# Intra-op threads for the encoder (0 = library default)
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", "0"))
+# Target for dynamic quantization: "avx512_vnni", "avx512", "avx2" or "arm64"
+ONNX_QUANT_CONFIG = os.getenv("ONNX_QUANT_CONFIG", "avx512_vnni")
+ONNX_CACHE_DIR = os.getenv("ONNX_CACHE_DIR", "onnx_models")
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+# Optional packages the ONNX backends need on top of requirements.txt
+ONNX_REQUIREMENTS = ("optimum", "onnxruntime")
+
+
+def check_backend(backend=None):
+    """
+    Fail fast, with an install hint, when `backend` is unknown or its
+    optional dependencies are missing (instead of an ImportError at first encode).
+    """
+    backend = (backend or EMBED_BACKEND).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown EMBED_BACKEND '{backend}' (expected one of {BACKENDS}).")
+    if backend == "torch":
+        return backend
+    missing = [mod for mod in ONNX_REQUIREMENTS if importlib.util.find_spec(mod) is None]
+    if missing:
+        raise RuntimeError(
+            f"EMBED_BACKEND={backend} needs the optional ONNX extra (missing: {', '.join(missing)}): "
+            f"pip install \"optimum[onnxruntime]\" (or set EMBED_BACKEND=torch)."
+        )
+    return backend
+
+# ──────────────────────────────
+# Embedder factory
+# ──────────────────────────────
+def load_embedder(model_name, backend=None, threads=None, device=None):
+    """
+    Return a SentenceTransformer for `model_name` running on `backend`
+    (torch on `device`, default EMBED_DEVICE).
+    Every backend exposes the same `encode()` API, so callers never branch.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    backend = check_backend(backend)
+    threads = EMBED_THREADS if threads is None else threads
+
+    if backend == "torch":
+        if threads:
+            import torch
+
+            torch.set_num_threads(threads)
+        return SentenceTransformer(model_name, device=device or EMBED_DEVICE)
+
+    model_kwargs = {"provider": "CPUExecutionProvider"}
+    if threads:
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        model_kwargs["session_options"] = options
+
+    if backend == "onnx":
+        return SentenceTransformer(model_name, backend="onnx", device="cpu", model_kwargs=model_kwargs)
+
+    # onnx-int8: quantize once into a local copy of the model, then reuse it
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    local_dir = os.path.join(ONNX_CACHE_DIR, model_name.replace("/", "__"))
+    quant_file = f"onnx/model_qint8_{ONNX_QUANT_CONFIG}.onnx"
+    if not os.path.exists(os.path.join(local_dir, quant_file)):
+        log.info(f"⚙️ Exporting int8 ONNX model ({ONNX_QUANT_CONFIG}) to {local_dir}…")
+        base = SentenceTransformer(model_name, backend="onnx", device="cpu")
+        base.save_pretrained(local_dir)
+        export_dynamic_quantized_onnx_model(base, ONNX_QUANT_CONFIG, local_dir)
+
+    return SentenceTransformer(
+        local_dir, backend="onnx", device="cpu",
+        model_kwargs={**model_kwargs, "file_name": quant_file},
+    )
+
+# ──────────────────────────────
+# Parity check vs. fp32 PyTorch
+# ──────────────────────────────
+def _throughput(model, texts, batch_size):
+    t0 = time.perf_counter()
+    embs = model.encode(texts, batch_size=batch_size, show_progress_bar=False, normalize_embeddings=True)
+    return np.asarray(embs, dtype=np.float32), time.perf_counter() - t0
+
+
+def parity_check(texts, model_name, backend, k=10, n_queries=200, batch_size=64):
+    """
+    Compare `backend` against the fp32 PyTorch model on `texts`.
+      • cosine agreement — per-text cosine between the two vectors
+      • recall@k — overlap of each query's top-k neighbours
+      • speedup — encode throughput ratio
+    """
+    reference = load_embedder(model_name, "torch")
+    candidate = load_embedder(model_name, backend)
+
+    ref_embs, ref_sec = _throughput(reference, texts, batch_size)
+    cand_embs, cand_sec = _throughput(candidate, texts, batch_size)
+
+    agreement = np.sum(ref_embs * cand_embs, axis=1)
+
+    rng = np.random.default_rng(0)
+    query_rows = rng.choice(len(texts), size=min(n_queries, len(texts)), replace=False)
+    k = min(k, len(texts) - 1)
+    recalls = []
+    for row in query_rows:
+        ref_top = set(np.argsort(-(ref_embs @ ref_embs[row]))[1:k + 1])
+        cand_top = set(np.argsort(-(cand_embs @ cand_embs[row]))[1:k + 1])
+        recalls.append(len(ref_top & cand_top) / k)
+
+    report = {
+        "backend": backend,
+        "texts": len(texts),
+        "cosine_mean": round(float(agreement.mean()), 5),
+        "cosine_min": round(float(agreement.min()), 5),
+        f"recall@{k}": round(float(np.mean(recalls)), 4),
+        "torch_docs_per_sec": round(len(texts) / ref_sec, 1),
+        f"{backend}_docs_per_sec": round(len(texts) / cand_sec, 1),
+        "speedup": round(ref_sec / cand_sec, 2),
+    }
+    return report
+
+
+if __name__ == "__main__":
+    import json
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Parity check of an embedding backend against fp32 PyTorch.")
+    ap.add_argument("--backend", default="onnx-int8", choices=BACKENDS)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--limit", type=int, default=0, help="only use the first N messages")
+    args = ap.parse_args()
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+
+    from utils import load_messages
+    from retriever import EMBED_MODEL
+
+    texts = [m["message"] for m in load_messages()]
+    if args.limit:
+        texts = texts[: args.limit]
+    print(json.dumps(parity_check(texts, EMBED_MODEL, args.backend, k=args.k, n_queries=args.queries), indent=2))
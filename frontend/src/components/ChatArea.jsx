@@ -28,6 +28,8 @@ export default function ChatArea({ messages, isTyping }) {
               >
                 Thinking<span className="animate-pulse">...</span>
               </motion.span>
+            ) : msg.role === "assistant" && msg.streamed ? (
+              msg.content
             ) : msg.role === "assistant" && !isTyping && idx === messages.length - 1 ? (
               <TypingText text={msg.content} />
             ) : (
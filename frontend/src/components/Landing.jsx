@@ -7,38 +7,49 @@ export default function Landing() {
   const [messages, setMessages] = useState([]);
   const [isTyping, setIsTyping] = useState(false);
 
-  const handleSend = async (question) => {
-    const newMessages = [
+  const handleSend = (question) => {
+    setMessages([
       { role: "user", content: question },
-      { role: "assistant", content: "Thinking..." },
-    ];
-    setMessages(newMessages);
+      { role: "assistant", content: "Thinking...", streamed: true },
+    ]);
     setIsTyping(true);
 
-    try {
-      const res = await fetch(
-        `https://auroraq-aassessment-production.up.railway.app/ask?question=${encodeURIComponent(
-          question
-        )}`
-      );
-      const data = await res.json();
-      const answer = data.answer || "No answer found.";
-
+    const showAssistant = (content) =>
       setMessages([
         { role: "user", content: question },
-        { role: "assistant", content: answer },
+        { role: "assistant", content, streamed: true },
       ]);
-    } catch (err) {
-      setMessages([
-        { role: "user", content: question },
-        {
-          role: "assistant",
-          content: "Error fetching answer. Please try again.",
-        },
-      ]);
-    } finally {
+
+    // Answer tokens arrive over server-sent events as the LLM produces them
+    const source = new EventSource(
+      `https://auroraq-aassessment-production.up.railway.app/ask/stream?question=${encodeURIComponent(
+        question
+      )}`
+    );
+    let answer = "";
+
+    source.addEventListener("token", (e) => {
+      answer += JSON.parse(e.data).text;
+      setIsTyping(false);
+      showAssistant(answer);
+    });
+
+    source.addEventListener("done", (e) => {
+      const data = JSON.parse(e.data);
+      source.close();
+      setIsTyping(false);
+      showAssistant(data.answer || "No answer found.");
+    });
+
+    const fail = () => {
+      source.close();
       setIsTyping(false);
-    }
+      showAssistant("Error fetching answer. Please try again.");
+    };
+    source.addEventListener("error", () => {
+      // Native connection errors have no payload; only fail if nothing completed
+      if (source.readyState !== EventSource.CLOSED) fail();
+    });
   };
 
   return (
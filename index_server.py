@@ -0,0 +1,236 @@
+import os
+import time
+import logging
+import secrets
+import threading
+from multiprocessing.connection import Listener, Client
+import numpy as np
+
+log = logging.getLogger("aurora.index_server")
+
+# ──────────────────────────────
+# Configuration
+# ──────────────────────────────
+# When set, API workers do not load the model or open Chroma themselves:
+# they send encode / search requests to the index server on this socket.
+INDEX_SERVER_SOCKET = os.getenv("INDEX_SERVER_SOCKET", "")
+# multiprocessing.connection unpickles what clients send, so the key is what
+# stands between the socket and code execution in the server. Without an
+# explicit key the server generates one into `<socket>.key` (mode 0600),
+# where workers running as the same user pick it up.
+INDEX_SERVER_AUTHKEY = os.getenv("INDEX_SERVER_AUTHKEY", "")
+INDEX_SERVER_REFRESH_SEC = float(os.getenv("MESSAGES_REFRESH_SEC", "900"))
+
+
+def is_remote_client():
+    """True in API workers that should delegate to the index server."""
+    return bool(INDEX_SERVER_SOCKET) and os.getenv("INDEX_SERVER_ROLE") != "server"
+
+
+def key_path(socket_path):
+    return f"{socket_path}.key"
+
+
+def load_authkey(socket_path):
+    """INDEX_SERVER_AUTHKEY, else the key the server wrote next to `socket_path`."""
+    if INDEX_SERVER_AUTHKEY:
+        return INDEX_SERVER_AUTHKEY.encode()
+    try:
+        with open(key_path(socket_path), "rb") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        raise RuntimeError(
+            f"No index server key: set INDEX_SERVER_AUTHKEY or start the server so it writes {key_path(socket_path)}."
+        ) from None
+
+
+def _create_authkey(socket_path):
+    """Explicit key if configured, otherwise a fresh random one written owner-only."""
+    if INDEX_SERVER_AUTHKEY:
+        return INDEX_SERVER_AUTHKEY.encode()
+    key = secrets.token_hex(32).encode()
+    path = key_path(socket_path)
+    if os.path.exists(path):
+        os.remove(path)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+
+def _plain(obj):
+    """NumPy arrays → lists so replies pickle small and without NumPy subclasses."""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, dict):
+        return {k: _plain(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_plain(v) for v in obj]
+    return obj
+
+# ──────────────────────────────
+# Client side (used inside each API worker)
+# ──────────────────────────────
+class IndexClient:
+    """One connection per calling thread; reconnects once if the server restarted."""
+
+    def __init__(self, address=None, authkey=None):
+        self.address = address or INDEX_SERVER_SOCKET
+        self.authkey = authkey
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Read per connection: a restarted server writes a new key
+            authkey = self.authkey or load_authkey(self.address)
+            conn = self._local.conn = Client(self.address, family="AF_UNIX", authkey=authkey)
+        return conn
+
+    def call(self, op, **kwargs):
+        for attempt in (1, 2):
+            try:
+                conn = self._conn()
+                conn.send((op, kwargs))
+                status, payload = conn.recv()
+                break
+            except (EOFError, ConnectionError, OSError):
+                self._local.conn = None
+                if attempt == 2:
+                    raise
+        if status == "error":
+            raise RuntimeError(f"Index server error on '{op}': {payload}")
+        return payload
+
+
+class RemoteSearchBackend:
+    """Same `query` / `get` / `count` surface as a Chroma collection."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def query(self, **kwargs):
+        return self.client.call("query", **kwargs)
+
+    def get(self, **kwargs):
+        return self.client.call("get", **kwargs)
+
+    def count(self):
+        return self.client.call("count")
+
+
+class RemoteEncoder:
+    """Drop-in for the local EmbeddingBatcher; batching happens server-side."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def encode(self, text):
+        return np.asarray(self.client.call("encode", texts=[text])[0], dtype=np.float32)
+
+    def encode_many(self, texts):
+        return np.asarray(self.client.call("encode", texts=list(texts)), dtype=np.float32)
+
+# ──────────────────────────────
+# Server side (one process per host)
+# ──────────────────────────────
+def _handle(conn, retriever):
+    """Serve one worker connection until it closes."""
+    ops = {
+        # Single texts go through the shared micro-batcher, so concurrent
+        # requests from different workers share one forward pass; batch
+        # requests (/ask/batch) are already one pass.
+        "encode": lambda texts: (
+            _plain(np.asarray(retriever.query_encoder.encode_many(texts)))
+            if len(texts) > 1
+            else [retriever.query_encoder.encode(texts[0]).tolist()]
+        ),
+        "query": lambda **kw: _plain(retriever.search_backend().query(**kw)),
+        "get": lambda **kw: _plain(retriever.search_backend().get(**kw)),
+        "count": lambda: retriever.search_backend().count(),
+        "ping": lambda: "pong",
+    }
+    with conn:
+        while True:
+            try:
+                op, kwargs = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                conn.send(("ok", ops[op](**kwargs)))
+            except Exception as e:
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+def _refresh_loop(retriever, utils, profiles):
+    while True:
+        time.sleep(INDEX_SERVER_REFRESH_SEC)
+        try:
+            store, changed = utils.sync_messages()
+            if changed:
+                summary = retriever.sync_index(store)
+                store = retriever.colocate_embeddings(
+                    store, force=True, previous=retriever.current_message_store(), changed_ids=summary["changed_ids"]
+                )
+                retriever.use_message_store(store)
+                profiles.sync(store)
+        except Exception as e:
+            log.warning(f"⚠️ Index server refresh failed: {e}")
+
+
+def serve(socket_path):
+    """
+    Own the model, the vector index and every index write for this host,
+    and answer encode / search requests from API workers over `socket_path`.
+    """
+    os.environ["INDEX_SERVER_ROLE"] = "server"  # this process owns the model/index
+    import retriever
+    import utils
+    from profiles import ProfileStore
+
+    if not retriever.try_acquire_writer_lock():
+        raise SystemExit("❌ Another process already owns the index writer lock.")
+
+    store = utils.load_messages()
+    retriever.sync_index(store)
+    store = retriever.colocate_embeddings(store)
+    retriever.use_message_store(store)
+    retriever.warmup()
+    # API workers only read profiles, so this process (the writer) keeps them current
+    profiles = ProfileStore()
+    profiles.sync(store)
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    authkey = _create_authkey(socket_path)
+    old_umask = os.umask(0o177)  # the socket file is created owner-only (0600)
+    try:
+        listener = Listener(socket_path, family="AF_UNIX", authkey=authkey)
+    finally:
+        os.umask(old_umask)
+    os.chmod(socket_path, 0o600)
+    log.info(f"🛰️ Index server listening on {socket_path}")
+
+    if INDEX_SERVER_REFRESH_SEC > 0:
+        threading.Thread(target=_refresh_loop, args=(retriever, utils, profiles), daemon=True).start()
+
+    while True:
+        try:
+            conn = listener.accept()
+        except Exception as e:  # bad authkey etc. — keep serving others
+            log.warning(f"⚠️ Rejected index client: {e}")
+            continue
+        threading.Thread(target=_handle, args=(conn, retriever), daemon=True).start()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Shared embedding / search server for multi-worker deployments.")
+    ap.add_argument("--socket", default=INDEX_SERVER_SOCKET or "/tmp/aurora-index.sock")
+    args = ap.parse_args()
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+    serve(args.socket)
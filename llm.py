@@ -1,19 +1,73 @@
 import os
-from openai import OpenAI
+import time
+import httpx
+import logging
+from openai import OpenAI, AsyncOpenAI
 from dotenv import load_dotenv
 from datetime import datetime
+from rapidfuzz import fuzz
+from time_window import to_epoch
+import metrics
 
 # ──────────────────────────────
 # Setup
 # ──────────────────────────────
 load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
+log = logging.getLogger("aurora.llm")
 
-if not api_key:
-    raise ValueError("❌ OPENAI_API_KEY not found. Please set it in your .env file.")
-
-client = OpenAI(api_key=api_key)
 DEFAULT_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+OPENAI_TIMEOUT_SEC = float(os.getenv("OPENAI_TIMEOUT_SEC", "30"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "200"))
+
+# Clients are created on first use so importing this module never
+# requires an API key (notebooks, tests, tooling).
+_client = None
+_async_client = None
+
+
+def _api_key():
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("❌ OPENAI_API_KEY not found. Please set it in your .env file.")
+    return api_key
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = OpenAI(api_key=_api_key(), timeout=OPENAI_TIMEOUT_SEC)
+    return _client
+
+
+def get_async_client():
+    """Async client for the /ask path: one pooled connection set shared by all requests."""
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncOpenAI(
+            api_key=_api_key(),
+            timeout=httpx.Timeout(OPENAI_TIMEOUT_SEC, connect=5.0),
+            max_retries=2,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_CONNECTIONS // 4 or 1,
+                ),
+            ),
+        )
+    return _async_client
+
+
+async def close_clients():
+    """Release pooled connections on shutdown."""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+
+RATIO_BUCKETS = (0.0, 0.25, 0.5, 0.75, 0.9, 1.0)
+
+FALLBACK_ANSWER = "I don’t have any information about the question you asked."
+ERROR_ANSWER = "Sorry, something went wrong while generating the answer."
 
 # ──────────────────────────────
 # Helper: format timestamps
@@ -29,43 +83,253 @@ def format_timestamp(ts):
             return ts
     return ts.strftime("%Y-%m-%d %H:%M")
 
+# ──────────────────────────────
+# Token counting
+# ──────────────────────────────
+# Context token budget per prompt (≈ the old 3500-char cap)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "900"))
+# token_sort_ratio at/above which two messages count as near-duplicates
+NEAR_DUP_THRESHOLD = int(os.getenv("CONTEXT_NEAR_DUP_THRESHOLD", "92"))
+
+_encoding = None
+# After a failed vocabulary load (e.g. no network), when to try again
+_encoding_retry_at = 0.0
+ENCODING_RETRY_SEC = 300
+
+
+def _load_encoding():
+    """The tiktoken encoding, False if tiktoken is not installed, None while it cannot be loaded."""
+    global _encoding, _encoding_retry_at
+    if _encoding is not None or time.monotonic() < _encoding_retry_at:
+        return _encoding
+    try:
+        import tiktoken
+    except ImportError:
+        log.info("ℹ️ tiktoken is not installed — estimating tokens as chars/4.")
+        _encoding = False
+        return _encoding
+    try:
+        try:
+            _encoding = tiktoken.encoding_for_model(DEFAULT_MODEL)
+        except KeyError:
+            _encoding = tiktoken.get_encoding("o200k_base")
+    except Exception as e:  # the vocabulary is downloaded on first use
+        _encoding_retry_at = time.monotonic() + ENCODING_RETRY_SEC
+        log.warning(f"⚠️ Could not load the tiktoken vocabulary ({e}) — estimating tokens as chars/4, "
+                    f"retrying in {ENCODING_RETRY_SEC}s.")
+    return _encoding
+
+
+def count_tokens(text):
+    """Tokens for DEFAULT_MODEL via tiktoken; ~4 chars/token while it is unavailable."""
+    encoding = _load_encoding()
+    if not encoding:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text))
+
 # ──────────────────────────────
 # Context builder
 # ──────────────────────────────
-def build_context(context_messages, max_chars=3500):
+def _chronological_key(msg):
+    if msg.get("ts_epoch") is not None:
+        return msg["ts_epoch"]
+    return to_epoch(msg.get("timestamp"))
+
+
+def pack_context(context_messages, max_tokens=None):
+    """
+    Fill a token budget with whole messages, most relevant first.
+      1️⃣ Rank by retrieval score (-reciprocal rank, see `rank_results` — lower is better).
+      2️⃣ Skip messages that near-duplicate one already packed.
+      3️⃣ Add whole messages while they fit in `max_tokens`.
+      4️⃣ Emit the packed set oldest → newest.
+    Returns `(context_text, stats)`.
+    """
+    max_tokens = max_tokens or CONTEXT_TOKEN_BUDGET
+    ranked = sorted(context_messages, key=lambda m: m.get("score") if m.get("score") is not None else 0.0)
+
+    packed, packed_texts = [], []
+    used = dup = over = 0
+    for msg in ranked:
+        text = (msg.get("text") or "").strip()
+        if not text:
+            continue
+        norm = " ".join(text.lower().split())
+        if any(fuzz.token_sort_ratio(norm, other) >= NEAR_DUP_THRESHOLD for other in packed_texts):
+            dup += 1
+            continue
+
+        entry = f"[{format_timestamp(msg.get('timestamp'))}] {msg.get('user_name', 'Unknown')}: {text}"
+        tokens = count_tokens(entry) + 1  # + newline
+        if used + tokens > max_tokens:
+            over += 1
+            continue
+
+        packed.append((msg, entry))
+        packed_texts.append(norm)
+        used += tokens
+
+    # ensure chronological (oldest → newest)
+    packed.sort(key=lambda pair: _chronological_key(pair[0]))
+    context_text = "\n".join(entry for _, entry in packed)
+
+    stats = {
+        "budget_tokens": max_tokens,
+        "context_tokens": used,
+        "candidates": len(context_messages),
+        "packed": len(packed),
+        "dropped_duplicates": dup,
+        "dropped_over_budget": over,
+    }
+    return context_text, stats
+
+
+def build_context(context_messages, max_tokens=None):
     """
     Build readable message context.
     Keeps latest messages last (chronological order).
     """
-    # ensure chronological (oldest → newest)
-    sorted_msgs = sorted(
-        context_messages,
-        key=lambda m: m.get("timestamp") or datetime.min
+    return pack_context(context_messages, max_tokens)[0]
+
+# ──────────────────────────────
+# Prompt assembly
+# ──────────────────────────────
+# Everything before the per-request user turn is fixed and byte-identical on
+# every call, so the provider's automatic prefix cache can reuse it.
+SYSTEM_PROMPT = (
+    "You are a precise and factual AI assistant analyzing member messages.\n\n"
+    "You will be provided with time-stamped conversation snippets (context) and a question.\n"
+    "Use them to infer an answer according to the following exact hierarchy:\n\n"
+    "1️⃣ If the answer is explicitly stated in the context, give a short, confident factual answer.\n"
+    "2️⃣ If you can reasonably infer or approximate from the context but it’s not directly stated, "
+    "begin your response with: 'I don’t have the exact information for this, but based on the available context, ...'\n"
+    "   → Then clearly explain your reasoning.\n"
+    "3️⃣ If no relevant context exists, respond exactly with: "
+    "'I don’t have any information about the question you asked.'\n\n"
+    "Additional requirements:\n"
+    "- Never hallucinate or assume details that are not implied.\n"
+    "- Keep answers under 80 words unless absolutely necessary.\n"
+    "- Do not repeat or quote the messages directly; summarize concisely.\n"
+    "- If the information is uncertain, be transparent about it.\n\n"
+    "Each request lists the context messages oldest → newest, then the question. "
+    "When messages conflict, prefer the most recent one."
+)
+
+# Fictional members and places only, so no example can pass for a fact about a real member
+FEW_SHOT_EXAMPLES = (
+    (
+        "[2024-03-02 09:15] Jordan Example: Please book a table for four at The Gilded Fork this Friday at 8pm.\n"
+        "[2024-03-05 18:40] Jordan Example: Change the Gilded Fork booking to six people, my cousins are joining.",
+        "How many people is Jordan's Gilded Fork reservation for?",
+        "Jordan's reservation at The Gilded Fork is for six people — it was increased from four.",
+    ),
+    (
+        "[2024-01-10 11:02] Casey Placeholder: I'll need a car at Northport Airport when I land on the 14th.\n"
+        "[2024-01-12 16:30] Casey Placeholder: Also reserve my usual suite at Hotel Meridian for three nights.",
+        "Where is Casey staying in Northport?",
+        "I don’t have the exact information for this, but based on the available context, "
+        "Casey is most likely staying at Hotel Meridian — they asked for their usual suite there for three nights "
+        "around their arrival at Northport Airport on the 14th.",
+    ),
+    (
+        "[2024-02-20 14:05] Riley Sample: Can you get me tickets to the Harbor City game next Tuesday?",
+        "What is Riley's favorite restaurant?",
+        FALLBACK_ANSWER,
+    ),
+)
+
+
+def _user_turn(context_text, question):
+    return (
+        f"Context messages (oldest → newest):\n\n"
+        f"{context_text}\n\n"
+        f"User Question:\n{question}\n\n"
+        f"Answer:"
     )
 
-    seen = set()
-    formatted = []
-    for msg in sorted_msgs:
-        text = msg.get("text", "").strip()
-        user = msg.get("user_name", "Unknown")
-        ts = format_timestamp(msg.get("timestamp"))
-        entry = f"[{ts}] {user}: {text}"
-        if text and entry not in seen:
-            formatted.append(entry)
-            seen.add(entry)
 
-    context_text = "\n".join(formatted)
+PROMPT_PREFIX = (
+    {"role": "system", "content": SYSTEM_PROMPT},
+    *(
+        message
+        for context_text, question, answer in FEW_SHOT_EXAMPLES
+        for message in (
+            {"role": "user", "content": _user_turn(context_text, question)},
+            {"role": "assistant", "content": answer},
+        )
+    ),
+)
+
+# OpenAI only caches prompt prefixes of 1024+ tokens
+PROMPT_CACHE_MIN_TOKENS = 1024
+
 
-    if len(context_text) > max_chars:
-        print("⚠️ Trimming long context for token safety.")
-        context_text = context_text[-max_chars:]  # keep most recent part
+def prompt_prefix_tokens():
+    """Tokens in the static PROMPT_PREFIX (+4 framing per message); logged at startup, never at import."""
+    tokens = sum(count_tokens(m["content"]) + 4 for m in PROMPT_PREFIX)
+    metrics.set_gauge("llm_prompt_prefix_tokens", tokens)
+    if tokens < PROMPT_CACHE_MIN_TOKENS:
+        log.info(f"ℹ️ Static prompt prefix is {tokens} tokens, below the {PROMPT_CACHE_MIN_TOKENS} "
+                 "needed for provider prompt caching.")
+    return tokens
+
+
+def build_messages(question, context_messages, stats=None):
+    """
+    Chat messages for a question: the static PROMPT_PREFIX (instructions +
+    few-shot examples) followed by one user turn with the packed context.
+    Packing stats are written into `stats` when a dict is passed.
+    """
+    # Build compact context
+    context_text, packing = pack_context(context_messages)
+    if stats is not None:
+        stats.update(packing)
 
-    return context_text
+    return [*PROMPT_PREFIX, {"role": "user", "content": _user_turn(context_text, question)}]
+
+
+def normalize_answer(answer):
+    """Collapse every variant of the 'no information' reply to one canonical string."""
+    answer = (answer or "").strip()
+
+    # Normalize fallbacks for safety
+    lower = answer.lower()
+    if "i don’t have any information" in lower:
+        return FALLBACK_ANSWER
+    if "i don't have any information" in lower:
+        return FALLBACK_ANSWER
+
+    if not answer:
+        return FALLBACK_ANSWER
+
+    return answer
 
 # ──────────────────────────────
 # Generate contextual answer
 # ──────────────────────────────
-def generate_answer(question, context_messages):
+def _record_usage(stats, usage):
+    """Record token usage, including prompt tokens served from the provider's prefix cache."""
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = (getattr(details, "cached_tokens", None) or 0) if details else 0
+
+    metrics.inc("llm_requests")
+    metrics.inc("llm_prompt_tokens", usage.prompt_tokens)
+    metrics.inc("llm_cached_prompt_tokens", cached)
+    metrics.inc("llm_completion_tokens", usage.completion_tokens)
+    if cached:
+        metrics.inc("llm_prompt_cache_hits")
+    if usage.prompt_tokens:
+        metrics.observe("llm_cached_prompt_ratio", cached / usage.prompt_tokens, buckets=RATIO_BUCKETS)
+
+    if stats is not None:
+        stats["prompt_tokens"] = usage.prompt_tokens
+        stats["cached_prompt_tokens"] = cached
+        stats["completion_tokens"] = usage.completion_tokens
+
+
+def generate_answer(question, context_messages, stats=None):
     """
     Produces a grounded answer using tiered logic:
       1️⃣ Direct fact if clearly found.
@@ -74,63 +338,65 @@ def generate_answer(question, context_messages):
     """
     # No context at all → immediate fallback
     if not context_messages:
-        return "I don’t have any information about the question you asked."
-
-    # Build compact context
-    context_text = build_context(context_messages)
-
-    # Stronger, explicit reasoning instructions
-    system_prompt = (
-        "You are a precise and factual AI assistant analyzing member messages.\n\n"
-        "You will be provided with time-stamped conversation snippets (context) and a question.\n"
-        "Use them to infer an answer according to the following exact hierarchy:\n\n"
-        "1️⃣ If the answer is explicitly stated in the context, give a short, confident factual answer.\n"
-        "2️⃣ If you can reasonably infer or approximate from the context but it’s not directly stated, "
-        "begin your response with: 'I don’t have the exact information for this, but based on the available context, ...'\n"
-        "   → Then clearly explain your reasoning.\n"
-        "3️⃣ If no relevant context exists, respond exactly with: "
-        "'I don’t have any information about the question you asked.'\n\n"
-        "Additional requirements:\n"
-        "- Never hallucinate or assume details that are not implied.\n"
-        "- Keep answers under 80 words unless absolutely necessary.\n"
-        "- Do not repeat or quote the messages directly; summarize concisely."
-    )
-
-    # Build user message
-    user_prompt = (
-        f"Here are the context messages (newest → oldest):\n\n"
-        f"{context_text}\n\n"
-        f"User Question:\n{question}\n\n"
-        f"Now answer strictly following the hierarchy above.\n"
-        f"If the information is uncertain, be transparent about it.\n\n"
-        f"Answer:"
-    )
+        return FALLBACK_ANSWER
 
     try:
-        response = client.chat.completions.create(
+        response = get_client().chat.completions.create(
             model=DEFAULT_MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
+            messages=build_messages(question, context_messages, stats),
             temperature=0.2,
             max_tokens=350,
         )
+        _record_usage(stats, response.usage)
+        return normalize_answer(response.choices[0].message.content)
 
-        answer = response.choices[0].message.content.strip()
+    except Exception as e:
+        log.error("❌ OpenAI API error: %s", e)
+        return ERROR_ANSWER
 
-        # Normalize fallbacks for safety
-        lower = answer.lower()
-        if "i don’t have any information" in lower:
-            return "I don’t have any information about the question you asked."
-        if "i don't have any information" in lower:
-            return "I don’t have any information about the question you asked."
 
-        if not answer:
-            return "I don’t have any information about the question you asked."
+async def generate_answer_async(question, context_messages, stats=None, timeout=None):
+    """
+    Non-blocking `generate_answer` over the pooled async client.
+    `timeout` (seconds, e.g. what is left of a request deadline) replaces
+    OPENAI_TIMEOUT_SEC and disables retries, which could not finish in time.
+    """
+    if not context_messages:
+        return FALLBACK_ANSWER
 
-        return answer
+    client = get_async_client()
+    if timeout is not None:
+        client = client.with_options(timeout=timeout, max_retries=0)
+    try:
+        response = await client.chat.completions.create(
+            model=DEFAULT_MODEL,
+            messages=build_messages(question, context_messages, stats),
+            temperature=0.2,
+            max_tokens=350,
+        )
+        _record_usage(stats, response.usage)
+        return normalize_answer(response.choices[0].message.content)
 
     except Exception as e:
-        print("❌ OpenAI API error:", str(e))
-        return "Sorry, something went wrong while generating the answer."
\ No newline at end of file
+        log.error("❌ OpenAI API error: %s", e)
+        return ERROR_ANSWER
+
+
+async def stream_answer(question, context_messages, stats=None):
+    """
+    Yield answer tokens as the completion streams in.
+    Callers should run `normalize_answer` on the joined text once done.
+    """
+    stream = await get_async_client().chat.completions.create(
+        model=DEFAULT_MODEL,
+        messages=build_messages(question, context_messages, stats),
+        temperature=0.2,
+        max_tokens=350,
+        stream=True,
+        stream_options={"include_usage": True},  # usage arrives on the final chunk
+    )
+    async for chunk in stream:
+        if getattr(chunk, "usage", None):
+            _record_usage(stats, chunk.usage)
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
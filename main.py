@@ -1,16 +1,68 @@
 from fastapi import FastAPI, Query, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from utils import load_messages
-from retriever import build_index, detect_user_name, retrieve_relevant_messages
-from llm import generate_answer
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from contextlib import asynccontextmanager
+from pydantic import BaseModel
+from typing import List, Optional
+from utils import load_messages, sync_messages, STORE_PATH
+from message_store import MessageStore
+from embeddings import check_backend
+from index_server import is_remote_client
+from retriever import (
+    sync_index, build_name_index, detect_user_name, retrieve_relevant_messages, warmup,
+    retrieve_relevant_messages_batch,
+    colocate_embeddings, use_message_store, use_shared_vectors, try_acquire_writer_lock,
+)
+from llm import generate_answer_async, stream_answer, normalize_answer, close_clients, prompt_prefix_tokens, ERROR_ANSWER
+from answer_cache import AnswerCache, normalize_question
+from singleflight import SingleFlight
+from profiles import ProfileStore, PROFILE_FAST_PATH
+import metrics
+import deadline
 import os
+import json
+import asyncio
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import time  # 🕒 for performance timing
 
+PROCESS_START = time.perf_counter()
+
+# Per-request lines (received question, detected user, retrieved messages)
+# log at DEBUG; stage timings go to /metrics instead of stdout.
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+log = logging.getLogger("aurora.main")
+
+# ──────────────────────────────
+# Lifespan (startup / shutdown)
+# ──────────────────────────────
+@asynccontextmanager
+async def lifespan(app):
+    """
+    Start initialization in the background so the port binds immediately;
+    /health answers right away and /ready flips once `initialize` finishes.
+    """
+    log.info("🚀 Starting Aurora Q&A backend...")
+    asyncio.get_running_loop().run_in_executor(None, initialize)
+    refresher = asyncio.create_task(refresh_loop()) if REFRESH_INTERVAL_SEC > 0 else None
+    yield
+    if refresher:
+        refresher.cancel()
+    await close_clients()
+    answer_cache.close()
+    retrieval_executor.shutdown(wait=False)
+
+
 app = FastAPI(
     title="Aurora Member Q&A API",
     description="A high-accuracy RAG API that answers questions about members using their message history.",
-    version="2.1.0"
+    version="2.1.0",
+    lifespan=lifespan,
 )
 
 # ──────────────────────────────
@@ -18,6 +70,28 @@ app = FastAPI(
 # ──────────────────────────────
 messages = []
 user_names = []
+startup_state = {"status": "starting", "role": None, "error": None, "timings": {}}
+
+# Background pull of new messages into the live process (0 disables)
+REFRESH_INTERVAL_SEC = float(os.getenv("MESSAGES_REFRESH_SEC", "900"))
+
+# Encoding + search are CPU-bound; they get their own small pool so the
+# event loop (and the LLM awaits it multiplexes) never blocks on them.
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", str(min(8, os.cpu_count() or 1))))
+retrieval_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+
+# Exact + semantic cache in front of the LLM call
+answer_cache = AnswerCache()
+
+# Concurrent identical questions share one retrieval + LLM run
+inflight_questions = SingleFlight("ask")
+
+# Per-member fact profiles (trips, restaurants, cars, preferences) for the /ask fast path
+member_profiles = ProfileStore()
+
+# POST /ask/batch: max questions per request, and LLM calls in flight per batch
+ASK_BATCH_MAX = int(os.getenv("ASK_BATCH_MAX", "500"))
+ASK_BATCH_LLM_CONCURRENCY = int(os.getenv("ASK_BATCH_LLM_CONCURRENCY", "8"))
 
 # ──────────────────────────────
 # CORS setup
@@ -31,120 +105,546 @@ app.add_middleware(
 )
 
 # ──────────────────────────────
-# Startup event
+# Startup
 # ──────────────────────────────
-@app.on_event("startup")
-def startup_event():
-    """Load cached messages and build embeddings (only if missing or outdated)."""
+def open_shared_store(timeout=600):
+    """Readers wait for the writer process to publish the message store, then map it."""
+    give_up_at = time.monotonic() + timeout
+    while True:
+        try:
+            return MessageStore(STORE_PATH)
+        except (FileNotFoundError, ValueError, json.JSONDecodeError):
+            if time.monotonic() > give_up_at:
+                raise RuntimeError("Timed out waiting for the index writer to publish messages.")
+            time.sleep(2)
+
+
+def initialize():
+    """
+    Load cached messages, sync embeddings (only new or changed messages are embedded) and warm up.
+    With several workers only the one holding the index writer lock syncs;
+    the others (and every worker in index-server mode) map the shared store read-only.
+    """
     global messages, user_names
-    print("🚀 Starting Aurora Q&A backend...")
+    timings = startup_state["timings"]
 
     try:
-        messages = load_messages()
-        user_names = list({m["user_name"] for m in messages})
-        print(f"📋 Loaded {len(messages)} messages from {len(user_names)} members.")
+        if not is_remote_client():
+            check_backend()  # a missing optional dependency fails startup, not the first encode
+        is_writer = try_acquire_writer_lock()
+        startup_state["role"] = "writer" if is_writer else "reader"
+        if not is_writer and not is_remote_client():
+            use_shared_vectors()  # never a private Chroma snapshot of an index the writer is changing
+
+        t0 = time.perf_counter()
+        messages = load_messages() if is_writer else open_shared_store()
+        user_names = messages.user_names()  # from the store's per-member offsets table
+        log.info(f"📋 Loaded {len(messages)} messages from {len(user_names)} members ({startup_state['role']}).")
+        build_name_index(user_names)
+        timings["load_messages"] = round(time.perf_counter() - t0, 3)
 
-        chroma_path = "chroma_store"
-        has_index = os.path.exists(chroma_path) and any(os.scandir(chroma_path))
+        # Embeds only new/changed messages; full rebuild on first run or model change
+        t1 = time.perf_counter()
+        if is_writer:
+            summary = sync_index(messages)
+            answer_cache.invalidate_users(summary["changed_users"])
+            index_changed = summary["rebuilt"] or summary["upserted"] or summary["deleted"]
+            messages = colocate_embeddings(messages, force=bool(index_changed))
+        use_message_store(messages)
+        timings["sync_index"] = round(time.perf_counter() - t1, 3)
 
-        if not has_index:
-            print("🧠 No existing embeddings found — building index...")
-            build_index(messages)
+        # Writer re-extracts members whose messages changed; readers load its file
+        t2 = time.perf_counter()
+        if is_writer:
+            member_profiles.sync(messages)
         else:
-            print("💾 Found existing Chroma index — skipping rebuild.")
+            member_profiles.reload()
+        timings["profiles"] = round(time.perf_counter() - t2, 3)
+
+        # Dummy encode + query so the first real request is not a cold one
+        timings["warmup"] = warmup()
+        prompt_prefix_tokens()  # loads the token vocabulary here rather than on the first request
 
-        print("✅ Aurora Q&A API ready at /ask")
+        startup_seconds = round(time.perf_counter() - PROCESS_START, 3)
+        timings["total"] = startup_seconds
+        metrics.set_gauge("startup_seconds", startup_seconds)
+        startup_state["status"] = "ready"
+        log.info(f"✅ Aurora Q&A API ready at /ask (startup {startup_seconds:.2f}s)")
 
     except Exception as e:
-        print(f"❌ Startup failed: {e}")
-        raise
+        startup_state["status"] = "failed"
+        startup_state["error"] = str(e)
+        log.exception(f"❌ Startup failed: {e}")
+
+
+# ──────────────────────────────
+# Background refresh
+# ──────────────────────────────
+def refresh_messages():
+    """
+    Writer: sync new messages from the API and swap them into the running process.
+    Reader: pick up whatever the writer last published.
+    """
+    global messages, user_names
+    if startup_state["role"] == "writer":
+        store, changed = sync_messages()
+        if not changed:
+            return False
+
+        summary = sync_index(store)
+        answer_cache.invalidate_users(summary["changed_users"])
+        # Unchanged messages keep the vectors the live store already maps
+        store = colocate_embeddings(store, force=True, previous=messages, changed_ids=summary["changed_ids"])
+        member_profiles.sync(store)
+    else:
+        member_profiles.reload()  # the writer may publish profiles after the store
+        store = MessageStore(STORE_PATH)
+        if store.sync_state == messages.sync_state and store.has_embeddings == messages.has_embeddings:
+            return False
+        # Readers do not know which members changed — drop every cached answer
+        answer_cache.invalidate_users(set(user_names) | set(store.user_names()))
+
+    use_message_store(store)
+    names = store.user_names()
+    build_name_index(names)
+
+    # Swap last so requests never see a half-updated view
+    messages, user_names = store, names
+    log.info(f"🔄 Refreshed: {len(messages)} messages from {len(user_names)} members.")
+    return True
+
+
+async def refresh_loop():
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(REFRESH_INTERVAL_SEC)
+        if startup_state["status"] != "ready":
+            continue
+        try:
+            await loop.run_in_executor(None, refresh_messages)
+        except Exception as e:
+            log.warning(f"⚠️ Background refresh failed: {e}")
+
+
+def require_ready():
+    if startup_state["status"] != "ready":
+        raise HTTPException(status_code=503, detail=f"Service is {startup_state['status']}; try again shortly.")
+
+# ──────────────────────────────
+# Response helpers
+# ──────────────────────────────
+def format_context(context):
+    """Serialize retrieved messages (datetime timestamps → ISO strings)."""
+    return [
+        {
+            "user_name": c.get("user_name"),
+            "text": c.get("text"),
+            "timestamp": (
+                c["timestamp"].isoformat()
+                if c.get("timestamp")
+                and not isinstance(c["timestamp"], str)
+                else c.get("timestamp")
+            ),
+        }
+        for c in context
+    ]
+
+
+def retrieve_for(question, user_name):
+    """Retrieve relevant messages (semantic + hybrid logic) → `(context, q_emb)`."""
+    with metrics.span("retrieval"):
+        return retrieve_relevant_messages(question, top_k=5, user_name=user_name, return_embedding=True)
+
+
+def run_profile_or_retrieval(question):
+    """
+    CPU-bound stage (user detection + encode + vector search), run off the event loop.
+    A look-up the detected member's profile answers skips retrieval:
+    returns `(user_name, context, q_emb, profile_hit)`.
+    """
+    with metrics.span("user_detection"):
+        user_name = detect_user_name(question, user_names)
+
+    if PROFILE_FAST_PATH and user_name:
+        with metrics.span("profile_lookup"):
+            hit = member_profiles.answer(question, user_name)
+        if hit:
+            return user_name, None, None, hit
+
+    context, q_emb = retrieve_for(question, user_name)
+    return user_name, context, q_emb, None
+
+
+def profile_context(user_name, profile_hit):
+    """`context_used` for a profile answer: the facts' source messages."""
+    return format_context(
+        [{"user_name": user_name, "text": f["text"], "timestamp": f["timestamp"]} for f in profile_hit["sources"]]
+    )
+
+
+def in_retrieval_pool(fn, *args):
+    """Run `fn` on the retrieval executor, carrying the request's context (metric spans) along."""
+    ctx = contextvars.copy_context()
+    return asyncio.get_running_loop().run_in_executor(retrieval_executor, ctx.run, fn, *args)
+
+
+async def answer_with_cache(question, context, q_emb):
+    """
+    Serve from the answer cache when possible; otherwise call the LLM and store the result.
+    Returns `(answer, cache_tier, prompt_stats)`; prompt_stats is None on a cache hit.
+    """
+    with metrics.span("answer_cache"):
+        answer, tier = answer_cache.get(question, context, q_emb)
+    if answer is not None:
+        log.debug("💾 Answer cache hit (%s).", tier)
+        return answer, tier, None
+
+    prompt_stats = {}
+    budget = deadline.current()
+    with metrics.span("llm"):
+        answer = await generate_answer_async(
+            question, context, stats=prompt_stats, timeout=budget.llm_timeout() if budget else None
+        )
+    if answer != ERROR_ANSWER:
+        answer_cache.put(question, context, answer, q_emb)
+    return answer, None, prompt_stats
 
 # ──────────────────────────────
 # /ask endpoint (with timing)
 # ──────────────────────────────
+async def answer_pipeline(question):
+    """
+    Retrieve context and answer one question (shared by coalesced requests,
+    which are only coalesced when their deadline budgets match).
+    """
+    budget = deadline.current()
+    # Steps 1–2 run on the dedicated retrieval executor
+    user_name, context, q_emb, profile_hit = await in_retrieval_pool(run_profile_or_retrieval, question)
+
+    if profile_hit:
+        log.debug("🗂️ Answered from %s's profile (%s).", user_name, profile_hit["field"])
+        return {
+            "detected_user": user_name,
+            "answer": profile_hit["answer"],
+            "context_used": profile_context(user_name, profile_hit),
+            "cache_hit": None,
+            "prompt_stats": None,
+            "profile_hit": profile_hit["field"],
+            "deadline": budget.report() if budget else None,
+        }
+
+    if not context:
+        log.debug("⚠️ No context found — skipping LLM.")
+        return {
+            "detected_user": user_name,
+            "answer": "I don’t have enough information to answer that.",
+            "context_used": [],
+            "cache_hit": None,
+            "prompt_stats": None,
+            "profile_hit": None,
+            "deadline": budget.report() if budget else None,
+        }
+
+    # Step 3: Generate answer via LLM (awaited — no thread held), unless cached
+    answer, cache_tier, prompt_stats = await answer_with_cache(question, context, q_emb)
+
+    return {
+        "detected_user": user_name,
+        "answer": answer,
+        "context_used": format_context(context),
+        "cache_hit": cache_tier,
+        "prompt_stats": prompt_stats,
+        "profile_hit": None,
+        "deadline": budget.report() if budget else None,
+    }
+
+
+async def timed_pipeline(question):
+    """`answer_pipeline` with its own span collector, so coalesced followers get its stage timings too."""
+    with metrics.collect_spans() as pipeline_spans:
+        result = await answer_pipeline(question)
+    return result, pipeline_spans
+
+
 @app.get("/ask")
-def ask(question: str = Query(..., description="Natural-language question to answer")):
-    """Receives a question and returns an LLM-generated, context-grounded answer."""
+async def ask(
+    question: str = Query(..., description="Natural-language question to answer"),
+    timings: bool = Query(False, description="Include a per-stage timing breakdown"),
+    deadline_ms: Optional[int] = Query(
+        None, ge=0, description="Latency budget; optional stages are skipped to meet it (default ASK_DEADLINE_MS, 0 = none)"
+    ),
+):
+    """
+    Receives a question and returns an LLM-generated, context-grounded answer.
+    Under a deadline, `deadline.skipped_stages` lists the retrieval stages
+    dropped to stay within it.
+    """
     start_total = time.perf_counter()
 
     try:
+        require_ready()
         if not question.strip():
             raise HTTPException(status_code=400, detail="Question cannot be empty.")
 
-        print(f"\n🧩 Received question: {question}")
-        t0 = time.perf_counter()
-
-        # Step 1: Detect which member is being referenced
-        user_name = detect_user_name(question, user_names)
-        t1 = time.perf_counter()
-        print(f"⏱️ User detection took {t1 - t0:.3f}s")
-
-        # Step 2: Retrieve relevant messages (semantic + hybrid logic)
-        context = retrieve_relevant_messages(question, top_k=5, user_name=user_name)
-        t2 = time.perf_counter()
-        print(f"⏱️ Context retrieval took {t2 - t1:.3f}s")
+        log.debug("🧩 Received question: %s", question)
 
-        if not context:
-            print("⚠️ No context found — skipping LLM.")
-            total_time = time.perf_counter() - start_total
-            print(f"⏱️ Total processing time: {total_time:.3f}s\n")
-            return {
-                "question": question,
-                "detected_user": user_name,
-                "answer": "I don’t have enough information to answer that.",
-                "context_used": [],
-                "processing_time_sec": round(total_time, 3)
-            }
-
-        # Step 3: Generate answer via LLM
-        answer = generate_answer(question, context)
-        t3 = time.perf_counter()
-        print(f"⏱️ LLM generation took {t3 - t2:.3f}s")
-
-        # Format timestamps for response
-        formatted_context = [
-            {
-                "user_name": c.get("user_name"),
-                "text": c.get("text"),
-                "timestamp": (
-                    c["timestamp"].isoformat()
-                    if c.get("timestamp")
-                    and not isinstance(c["timestamp"], str)
-                    else c.get("timestamp")
-                ),
-            }
-            for c in context
-        ]
+        with metrics.collect_spans() as spans, deadline.request_deadline(deadline_ms) as budget:
+            with metrics.span("total"):
+                # Identical questions with the same budget already in flight share one pipeline run
+                key = (normalize_question(question), budget.budget if budget else None)
+                (result, pipeline_spans), coalesced = await inflight_questions.do(
+                    key, lambda: timed_pipeline(question)
+                )
+            spans.update(pipeline_spans)
+        if coalesced:
+            log.debug("🔗 Coalesced with an identical in-flight question.")
 
         total_time = time.perf_counter() - start_total
-        print(f"✅ Answer generated successfully in {total_time:.3f}s for '{question}'\n")
+        log.debug("✅ Answer generated in %.3fs for '%s'", total_time, question)
 
-        return {
+        response = {
             "question": question,
-            "detected_user": user_name,
-            "answer": answer,
-            "context_used": formatted_context,
+            **result,
+            "coalesced": coalesced,
             "processing_time_sec": round(total_time, 3)
         }
+        if timings:
+            response["timings"] = {stage: round(sec, 4) for stage, sec in spans.items()}
+        return response
 
+    except HTTPException:
+        raise
     except Exception as e:
         total_time = time.perf_counter() - start_total
-        print(f"❌ Error in /ask after {total_time:.3f}s: {e}")
+        log.exception(f"❌ Error in /ask after {total_time:.3f}s: {e}")
         raise HTTPException(status_code=500, detail="Internal server error while processing request.")
 
+# ──────────────────────────────
+# /ask/batch endpoint
+# ──────────────────────────────
+class BatchAskRequest(BaseModel):
+    questions: List[str]
+
+
+def run_batch_retrieval(questions):
+    """User detection + one batched encode/search pass for every question (retrieval executor)."""
+    with metrics.span("user_detection"):
+        users = [detect_user_name(q, user_names) for q in questions]
+    with metrics.span("retrieval"):
+        results = retrieve_relevant_messages_batch(questions, users, top_k=5)
+    return users, results
+
+
+@app.post("/ask/batch")
+async def ask_batch(request: BatchAskRequest):
+    """
+    Answer many questions in one call (e.g. reporting jobs).
+      1️⃣ Detect members and encode every question in one pass.
+      2️⃣ Search once per member with all of that member's query vectors.
+      3️⃣ Call the LLM concurrently (ASK_BATCH_LLM_CONCURRENCY at a time).
+    Results keep the request order; a failing question gets its own
+    `error` instead of failing the batch.
+    """
+    start_total = time.perf_counter()
+    require_ready()
+    questions = request.questions
+    if not questions:
+        raise HTTPException(status_code=400, detail="Provide at least one question.")
+    if len(questions) > ASK_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {ASK_BATCH_MAX} questions per batch.")
+
+    items = [
+        {"index": i, "question": q, "detected_user": None, "answer": None, "context_used": [],
+         "cache_hit": None, "prompt_stats": None, "error": None}
+        for i, q in enumerate(questions)
+    ]
+    valid = [item for item in items if item["question"].strip()]
+    for item in items:
+        if not item["question"].strip():
+            item["error"] = "Question cannot be empty."
+
+    if valid:
+        try:
+            users, results = await in_retrieval_pool(run_batch_retrieval, [item["question"] for item in valid])
+        except Exception as e:
+            log.exception(f"❌ Batch retrieval failed: {e}")
+            users, results = [None] * len(valid), [e] * len(valid)
+        for item, user, result in zip(valid, users, results):
+            item["detected_user"] = user
+            if isinstance(result, Exception):
+                item["error"] = "Retrieval failed for this question."
+            else:
+                item["_context"], item["_q_emb"] = result
+
+    # Identical questions in one batch share a single answer
+    limit = asyncio.Semaphore(max(ASK_BATCH_LLM_CONCURRENCY, 1))
+    shared = {}
+
+    async def answer(item):
+        context = item.pop("_context", None)
+        q_emb = item.pop("_q_emb", None)
+        if item["error"]:
+            return
+        item["context_used"] = format_context(context)
+        if not context:
+            item.update(answer="I don’t have enough information to answer that.", cache_hit=None, prompt_stats=None)
+            return
+
+        key = normalize_question(item["question"])
+        if key not in shared:
+            async def run():
+                async with limit:
+                    return await answer_with_cache(item["question"], context, q_emb)
+            shared[key] = asyncio.ensure_future(run())
+        try:
+            answer_text, cache_tier, prompt_stats = await shared[key]
+        except Exception as e:
+            log.error("❌ Batch answer failed for item %d: %s", item["index"], e)
+            item["error"] = "Answer generation failed for this question."
+            return
+        item.update(answer=answer_text, cache_hit=cache_tier, prompt_stats=prompt_stats)
+        if answer_text == ERROR_ANSWER:
+            item["error"] = "Answer generation failed for this question."
+
+    await asyncio.gather(*(answer(item) for item in items))
+
+    total_time = time.perf_counter() - start_total
+    metrics.observe("ask_batch_size", len(items), buckets=metrics.SIZE_BUCKETS + (256, 512))
+    log.debug("✅ Answered batch of %d in %.3fs", len(items), total_time)
+    return {
+        "results": items,
+        "count": len(items),
+        "errors": sum(1 for item in items if item["error"]),
+        "processing_time_sec": round(total_time, 3),
+    }
+
+# ──────────────────────────────
+# /ask/stream endpoint (server-sent events)
+# ──────────────────────────────
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.get("/ask/stream")
+async def ask_stream(question: str = Query(..., description="Natural-language question to answer")):
+    """
+    Streaming variant of /ask. Emits, in order:
+      1️⃣ `context` — detected user + context_used, right after retrieval.
+      2️⃣ `token`   — answer fragments as the LLM produces them (one, for a
+         cached or profile answer).
+      3️⃣ `done`    — the normalized final answer and stage timings.
+    """
+    require_ready()
+    if not question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty.")
+
+    async def events():
+        start_total = time.perf_counter()
+        log.debug("🧩 Received streaming question: %s", question)
+
+        try:
+            user_name, context, q_emb, profile_hit = await in_retrieval_pool(run_profile_or_retrieval, question)
+        except Exception as e:
+            log.exception(f"❌ Retrieval failed in /ask/stream: {e}")
+            yield sse_event("error", {"detail": "Internal server error while processing request."})
+            return
+
+        t_retrieval = time.perf_counter()
+        yield sse_event("context", {
+            "question": question,
+            "detected_user": user_name,
+            "context_used": profile_context(user_name, profile_hit) if profile_hit else format_context(context),
+            "retrieval_time_sec": round(t_retrieval - start_total, 3),
+        })
+
+        first_token_at = None
+        prompt_stats = None
+        cached, cache_tier = answer_cache.get(question, context, q_emb) if context else (None, None)
+        if profile_hit:
+            log.debug("🗂️ Answered from %s's profile (%s).", user_name, profile_hit["field"])
+            first_token_at = time.perf_counter()
+            answer = profile_hit["answer"]
+            yield sse_event("token", {"text": answer})
+        elif not context:
+            answer = "I don’t have enough information to answer that."
+        elif cached is not None:
+            first_token_at = time.perf_counter()
+            answer = cached
+            yield sse_event("token", {"text": cached})
+        else:
+            parts = []
+            prompt_stats = {}
+            try:
+                async for token in stream_answer(question, context, stats=prompt_stats):
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    parts.append(token)
+                    yield sse_event("token", {"text": token})
+                answer = normalize_answer("".join(parts))
+                answer_cache.put(question, context, answer, q_emb)
+            except Exception as e:
+                log.error("❌ OpenAI API error: %s", e)
+                answer = ERROR_ANSWER
+
+        end = time.perf_counter()
+        if first_token_at:
+            metrics.observe("stage_seconds", first_token_at - start_total, labels={"stage": "stream_first_token"})
+        metrics.observe("stage_seconds", end - start_total, labels={"stage": "stream_total"})
+        log.debug("✅ Streamed answer in %.3fs for '%s'", end - start_total, question)
+        yield sse_event("done", {
+            "answer": answer,
+            "cache_hit": cache_tier,
+            "prompt_stats": prompt_stats,
+            "profile_hit": profile_hit["field"] if profile_hit else None,
+            "timings": {
+                "retrieval_sec": round(t_retrieval - start_total, 3),
+                "first_token_sec": round(first_token_at - start_total, 3) if first_token_at else None,
+                "llm_sec": round(end - t_retrieval, 3),
+                "total_sec": round(end - start_total, 3),
+            },
+        })
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # ──────────────────────────────
 # /health endpoint
 # ──────────────────────────────
 @app.get("/health")
 def health():
-    """Simple health check route for uptime monitoring."""
+    """Liveness (the process is serving) plus readiness and startup timings."""
     return {
         "status": "ok",
+        "ready": startup_state["status"] == "ready",
+        "startup": startup_state,
         "messages_loaded": len(messages),
         "users": len(user_names),
         "timestamp": datetime.utcnow().isoformat(),
     }
 
+@app.get("/ready")
+def ready():
+    """Readiness probe: 200 once messages, index and model are warm, 503 before."""
+    code = 200 if startup_state["status"] == "ready" else 503
+    return JSONResponse(status_code=code, content={"status": startup_state["status"], "error": startup_state["error"]})
+
+# ──────────────────────────────
+# /stats endpoint
+# ──────────────────────────────
+@app.get("/stats")
+def stats():
+    """In-process counters and histograms (e.g. embedding batch sizes, queue wait)."""
+    return metrics.snapshot()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """The same metrics in Prometheus text format, incl. `aurora_stage_seconds{stage=…}`."""
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
 # ──────────────────────────────
 # Root
 # ──────────────────────────────
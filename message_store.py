@@ -0,0 +1,219 @@
+import os
+import json
+import shutil
+import numpy as np
+
+from time_window import to_epoch
+
+# ──────────────────────────────
+# Memory-mapped columnar message store
+# ──────────────────────────────
+# Layout of a store directory:
+#   meta.json                 row count, per-member offsets table, embedding info
+#   <col>.heap.npy            UTF-8 bytes of every value in a string column
+#   <col>.offsets.npy         int64 start offsets into the heap (n + 1 entries)
+#   ts_epoch.npy              int64 epoch seconds per row
+#   embeddings.npy            optional float32 (n, dim), normalized, same row order
+# Rows are sorted by user_id so a member's messages are one contiguous slice.
+# Every array is opened with mmap_mode="r", so uvicorn workers share the pages
+# through the OS page cache instead of each holding a private copy.
+STRING_COLUMNS = ("id", "user_id", "user_name", "timestamp", "message")
+STORE_VERSION = 1
+
+
+class StringColumn:
+    """Read-only sequence view over a string heap + offsets pair."""
+
+    def __init__(self, heap, offsets):
+        self.heap = heap
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return self.heap[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class MetadataView:
+    """Chroma-style metadata dicts built on demand from the store's columns."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, i):
+        s = self.store
+        return {
+            "user_name": s.columns["user_name"][i],
+            "user_id": s.columns["user_id"][i],
+            "timestamp": s.columns["timestamp"][i] or None,
+            "ts_epoch": int(s.ts_epoch[i]),
+        }
+
+
+class MessageStore:
+    """
+    Read-only, memory-mapped message table.
+    Behaves like the old list of message dicts (len, index, slice, iterate)
+    while exposing columnar access for hot paths.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != STORE_VERSION:
+            raise ValueError(f"Unsupported message store version: {self.meta.get('version')}")
+
+        self.columns = {
+            col: StringColumn(
+                np.load(os.path.join(path, f"{col}.heap.npy"), mmap_mode="r"),
+                np.load(os.path.join(path, f"{col}.offsets.npy"), mmap_mode="r"),
+            )
+            for col in STRING_COLUMNS
+        }
+        self.ts_epoch = np.load(os.path.join(path, "ts_epoch.npy"), mmap_mode="r")
+        emb_path = os.path.join(path, "embeddings.npy")
+        self.embeddings = np.load(emb_path, mmap_mode="r") if os.path.exists(emb_path) else None
+        self.users = self.meta["users"]  # [{user_id, user_name, start, stop}]
+
+    # ──────────────────────────────
+    # Sequence protocol (list-of-dicts compatibility)
+    # ──────────────────────────────
+    def __len__(self):
+        return self.meta["count"]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        row = {col: self.columns[col][i] for col in STRING_COLUMNS}
+        row["timestamp"] = row["timestamp"] or None
+        return row
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    # ──────────────────────────────
+    # Columnar access
+    # ──────────────────────────────
+    def column(self, name):
+        return self.columns[name]
+
+    def metadata_view(self):
+        return MetadataView(self)
+
+    def user_names(self):
+        return [u["user_name"] for u in self.users]
+
+    def user_slice(self, user_id):
+        """O(1) row range for one member (empty range if unknown)."""
+        entry = self._by_user_id().get(user_id)
+        return (entry["start"], entry["stop"]) if entry else (0, 0)
+
+    def user_name_slices(self):
+        return {u["user_name"]: (u["start"], u["stop"]) for u in self.users}
+
+    def messages_for(self, user_id):
+        start, stop = self.user_slice(user_id)
+        return self[start:stop]
+
+    def _by_user_id(self):
+        if not hasattr(self, "_user_index"):
+            self._user_index = {u["user_id"]: u for u in self.users}
+        return self._user_index
+
+    @property
+    def sync_state(self):
+        return self.meta.get("sync", {})
+
+    def touch(self):
+        """Mark the store as freshly synced without rewriting it."""
+        os.utime(os.path.join(self.path, "meta.json"))
+
+    @property
+    def has_embeddings(self):
+        return self.embeddings is not None and len(self.embeddings) == len(self)
+
+    # ──────────────────────────────
+    # Writing
+    # ──────────────────────────────
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, "meta.json"))
+
+    @classmethod
+    def write(cls, path, messages, sync_state=None):
+        """
+        Write `messages` (list of dicts) as a new store, replacing any existing one.
+        `sync_state` (e.g. the fetch high-water mark) is kept in meta.json.
+        """
+        rows = sorted(messages, key=lambda m: (m["user_id"], m.get("timestamp") or "", m["id"]))
+        tmp = f"{path}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        for col in STRING_COLUMNS:
+            encoded = [(m.get(col) or "").encode("utf-8") for m in rows]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(b) for b in encoded], out=offsets[1:])
+            heap = b"".join(encoded) or b"\0"  # numpy cannot mmap a zero-length file
+            np.save(os.path.join(tmp, f"{col}.heap.npy"), np.frombuffer(heap, dtype=np.uint8))
+            np.save(os.path.join(tmp, f"{col}.offsets.npy"), offsets)
+        np.save(os.path.join(tmp, "ts_epoch.npy"), np.asarray([to_epoch(m.get("timestamp")) for m in rows], dtype=np.int64))
+
+        users = []
+        for i, m in enumerate(rows):
+            if users and users[-1]["user_id"] == m["user_id"]:
+                users[-1]["stop"] = i + 1
+            else:
+                users.append({"user_id": m["user_id"], "user_name": m["user_name"], "start": i, "stop": i + 1})
+
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": STORE_VERSION, "count": len(rows), "users": users, "sync": sync_state or {}}, f
+            )
+
+        old = f"{path}.old"
+        shutil.rmtree(old, ignore_errors=True)
+        if os.path.exists(path):
+            os.rename(path, old)  # open mmaps keep reading the old files
+        os.rename(tmp, path)
+        shutil.rmtree(old, ignore_errors=True)
+        return cls(path)
+
+    def write_embeddings(self, vectors_by_id, model_id):
+        """
+        Co-locate embeddings with the messages, aligned to row order.
+        Returns a reopened store that maps the new matrix.
+        """
+        ids = self.columns["id"]
+        dim = len(next(iter(vectors_by_id.values())))
+        matrix = np.zeros((len(self), dim), dtype=np.float32)
+        for i in range(len(self)):
+            vec = vectors_by_id.get(ids[i])
+            if vec is not None:
+                matrix[i] = vec
+
+        tmp_path = os.path.join(self.path, "embeddings.tmp.npy")
+        np.save(tmp_path, matrix)
+        os.replace(tmp_path, os.path.join(self.path, "embeddings.npy"))
+
+        # Readers may be loading meta.json right now: replace it atomically too
+        self.meta["embeddings"] = {"model": model_id, "dim": dim}
+        tmp_meta = os.path.join(self.path, "meta.tmp.json")
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_meta, os.path.join(self.path, "meta.json"))
+        return MessageStore(self.path)
@@ -0,0 +1,139 @@
+import os
+import json
+import pickle
+import random
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# ──────────────────────────────
+# Local stand-in for the messages API
+# ──────────────────────────────
+# Serves `GET /messages/?skip=&limit=` as `{"total", "items"}` like the real
+# API, optionally capping `limit` server-side, so the sync engine
+# (`utils.sync_messages`) can be exercised without network or quota.
+
+def synthetic_messages(n, seed=0, start=0):
+    """`n` messages shaped like the API's, for members u0…u9."""
+    rng = random.Random(seed + start)
+    base = datetime(2025, 1, 1)
+    return [
+        {
+            "id": f"msg-{i}",
+            "user_id": f"u{i % 10}",
+            "user_name": f"Member {i % 10}",
+            "timestamp": (base + timedelta(minutes=i)).isoformat(),
+            "message": f"Please book a table for {rng.randint(2, 8)} on day {i}.",
+        }
+        for i in range(start, start + n)
+    ]
+
+
+class StubMessagesAPI:
+    """In-process HTTP server over a mutable message list (`messages` may be appended to)."""
+
+    def __init__(self, messages, max_limit=None, host="127.0.0.1", port=0):
+        self.messages = list(messages)
+        self.max_limit = max_limit
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path.rstrip("/") != "/messages":
+                    self.send_error(404)
+                    return
+                stub.requests += 1
+                query = parse_qs(url.query)
+                skip = int(query.get("skip", ["0"])[0])
+                limit = int(query.get("limit", ["100"])[0])
+                if stub.max_limit:
+                    limit = min(limit, stub.max_limit)
+                body = json.dumps({"total": len(stub.messages), "items": stub.messages[skip:skip + limit]}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.url = f"http://{host}:{self.server.server_port}/messages"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+# ──────────────────────────────
+# End-to-end sync check
+# ──────────────────────────────
+def check_sync(messages, max_limit=None, page_size=50, appended=25):
+    """
+    Full sync, then an incremental one after `appended` new messages,
+    against a stub server; returns a report and raises AssertionError on a mismatch.
+    """
+    import utils
+
+    with StubMessagesAPI(messages, max_limit=max_limit) as api, tempfile.TemporaryDirectory() as tmp:
+        old_url, old_path = utils.API_URL, utils.STORE_PATH
+        utils.API_URL, utils.STORE_PATH = api.url, os.path.join(tmp, "message_store")
+        try:
+            store, changed = utils.sync_messages(force_full=True, page_size=page_size)
+            assert changed and len(store) == len(api.messages), f"full sync stored {len(store)}/{len(api.messages)}"
+            full_requests = api.requests
+
+            api.messages.extend(synthetic_messages(appended, start=len(api.messages) + 1_000_000))
+            store, changed = utils.sync_messages(page_size=page_size)
+            assert changed and len(store) == len(api.messages), f"incremental sync stored {len(store)}/{len(api.messages)}"
+            assert {m["id"] for m in store} == {m["id"] for m in api.messages}, "stored ids differ from the API's"
+
+            _, changed = utils.sync_messages(page_size=page_size)
+            assert not changed, "a sync with nothing new rewrote the store"
+        finally:
+            utils.API_URL, utils.STORE_PATH = old_url, old_path
+
+    return {
+        "messages": len(api.messages),
+        "page_size": page_size,
+        "server_max_limit": max_limit,
+        "full_sync_requests": full_requests,
+        "total_requests": api.requests,
+        "ok": True,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Stand-in messages API and sync-engine check.")
+    ap.add_argument("--serve", action="store_true", help="only serve until interrupted (point MESSAGES_API_URL at it)")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--messages", type=int, default=1234, help="synthetic messages when data_cache.pkl is absent")
+    ap.add_argument("--max-limit", type=int, default=0, help="server-side cap on `limit` (0 = none)")
+    ap.add_argument("--page-size", type=int, default=50)
+    args = ap.parse_args()
+
+    from utils import CACHE_FILE
+
+    if os.path.exists(CACHE_FILE):
+        with open(CACHE_FILE, "rb") as f:
+            source = pickle.load(f)
+    else:
+        source = synthetic_messages(args.messages)
+
+    if args.serve:
+        with StubMessagesAPI(source, max_limit=args.max_limit or None, port=args.port) as api:
+            print(f"🧪 Stub messages API on {api.url} ({len(source)} messages). Ctrl-C to stop.")
+            threading.Event().wait()
+    else:
+        for cap in (None, args.max_limit or max(args.page_size // 3, 1)):
+            print(json.dumps(check_sync(source, max_limit=cap, page_size=args.page_size), indent=2))
@@ -0,0 +1,192 @@
+import re
+import time
+import logging
+import threading
+import contextvars
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# ──────────────────────────────
+# Lightweight in-process metrics
+# ──────────────────────────────
+# Counters and histograms shared by every module; read via `snapshot()`
+# (JSON, /stats) or `render_prometheus()` (text exposition, /metrics).
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+
+log = logging.getLogger("aurora.metrics")
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics: value <= bound)."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self):
+        cumulative, running = {}, 0
+        for bound, n in zip(self.buckets + ("+Inf",), self.counts):
+            running += n
+            cumulative[str(bound)] = running
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "avg": round(self.sum / self.count, 6) if self.count else 0.0,
+            "buckets": cumulative,
+        }
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items()))) if labels else name
+
+
+def _series(key):
+    """'name' or 'name{label="value",…}' for a metric key."""
+    if isinstance(key, str):
+        return key
+    name, labels = key
+    return name + "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+def inc(name, amount=1, labels=None):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def set_gauge(name, value, labels=None):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS, labels=None):
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = Histogram(buckets)
+        hist.observe(value)
+
+
+def mean(name, labels=None):
+    """Average observed value of a histogram series, or None before the first observation."""
+    with _lock:
+        hist = _histograms.get(_key(name, labels))
+        return hist.sum / hist.count if hist and hist.count else None
+
+
+def snapshot():
+    """JSON-friendly view of every metric recorded so far."""
+    with _lock:
+        return {
+            "counters": {_series(k): v for k, v in _counters.items()},
+            "gauges": {_series(k): v for k, v in _gauges.items()},
+            "histograms": {_series(k): h.to_dict() for k, h in _histograms.items()},
+        }
+
+# ──────────────────────────────
+# Named spans (per-stage latency)
+# ──────────────────────────────
+# Every span feeds the `stage_seconds{stage=…}` histogram. Inside
+# `collect_spans()` it is also added to that request's breakdown; the
+# context variable follows the request into tasks and (via
+# `contextvars.copy_context().run`) into executor threads.
+_request_spans = contextvars.ContextVar("request_spans", default=None)
+
+
+@contextmanager
+def span(stage):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        observe("stage_seconds", elapsed, labels={"stage": stage})
+        spans = _request_spans.get()
+        if spans is not None:
+            spans[stage] = spans.get(stage, 0.0) + elapsed  # repeated stages accumulate
+        log.debug("⏱️ %s took %.3fs", stage, elapsed)
+
+
+@contextmanager
+def collect_spans():
+    """Collect the spans recorded in this context into a `{stage: seconds}` dict."""
+    spans = {}
+    token = _request_spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _request_spans.reset(token)
+
+# ──────────────────────────────
+# Prometheus text exposition
+# ──────────────────────────────
+def _prom_name(name, prefix):
+    return prefix + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def _prom_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _split(key):
+    return (key, ()) if isinstance(key, str) else key
+
+
+def render_prometheus(prefix="aurora_"):
+    """Every metric in Prometheus text format (version 0.0.4)."""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        histograms = {k: (h.buckets, list(h.counts), h.count, h.sum) for k, h in _histograms.items()}
+
+    lines, typed = [], set()
+
+    def declare(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+    for key, value in sorted(counters.items(), key=lambda kv: str(kv[0])):
+        name, labels = _split(key)
+        metric = _prom_name(name, prefix) + "_total"
+        declare(metric, "counter")
+        lines.append(f"{metric}{_prom_labels(labels)} {value}")
+
+    for key, value in sorted(gauges.items(), key=lambda kv: str(kv[0])):
+        if not isinstance(value, (int, float)):
+            continue
+        name, labels = _split(key)
+        metric = _prom_name(name, prefix)
+        declare(metric, "gauge")
+        lines.append(f"{metric}{_prom_labels(labels)} {value}")
+
+    for key, (buckets, counts, count, total) in sorted(histograms.items(), key=lambda kv: str(kv[0])):
+        name, labels = _split(key)
+        metric = _prom_name(name, prefix)
+        declare(metric, "histogram")
+        running = 0
+        for bound, n in zip(buckets + ("+Inf",), counts):
+            running += n
+            lines.append(f"{metric}_bucket{_prom_labels(labels, [('le', bound)])} {running}")
+        lines.append(f"{metric}_sum{_prom_labels(labels)} {total}")
+        lines.append(f"{metric}_count{_prom_labels(labels)} {count}")
+
+    return "\n".join(lines) + "\n"
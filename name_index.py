@@ -0,0 +1,90 @@
+import re
+import unicodedata
+from rapidfuzz import fuzz, process
+
+# ──────────────────────────────
+# Text normalization
+# ──────────────────────────────
+def normalize_text(text: str) -> str:
+    """Normalize text for consistent fuzzy and lexical matching."""
+    text = unicodedata.normalize("NFKD", text)
+    text = text.replace("’", "'").replace("‘", "'").replace("`", "'")
+    text = re.sub(r"[^a-zA-Z0-9+ ']+", " ", text)
+    return text.lower().strip()
+
+
+def word_tokens(text: str):
+    """Word tokens of already-normalized text ("thiago's" → ["thiago", "s"])."""
+    return re.findall(r"[a-z0-9]+", text)
+
+def name_tokens(text: str):
+    """
+    Name parts of already-normalized text, apostrophes kept inside a part
+    ("o'sullivan's" → ["o'sullivan"]) so "o'clock" never matches a name.
+    One-letter parts (initials) are dropped.
+    """
+    parts = (re.sub(r"'s$", "", t).strip("'") for t in re.findall(r"[a-z0-9']+", text))
+    return [p for p in parts if len(p) > 1]
+
+# ──────────────────────────────
+# Precompiled member-name index
+# ──────────────────────────────
+class NameIndex:
+    """
+    Member-name lookup built once per member list.
+      1️⃣ Token inverted index: name part → members, so literal and
+         partial matches cost one dict probe per question token.
+      2️⃣ Pre-normalized names for a single rapidfuzz `extractOne`
+         pass when no token matches.
+    """
+
+    def __init__(self, user_names, fuzzy_cutoff=70):
+        self.source = user_names
+        self.size = len(user_names)
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.names = list(user_names)
+        self.normalized = [normalize_text(u) for u in self.names]
+        self.parts = [name_tokens(n) for n in self.normalized]
+
+        self.by_token = {}
+        for idx, parts in enumerate(self.parts):
+            for part in set(parts):
+                self.by_token.setdefault(part, []).append(idx)
+
+    def is_stale(self, user_names):
+        """True when `user_names` is not the list this index was built from."""
+        return user_names is not self.source or len(user_names) != self.size
+
+    def match(self, question):
+        """Return `(user_name, how)` or `(None, None)`; `how` is literal / partial / fuzzy."""
+        norm_q = normalize_text(question)
+        q_tokens = name_tokens(norm_q)
+
+        # 1️⃣ Literal / partial: count matched name parts per candidate
+        hits = {}
+        for tok in set(q_tokens):
+            for idx in self.by_token.get(tok, ()):
+                hits[idx] = hits.get(idx, 0) + 1
+
+        if hits:
+            joined = " " + " ".join(q_tokens) + " "
+            best = max(
+                hits,
+                key=lambda i: (
+                    f" {' '.join(self.parts[i])} " in joined,  # full name present
+                    hits[i],
+                    -i,
+                ),
+            )
+            full = f" {' '.join(self.parts[best])} " in joined
+            return self.names[best], "literal" if full else "partial"
+
+        # 2️⃣ Fuzzy fallback over pre-normalized names (C loop in rapidfuzz)
+        found = process.extractOne(
+            norm_q, self.normalized, scorer=fuzz.partial_ratio, score_cutoff=self.fuzzy_cutoff
+        )
+        if found:
+            _, score, idx = found
+            return self.names[idx], f"fuzzy ({score:.0f})"
+
+        return None, None
@@ -0,0 +1,389 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+
+import metrics
+from name_index import normalize_text, word_tokens
+from time_window import from_epoch
+
+log = logging.getLogger("aurora.profiles")
+
+# ──────────────────────────────
+# Configuration
+# ──────────────────────────────
+PROFILE_PATH = os.getenv("PROFILE_PATH", "member_profiles.json")
+# Answer matching questions straight from the profile (no retrieval, no LLM)
+PROFILE_FAST_PATH = os.getenv("PROFILE_FAST_PATH", "0") == "1"
+# Bumped whenever the extractors change, so every profile is rebuilt once
+PROFILE_VERSION = 1
+MAX_FACTS_IN_ANSWER = 5
+
+# ──────────────────────────────
+# Fact extraction (rule-based, per message)
+# ──────────────────────────────
+_CAP = r"[A-Z][\w'’.&-]*"
+_PROPER = rf"{_CAP}(?:\s+{_CAP})*"  # "Paris", "New York City", "The French Laundry"
+_DAYS = "Monday|Tuesday|Wednesday|Thursday|Friday|Saturday|Sunday"
+_MONTHS = "January|February|March|April|May|June|July|August|September|October|November|December"
+# Capitalized words that start a sentence or name a date, never a place or venue
+_NOT_PROPER = set(f"I My Our The A An Please Can Could Would {_DAYS} {_MONTHS}".replace("|", " ").split())
+
+_TRIP_TO = re.compile(
+    rf"\b(?:trip|flight|jet|fly|flying|travel\w*|getaway|vacation|holiday|visit|Gulfstream|helicopter|yacht)\b"
+    rf"[^.?!]*?\bto ({_PROPER})"
+)
+_TRIP_NAMED = re.compile(rf"\b({_PROPER})\s+(?:trip|visit|getaway|vacation)\b")
+_WHEN = re.compile(
+    rf"\b(?:(?:this|next|on|by)\s+)?(?:{_DAYS}|weekend)\b"
+    rf"|\b(?:tomorrow|tonight|today|next (?:week|month|year))\b"
+    rf"|\b(?:(?:on|in|from)\s+)?(?:{_MONTHS})(?:\s+\d{{1,2}}(?:st|nd|rd|th)?(?:\s*-\s*\d{{1,2}})?)?\b"
+    rf"|\bon the \d{{1,2}}(?:st|nd|rd|th)\b"
+)
+_PAST = re.compile(r"\b(?:thanks?|thank you|was|were|enjoyed|loved|last trip|appreciate)\b", re.IGNORECASE)
+
+_DINING = re.compile(r"\b(?:restaurant|table|dinner|lunch|brunch|breakfast|dine|dining|eat|meal|sushi|chef)\b", re.IGNORECASE)
+_VENUE_AT = re.compile(
+    rf"\b(?:table|reservation|dinner|lunch|brunch|breakfast|booking|dine|dining|eat|meal|spot)\b"
+    rf"(?:\s+[\w-]+){{0,3}}?\s+at\s+({_PROPER})"
+)
+_CUISINE = re.compile(rf"\b([A-Z][a-z]+|[\w]+-starred|top-rated)\s+restaurants?\b(?:\s+in\s+({_PROPER}))?")
+_FAVORITE = re.compile(r"\b(?:favou?rite|usual|regular|love|loved)\b", re.IGNORECASE)
+_NEGATION = re.compile(r"\b(?:not|don't|don’t|do not|no more|never)\b", re.IGNORECASE)
+
+_BRANDS = (
+    r"Tesla|Mercedes(?:-Benz)?|Bentley|Rolls[- ]Royce|Porsche|Ferrari|Lamborghini|BMW|Audi|Maserati"
+    r"|Range Rover|Aston Martin|Jaguar|Cadillac|Lexus|McLaren|Bugatti"
+)
+_CAR_MODEL = re.compile(rf"\b(?:{_BRANDS})(?:\s+(?:Model\s+\w+|\d+\s+series|[A-Z0-9][\w-]*))*")
+_CAR_TYPE = re.compile(r"\b(?:(vintage|classic|luxury|sports|electric|hybrid|racing|town)\s+cars?|limo(?:usine)?|SUV)\b")
+_OWNED = re.compile(r"\bmy\s+(?:own\s+)?$")
+
+_STATED_PREFERENCE = re.compile(
+    r"\b(?:I (?:strongly |always )?prefer|my preference (?:for|is)|I have a (?:strong )?preference for)\s+([^.;!?—,]+)"
+)
+_TRAILING_PREFERENCE = re.compile(r"([^.;!?—]+?)[;,]?\s*that'?’?s my preference", re.IGNORECASE)
+
+
+def _proper(name, article=False):
+    """Trim sentence/date words off a capitalized run; None if nothing is left."""
+    words = name.split()
+    while words and words[0] in _NOT_PROPER and len(words) > 1 and not (article and words[0] == "The"):
+        words = words[1:]
+    while words and words[-1] in _NOT_PROPER:
+        words = words[:-1]
+    name = " ".join(words).rstrip("'’.-")
+    return name if name and name not in _NOT_PROPER else None
+
+
+def _third_person(text):
+    text = re.sub(r"\bmy\b", "their", text.strip())
+    text = re.sub(r"\bme\b", "them", text)
+    return re.sub(r"\bI\b", "they", text)
+
+
+def extract_facts(text):
+    """`[(field, value, extra)]` found in one message."""
+    facts = []
+
+    when = _WHEN.search(text)
+    past = bool(_PAST.search(text))
+    for match in (*_TRIP_TO.finditer(text), *_TRIP_NAMED.finditer(text)):
+        place = _proper(match.group(1))
+        if place:
+            facts.append(("trips", place, {"when": when.group(0).strip() if when else None, "past": past}))
+
+    if _DINING.search(text) and not _NEGATION.search(text):
+        favorite = bool(_FAVORITE.search(text))
+        for match in _VENUE_AT.finditer(text):
+            venue = _proper(match.group(1), article=True)  # "The Ivy" keeps its article
+            if venue:
+                facts.append(("restaurants", venue, {"favorite": favorite}))
+        for match in _CUISINE.finditer(text):
+            kind = match.group(1) if match.group(1) not in _NOT_PROPER else ""
+            city = _proper(match.group(2)) if match.group(2) else None
+            value = f"{kind} restaurant".strip() + (f" in {city}" if city else "")
+            if kind or city:
+                facts.append(("restaurants", value, {"favorite": favorite}))
+
+    for match in _CAR_MODEL.finditer(text):
+        owned = bool(_OWNED.search(text[:match.start()]))
+        facts.append(("cars", match.group(0).replace("Rolls Royce", "Rolls-Royce"), {"owned": owned}))
+    for match in _CAR_TYPE.finditer(text):
+        facts.append(("cars", match.group(0).lower().rstrip("s") if match.group(1) else match.group(0), {"owned": False}))
+
+    for match in _STATED_PREFERENCE.finditer(text):
+        facts.append(("preferences", _third_person(match.group(1)), {}))
+    if "s my preference" in text.lower():  # guard: the trailing form scans back from every position
+        for match in _TRAILING_PREFERENCE.finditer(text):
+            facts.append(("preferences", _third_person(match.group(1)), {}))
+    return facts
+
+
+def build_profile(rows):
+    """
+    `{field: [fact]}` for one member from `(id, timestamp, ts_epoch, text)` rows.
+    Repeated values collapse into one fact (newest source, `mentions` count).
+    """
+    merged = {}
+    for msg_id, timestamp, ts_epoch, text in rows:
+        for field, value, extra in extract_facts(text):
+            key = (field, value.lower())
+            fact = merged.get(key)
+            if fact is None or ts_epoch >= fact["ts_epoch"]:
+                mentions = fact["mentions"] + 1 if fact else 1
+                favorite = bool(fact and fact.get("favorite"))
+                merged[key] = fact = {
+                    "value": value, "id": msg_id, "timestamp": timestamp, "ts_epoch": ts_epoch,
+                    "text": text, "mentions": mentions, **extra,
+                }
+                if favorite:
+                    fact["favorite"] = True
+            else:
+                fact["mentions"] += 1
+                if extra.get("favorite"):
+                    fact["favorite"] = True
+
+    profile = {}
+    for (field, _), fact in merged.items():
+        profile.setdefault(field, []).append(fact)
+    for facts in profile.values():
+        facts.sort(key=lambda f: f["ts_epoch"], reverse=True)  # newest first
+    return profile
+
+
+def member_fingerprint(store, start, stop):
+    """Content hash of one member's rows, read straight from the store's string heaps."""
+    h = hashlib.blake2b(digest_size=16)
+    for col in ("id", "timestamp", "message"):
+        column = store.column(col)
+        offsets = column.offsets[start:stop + 1]
+        h.update(column.heap[offsets[0]:offsets[-1]].tobytes() if stop > start else b"")
+        h.update((offsets - offsets[0]).tobytes() if stop > start else b"")  # value boundaries
+    return h.hexdigest()
+
+# ──────────────────────────────
+# Question intents
+# ──────────────────────────────
+# Only plain look-ups qualify; anything about a problem goes through retrieval + LLM
+_LOOKUP = re.compile(r"^(?:what|which|where|when|how many|list|does|do|is|are|has|have|tell me|show me)\b")
+_TROUBLESHOOTING = re.compile(
+    r"\b(?:why|charged?|charges|refund\w*|issues?|problems?|cancel\w*|complain\w*|status|confirm\w*|say|said)\b"
+)
+INTENTS = (
+    # First, so "what kind of car does … prefer" is answered from stated preferences only
+    ("preferences", re.compile(r"\bpreferences?\b|\bprefers?\b|\blikes?\b")),
+    ("cars", re.compile(
+        r"\bhow many (?:cars|vehicles)\b|\b(?:what|which) (?:kind of |type of )?(?:cars?|vehicles?)\b"
+        r"|\b(?:own|owns|has|have|drive|drives)\b.*\b(?:cars?|vehicles?)\b"
+    )),
+    ("restaurants", re.compile(
+        r"\b(?:favou?rite|which|what|where|list|any|usual)\b.*\brestaurants?\b"
+        r"|\bwhere (?:does|do|did|should) .*\b(?:eat|dine)\b"
+    )),
+    ("trips", re.compile(
+        r"\b(?:trips?|travel plans|destinations?)\b"
+        r"|\bwhere (?:is|are|was|does|do|did|will) .*\b(?:going|headed|heading|flying|fly|travel\w*|visit\w*)\b"
+        r"|\bwhen (?:is|are|does|do|will) .*\b(?:going|flying|fly|travel\w*|visit\w*)\b"
+    )),
+)
+# Profiles have no notion of "now", so questions about what comes next go to retrieval
+_UPCOMING = re.compile(r"\b(?:upcoming|next|planning|planned|plans?|going|will)\b")
+_FAVORITE_QUESTION = re.compile(r"\b(?:favou?rites?|usual|regular)\b")
+_QUESTION_WORDS = frozenset(
+    "what which where when how many list does do did is are has have tell me show the a an of kind type sort "
+    "any s their his her prefer prefers preferred preference preferences like likes usually generally".split()
+)
+# A qualifier in a preference question matches a fact mentioning any word of its topic
+_TOPICS = (
+    frozenset("diet dietary food foods allergy allergies allergic vegan vegetarian gluten kosher halal dairy "
+              "meal meals eat eating".split()),
+    frozenset("seat seats seating aisle window".split()),
+    frozenset("car cars vehicle vehicles drive driver chauffeur limo limousine suv sedan tesla mercedes bentley "
+              "rolls royce porsche ferrari lamborghini bmw audi maserati jaguar cadillac lexus mclaren".split()),
+    frozenset("hotel hotels room rooms suite suites".split()),
+    frozenset("flight flights fly flying airline airlines jet".split()),
+    frozenset("restaurant restaurants dining dinner lunch table cuisine".split()),
+)
+
+
+def match_intent(question):
+    """The profile field a question asks about, or None."""
+    norm = normalize_text(question)
+    if not _LOOKUP.search(norm) or _TROUBLESHOOTING.search(norm):
+        return None
+    for field, pattern in INTENTS:
+        if pattern.search(norm):
+            return field
+    return None
+
+def _qualifiers(question, user_name):
+    """Content words of a question beyond the look-up itself and the member's name."""
+    return set(word_tokens(normalize_text(question))) - _QUESTION_WORDS - set(word_tokens(normalize_text(user_name)))
+
+
+def _covers(fact, words):
+    """True if the fact mentions every qualifier (or a word of its topic)."""
+    said = set(word_tokens(normalize_text(fact["value"])))
+    return all(said & next((t for t in _TOPICS if w in t), {w}) for w in words)
+
+# ──────────────────────────────
+# Answers
+# ──────────────────────────────
+def _date(fact):
+    return from_epoch(fact["ts_epoch"]).date().isoformat() if fact["ts_epoch"] else "undated"
+
+
+def _render(field, facts, user_name, question):
+    norm = normalize_text(question)
+    if field == "trips":
+        parts = []
+        for f in facts:
+            detail = ", ".join(p for p in (f.get("when"), f"{'mentioned' if f.get('past') else 'requested'} {_date(f)}") if p)
+            parts.append(f"{f['value']} ({detail})")
+        return f"Trips in {user_name}'s messages, newest first: " + "; ".join(parts) + "."
+
+    if field == "restaurants":
+        if _FAVORITE_QUESTION.search(norm):  # `answer` has already kept only the flagged facts
+            lead = f"{user_name}'s favorite or usual restaurants: "
+        else:
+            lead = f"Restaurants in {user_name}'s messages: "
+        return lead + "; ".join(
+            f["value"] + (f" ({f['mentions']} mentions)" if f["mentions"] > 1 else "") for f in facts
+        ) + "."
+
+    if field == "cars":
+        owned = [f for f in facts if f.get("owned")]
+        if owned:
+            return f"{user_name}'s messages mention {len(owned)} car(s) of their own: " + "; ".join(f["value"] for f in owned) + "."
+        if not re.search(r"\b(?:how many|own|owns|has|have)\b", norm):
+            return f"Cars requested in {user_name}'s messages: " + "; ".join(f["value"] for f in facts) + "."
+        return (
+            "I don’t have the exact information for this, but based on the available context, "
+            f"{user_name} has only requested cars, not mentioned owning any: " + "; ".join(f["value"] for f in facts) + "."
+        )
+
+    return f"{user_name}'s stated preferences: " + "; ".join(f["value"] for f in facts) + "."
+
+# ──────────────────────────────
+# Persistent, incrementally rebuilt profile store
+# ──────────────────────────────
+class ProfileStore:
+    """
+    Per-member fact profiles keyed by user_id, kept in one JSON file.
+      1️⃣ `sync(store)` fingerprints each member's rows and re-extracts only
+         members whose messages changed (writer process).
+      2️⃣ `reload()` picks up the writer's file in other workers.
+      3️⃣ `answer(question, user_name)` serves matching look-ups directly.
+    Each fact keeps its source message id, timestamp and text.
+    """
+
+    def __init__(self, path=PROFILE_PATH):
+        self.path = path
+        self.members = {}
+        self._by_name = {}
+        self._mtime = None
+
+    def _publish(self, members):
+        by_name = {m["user_name"]: uid for uid, m in members.items()}
+        self.members, self._by_name = members, by_name  # swapped together for readers
+
+    def reload(self):
+        """Load the profile file if it changed on disk; True when something was loaded."""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning(f"⚠️ Could not read member profiles ({e}).")
+            return False
+        self._mtime = mtime
+        self._publish(data.get("members", {}) if data.get("version") == PROFILE_VERSION else {})
+        return True
+
+    def sync(self, store):
+        """
+        Bring profiles in line with a MessageStore, rebuilding only changed members.
+        Returns `{"rebuilt", "unchanged", "removed"}` counts.
+        """
+        t0 = time.perf_counter()
+        self.reload()
+        old = self.members
+        members, rebuilt = {}, 0
+        ids, stamps, texts = store.column("id"), store.column("timestamp"), store.column("message")
+
+        for user in store.users:
+            uid, start, stop = user["user_id"], user["start"], user["stop"]
+            fingerprint = member_fingerprint(store, start, stop)
+            current = old.get(uid)
+            if current and current["fingerprint"] == fingerprint and current["user_name"] == user["user_name"]:
+                members[uid] = current
+                continue
+            rows = ((ids[i], stamps[i] or None, int(store.ts_epoch[i]), texts[i]) for i in range(start, stop))
+            members[uid] = {"user_name": user["user_name"], "fingerprint": fingerprint, "facts": build_profile(rows)}
+            rebuilt += 1
+
+        removed = len(set(old) - set(members))
+        if rebuilt or removed or not os.path.exists(self.path):
+            self._write(members)
+        self._publish(members)
+
+        summary = {"rebuilt": rebuilt, "unchanged": len(members) - rebuilt, "removed": removed}
+        metrics.set_gauge("profile_sync_seconds", round(time.perf_counter() - t0, 3))
+        metrics.inc("profile_members_rebuilt", rebuilt)
+        log.info(f"🗂️ Member profiles: {rebuilt} rebuilt, {summary['unchanged']} unchanged, {removed} removed.")
+        return summary
+
+    def _write(self, members):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": PROFILE_VERSION, "members": members}, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, self.path)
+        self._mtime = os.path.getmtime(self.path)
+
+    def get(self, user_name):
+        uid = self._by_name.get(user_name)
+        return self.members.get(uid) if uid else None
+
+    def answer(self, question, user_name):
+        """
+        `{"field", "answer", "sources"}` when `question` is a look-up the member's
+        profile covers, else None (the caller falls back to retrieval + LLM).
+        A qualifier the facts cannot answer also returns None: "favorite" without
+        flagged restaurants, "next"/"upcoming" trips, or a preference topic
+        ("dietary", "seat") no stated preference mentions.
+        """
+        field = match_intent(question) if user_name else None
+        profile = self.get(user_name) if field else None
+        facts = (profile or {}).get("facts", {}).get(field)
+        if not facts:
+            return None
+
+        norm = f" {normalize_text(question)} "
+        if _FAVORITE_QUESTION.search(norm):
+            facts = [f for f in facts if f.get("favorite")] if field == "restaurants" else []
+        elif field == "trips" and _UPCOMING.search(norm):
+            facts = []
+        elif field == "preferences":
+            wanted = _qualifiers(question, user_name)
+            facts = [f for f in facts if _covers(f, wanted)]
+        if not facts:
+            return None
+
+        # A question naming one destination / venue is narrowed to it
+        named = [f for f in facts if f" {normalize_text(f['value'])} " in norm]
+        if named:
+            facts = named
+        elif field in ("trips", "restaurants") and re.search(r"\b(?:to|at|in)\s+[A-Z]", question):
+            return None  # asks about a place the profile does not know
+        facts = facts[:MAX_FACTS_IN_ANSWER]
+
+        metrics.inc("profile_fast_path", labels={"field": field})
+        return {"field": field, "answer": _render(field, facts, user_name, question), "sources": facts}
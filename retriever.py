@@ -1,268 +1,882 @@
 import os
-import re
-import unicodedata
+import json
+import fcntl
+import hashlib
+import logging
+import threading
 import numpy as np
 from tqdm import tqdm
-from datetime import datetime, timezone
-from dateutil import parser as date_parser
-from sentence_transformers import SentenceTransformer
-import chromadb
-from rapidfuzz import fuzz
 import time
+from vector_store import VECTOR_QUANTIZATION, NumpyVectorStore, QuantizedVectorStore
+from bm25 import BM25Index
+from name_index import NameIndex, normalize_text  # noqa: F401 (normalize_text re-exported)
+from time_window import to_epoch, from_epoch, parse_time_window
+from bulk_index import INDEX_BATCH_SIZE, INDEX_POOL_MIN_DOCS, INDEX_WORKERS, bulk_index
+from embedding_service import EmbeddingBatcher
+from embeddings import EMBED_BACKEND, load_embedder
+from index_server import IndexClient, RemoteEncoder, RemoteSearchBackend, is_remote_client
+import metrics
+import deadline
+
+log = logging.getLogger("aurora.retriever")
 
 # ──────────────────────────────
 # Configuration
 # ──────────────────────────────
 EMBED_MODEL = "sentence-transformers/all-mpnet-base-v2"  # 🔥 High-accuracy model
 CHROMA_PATH = "chroma_store"
-os.makedirs(CHROMA_PATH, exist_ok=True)
+# "chroma" (HNSW, on disk) or "numpy" (exact, in memory — small corpora)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "chroma").lower()
+NUMPY_SIDECAR = os.path.join(CHROMA_PATH, "vectors")
+MANIFEST_PATH = os.path.join(CHROMA_PATH, "index_manifest.json")
+# Bumped when stored metadata gains fields; older indexes are migrated in place
+INDEX_SCHEMA = 2
+# Push "last month" / "in March"-style ranges into the vector search
+TIME_FILTER = os.getenv("TIME_FILTER", "1") != "0"
+# "off" (dense only), "fuse" (BM25 + dense via reciprocal-rank fusion) or
+# "fast" (fuse, but skip the dense encode when the lexical hit is confident)
+HYBRID_MODE = os.getenv("HYBRID_MODE", "fuse").lower()
+RRF_K = int(os.getenv("RRF_K", "60"))
+LEXICAL_FAST_MIN_SCORE = float(os.getenv("LEXICAL_FAST_MIN_SCORE", "8.0"))
+
+# ──────────────────────────────
+# Lazily created components
+# ──────────────────────────────
+# Nothing heavy happens at import time: the model and the Chroma client are
+# created on first use (or explicitly via `warmup()` during app startup).
+_model = None
+_collection = None
+COLLECTION_NAME = "member_messages"
+_init_lock = threading.Lock()
+
+
+def get_model():
+    """The SentenceTransformer (on the configured EMBED_BACKEND), loaded on first call."""
+    global _model
+    if _model is None:
+        with _init_lock:
+            if _model is None:
+                log.info(f"🧠 Loading embedding model: {EMBED_MODEL} ({EMBED_BACKEND} backend)")
+                t0 = time.perf_counter()
+                _model = load_embedder(EMBED_MODEL, EMBED_BACKEND)
+                metrics.set_gauge("model_load_seconds", round(time.perf_counter() - t0, 3))
+    return _model
 
-print(f"🧠 Loading embedding model: {EMBED_MODEL}")
-model = SentenceTransformer(EMBED_MODEL)
 
-# Initialize persistent Chroma client
-chroma_client = chromadb.PersistentClient(path=CHROMA_PATH)
-collection = chroma_client.get_or_create_collection(
-    name="member_messages",
-    metadata={"hnsw:space": "cosine"},
-)
+def get_collection():
+    """The persistent Chroma collection, opened on first call."""
+    global _collection
+    if _collection is None:
+        with _init_lock:
+            if _collection is None:
+                _collection = _chroma_client().get_or_create_collection(
+                    name=COLLECTION_NAME,
+                    metadata={"hnsw:space": "cosine"},
+                )
+    return _collection
+
+
+def _chroma_client():
+    import chromadb
+
+    os.makedirs(CHROMA_PATH, exist_ok=True)
+    return chromadb.PersistentClient(path=CHROMA_PATH)
+
+
+def reset_collection():
+    """
+    Drop and recreate the Chroma collection, so a full rebuild starts empty.
+    Errors propagate: stale vectors must never survive a rebuild.
+    """
+    global _collection
+    with _init_lock:
+        client = _chroma_client()
+        if COLLECTION_NAME in {getattr(c, "name", c) for c in client.list_collections()}:
+            client.delete_collection(COLLECTION_NAME)
+        _collection = client.get_or_create_collection(name=COLLECTION_NAME, metadata={"hnsw:space": "cosine"})
+    return _collection
+
+
+# Multi-worker mode: encode + search go to the shared index server instead
+REMOTE_INDEX = is_remote_client()
+_remote_client = IndexClient() if REMOTE_INDEX else None
+
+# Concurrent /ask requests share batched forward passes for their query encodes
+if REMOTE_INDEX:
+    query_encoder = RemoteEncoder(_remote_client)
+else:
+    query_encoder = EmbeddingBatcher(
+        lambda texts: get_model().encode(texts, show_progress_bar=False, normalize_embeddings=True)
+    )
 
 # ──────────────────────────────
-# Utility Functions
+# Single index writer
 # ──────────────────────────────
-def normalize_text(text: str) -> str:
-    """Normalize text for consistent fuzzy and lexical matching."""
-    text = unicodedata.normalize("NFKD", text)
-    text = text.replace("’", "'").replace("‘", "'").replace("`", "'")
-    text = re.sub(r"[^a-zA-Z0-9+ ']+", " ", text)
-    return text.lower().strip()
-
-
-def parse_timestamp(ts):
-    """Safely parse timestamps into timezone-aware datetime."""
-    if not ts:
-        return datetime.min.replace(tzinfo=timezone.utc)
+# Exactly one process per host may write chroma_store / the manifest.
+# The first one to take this (non-blocking, process-lifetime) lock is it.
+WRITER_LOCK_PATH = os.path.join(CHROMA_PATH, ".writer.lock")
+_writer_lock_fd = None
+
+
+def try_acquire_writer_lock():
+    """Become the index writer if no other process is; returns True on success."""
+    global _writer_lock_fd
+    if REMOTE_INDEX:
+        return False
+    if _writer_lock_fd is not None:
+        return True
+    os.makedirs(CHROMA_PATH, exist_ok=True)
+    fd = os.open(WRITER_LOCK_PATH, os.O_CREAT | os.O_RDWR, 0o644)
     try:
-        if isinstance(ts, datetime):
-            return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
-        ts = str(ts).replace("Z", "+00:00")
-        return date_parser.parse(ts)
-    except Exception:
-        return datetime.min.replace(tzinfo=timezone.utc)
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return False
+    _writer_lock_fd = fd
+    return True
+
+
+def require_writer():
+    if not try_acquire_writer_lock():
+        raise RuntimeError("This process is not the index writer (another process holds the writer lock).")
+
+# Stored vectors come back with every query so centroid expansion
+# never has to re-encode the retrieved documents.
+QUERY_INCLUDE = ["documents", "metadatas", "distances", "embeddings"]
+
+_numpy_store = None
+_message_store = None
+_shared_reader = False
+_lexical_index = None
+_remote_backend = RemoteSearchBackend(_remote_client) if REMOTE_INDEX else None
+
+
+def use_message_store(store):
+    """
+    Serve the NumPy backend straight from a MessageStore's co-located embeddings,
+    and (re)build the BM25 index over its messages.
+    """
+    global _message_store, _numpy_store, _lexical_index
+    lexical = None
+    if HYBRID_MODE != "off":
+        t0 = time.perf_counter()
+        lexical = BM25Index.from_message_store(store)
+        metrics.set_gauge("lexical_index_build_seconds", round(time.perf_counter() - t0, 3))
+        log.info(f"🔤 Built BM25 index over {lexical.size} messages ({len(lexical.partitions) - 1} members).")
+    _message_store = store
+    _numpy_store = None
+    _lexical_index = lexical
+
+
+def use_shared_vectors():
+    """
+    Reader workers (another process holds the writer lock) search the shared
+    message store's memory-mapped vectors whatever RETRIEVAL_BACKEND says:
+    their own Chroma client would keep serving its HNSW snapshot while the
+    writer changes `chroma_store/`. Each `use_message_store` refresh remaps them.
+    """
+    global _shared_reader, _numpy_store
+    _shared_reader = True
+    _numpy_store = None
+
+
+def current_message_store():
+    """The MessageStore last passed to `use_message_store` (None before startup)."""
+    return _message_store
+
+
+def colocate_embeddings(store, force=False, batch_size=5000, previous=None, changed_ids=()):
+    """
+    Copy the indexed vectors into the message store (row-aligned, memory-mapped)
+    unless it already holds them for the current embedder.
+    With `previous` (the store this one replaces) its vectors are carried over
+    by message id, and only new ids and `changed_ids` are read from Chroma,
+    so a refresh costs in proportion to what changed.
+    Returns the (possibly reopened) store.
+    """
+    embedder_id = f"{EMBED_MODEL}@{EMBED_BACKEND}"
+    if not force and store.has_embeddings and store.meta.get("embeddings", {}).get("model") == embedder_id:
+        return store
+    require_writer()
+
+    vectors = {}
+    if (
+        previous is not None and previous.has_embeddings
+        and previous.meta.get("embeddings", {}).get("model") == embedder_id
+    ):
+        changed_ids = set(changed_ids)
+        prev_emb = previous.embeddings
+        vectors = {
+            doc_id: prev_emb[row]  # views into the old mmap; copied once by write_embeddings
+            for row, doc_id in enumerate(previous.column("id"))
+            if doc_id not in changed_ids
+        }
+    carried = len(vectors)
+
+    collection = get_collection()
+    missing = [doc_id for doc_id in store.column("id") if doc_id not in vectors]
+    for i in range(0, len(missing), batch_size):
+        got = collection.get(ids=missing[i:i + batch_size], include=["embeddings"])
+        vectors.update(zip(got["ids"], got["embeddings"]))
+    if not vectors:
+        return store
+
+    store = store.write_embeddings(vectors, embedder_id)
+    log.info(f"🧮 Co-located {len(store)} embeddings in the message store "
+             f"({min(carried, len(store))} carried over, {len(missing)} read from the index).")
+    return store
+
+
+def search_backend():
+    """
+    Return the object retrieval queries go through.
+    Both backends expose the same `query` / `get` interface.
+    """
+    global _numpy_store
+    if REMOTE_INDEX:
+        return _remote_backend
+    if RETRIEVAL_BACKEND != "numpy" and not _shared_reader:
+        return get_collection()
+
+    if _numpy_store is None:
+        if _message_store is not None and _message_store.has_embeddings and VECTOR_QUANTIZATION != "none":
+            _numpy_store = QuantizedVectorStore.from_message_store(_message_store, VECTOR_QUANTIZATION)
+            log.info(
+                f"🧮 Mapped {VECTOR_QUANTIZATION} vector store from the message store "
+                f"({_numpy_store.count()} vectors, {_numpy_store.memory_report()['compression']}× smaller scan tier)."
+            )
+        elif _message_store is not None and _message_store.has_embeddings:
+            _numpy_store = NumpyVectorStore.from_message_store(_message_store)
+            log.info(f"🧮 Mapped NumPy vector store from the message store ({_numpy_store.count()} vectors).")
+        elif NumpyVectorStore.exists(NUMPY_SIDECAR):
+            _numpy_store = NumpyVectorStore.load(NUMPY_SIDECAR)
+            log.info(f"🧮 Loaded NumPy vector store from sidecar ({_numpy_store.count()} vectors).")
+        else:
+            _numpy_store = NumpyVectorStore.from_collection(get_collection())
+            if _writer_lock_fd is not None:
+                _numpy_store.save(NUMPY_SIDECAR)
+            log.info(f"🧮 Built NumPy vector store from Chroma ({_numpy_store.count()} vectors).")
+    return _numpy_store
+
+
+def reset_search_backend():
+    """Drop the in-memory store so the next query reloads it from Chroma."""
+    global _numpy_store
+    _numpy_store = None
+    for ext in (".npy", ".json"):
+        if os.path.exists(NUMPY_SIDECAR + ext):
+            os.remove(NUMPY_SIDECAR + ext)
+
+# ──────────────────────────────
+# Utility Functions
+# ──────────────────────────────
+def stored_embeddings(results, ids, row=0):
+    """
+    Return the indexed vectors for `ids` without re-running the model.
+    Uses the embeddings returned alongside a query (its `row`-th query
+    embedding) when present, otherwise looks them up in the collection by id.
+    """
+    embs = results.get("embeddings")
+    if embs is not None and len(embs) > row and embs[row] is not None and len(embs[row]):
+        return np.asarray(embs[row][: len(ids)], dtype=np.float32)
+
+    stored = search_backend().get(ids=list(ids), include=["embeddings"])
+    by_id = dict(zip(stored["ids"], stored["embeddings"]))
+    return np.asarray([by_id[i] for i in ids if i in by_id], dtype=np.float32)
 
 # ──────────────────────────────
 # Build or Rebuild Vector Index
 # ──────────────────────────────
-def build_index(messages, batch_size=150):
+def message_metadata(m):
+    """Chroma metadata stored alongside each message vector."""
+    return {
+        "user_name": m["user_name"],
+        "user_id": m["user_id"],
+        "timestamp": m.get("timestamp"),
+        "ts_epoch": to_epoch(m.get("timestamp")),
+    }
+
+
+def content_hash(m):
+    """Stable fingerprint of everything we write to the index for a message."""
+    payload = "\x1f".join(
+        str(v) for v in (m["message"], m["user_name"], m["user_id"], m.get("timestamp"))
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def load_manifest():
+    """Read the index manifest (model name + per-message content hashes)."""
+    if not os.path.exists(MANIFEST_PATH):
+        return None
+    try:
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        log.warning(f"⚠️ Could not read index manifest ({e}) — ignoring it.")
+        return None
+
+
+def save_manifest(hashes):
+    tmp_path = MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(
+            {"model": EMBED_MODEL, "backend": EMBED_BACKEND, "schema": INDEX_SCHEMA, "entries": hashes}, f
+        )
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def write_embeddings(messages, batch_size=None, write=None, workers=None, queue_size=None, pooled=False):
     """
-    Builds the embedding index for all messages.
-    This runs once or whenever the messages or model are updated.
+    Embed `messages` in batches of `batch_size` (INDEX_BATCH_SIZE) and hand
+    each batch to `write` (default: upsert).
+    With more than one worker the pipelined process-pool indexer is used for
+    full builds (`pooled=True`) and for at least INDEX_POOL_MIN_DOCS messages;
+    smaller incremental syncs reuse the already loaded model.
     """
-    print("🔄 Building embedding index...")
-    if collection.count() > 0:
-        print("🧹 Clearing existing embeddings…")
-        try:
-            collection.delete(where={"user_name": {"$ne": None}})
-        except Exception as e:
-            print(f"⚠️ Could not clear collection: {e}")
-
-    texts = [m["message"] for m in messages]
-    ids = [m["id"] for m in messages]
-    metas = [
-        {
-            "user_name": m["user_name"],
-            "user_id": m["user_id"],
-            "timestamp": m.get("timestamp"),
-        }
-        for m in messages
-    ]
+    collection = get_collection()
+    write = write or collection.upsert
+    batch_size = batch_size or INDEX_BATCH_SIZE
+    workers = INDEX_WORKERS if workers is None else workers
+    if workers > 1 and (pooled or len(messages) >= INDEX_POOL_MIN_DOCS):
+        return bulk_index(
+            messages, write, EMBED_MODEL, message_metadata, backend=EMBED_BACKEND,
+            workers=workers, batch_size=batch_size, queue_size=queue_size,
+        )
 
-    total = len(texts)
+    total = len(messages)
     for i in tqdm(range(0, total, batch_size)):
-        batch_texts = texts[i:i + batch_size]
-        batch_ids = ids[i:i + batch_size]
-        batch_metas = metas[i:i + batch_size]
-        embeddings = model.encode(
+        batch = messages[i:i + batch_size]
+        batch_texts = [m["message"] for m in batch]
+        embeddings = get_model().encode(
             batch_texts,
             show_progress_bar=False,
             normalize_embeddings=True
         ).tolist()
-        collection.add(
+        write(
             documents=batch_texts,
             embeddings=embeddings,
-            ids=batch_ids,
-            metadatas=batch_metas,
+            ids=[m["id"] for m in batch],
+            metadatas=[message_metadata(m) for m in batch],
+        )
+
+
+def build_index(messages, batch_size=None, workers=None, queue_size=None):
+    """
+    Builds the embedding index for all messages.
+    This runs once or whenever the embedding model changes —
+    routine data refreshes go through `sync_index`.
+    """
+    require_writer()
+    log.info("🔄 Building embedding index...")
+    if get_collection().count() > 0:
+        log.info("🧹 Clearing existing embeddings…")
+    reset_collection()  # raises rather than leave old vectors next to the new ones
+
+    write_embeddings(
+        messages, batch_size=batch_size,
+        workers=workers, queue_size=queue_size, pooled=True,
+    )
+    save_manifest({m["id"]: content_hash(m) for m in messages})
+
+    reset_search_backend()
+    log.info(f"✅ Indexed {len(messages)} messages successfully using {EMBED_MODEL}.")
+
+
+def sync_index(messages, batch_size=None):
+    """
+    Bring the index in line with `messages` incrementally.
+      1️⃣ Full rebuild only if there is no index or EMBED_MODEL / EMBED_BACKEND changed.
+      2️⃣ Embed + upsert new or edited messages (by content hash).
+      3️⃣ Delete messages that no longer exist.
+    Returns a summary dict of what changed, including the affected members.
+    """
+    require_writer()
+    batch_size = batch_size or INDEX_BATCH_SIZE
+    manifest = load_manifest()
+    collection = get_collection()
+
+    if manifest is None and collection.count() > 0:
+        # Index predates the manifest: adopt it by hashing what is stored.
+        log.info("📝 No index manifest — fingerprinting existing Chroma entries…")
+        stored = collection.get(include=["documents", "metadatas"])
+        manifest = {
+            "model": EMBED_MODEL,
+            "backend": "torch",
+            "schema": 1,
+            "entries": {
+                doc_id: content_hash({**meta, "id": doc_id, "message": doc})
+                for doc_id, doc, meta in zip(stored["ids"], stored["documents"], stored["metadatas"])
+            },
+        }
+
+    # Vectors from different models or backends must never mix in one index
+    indexed_with = manifest and (manifest.get("model"), manifest.get("backend", "torch"))
+    if indexed_with != (EMBED_MODEL, EMBED_BACKEND):
+        reason = (
+            "no index found" if manifest is None
+            else f"embedder changed ({indexed_with[0]}/{indexed_with[1]} → {EMBED_MODEL}/{EMBED_BACKEND})"
         )
+        log.info(f"🧠 Full rebuild required: {reason}.")
+        build_index(messages, batch_size=batch_size)
+        return {
+            "rebuilt": True,
+            "upserted": len(messages),
+            "deleted": 0,
+            "changed_users": sorted({m["user_name"] for m in messages}),
+            "changed_ids": [m["id"] for m in messages],
+        }
+
+    indexed = manifest.get("entries", {})
+    current = {m["id"]: content_hash(m) for m in messages}
+
+    changed = [m for m in messages if indexed.get(m["id"]) != current[m["id"]]]
+    removed = [doc_id for doc_id in indexed if doc_id not in current]
+
+    if changed:
+        log.info(f"➕ Embedding {len(changed)} new or updated messages…")
+        write_embeddings(changed, batch_size=batch_size)
+    changed_users = {m["user_name"] for m in changed}
+    if removed:
+        log.info(f"➖ Removing {len(removed)} deleted messages…")
+        gone = collection.get(ids=removed, include=["metadatas"])
+        changed_users.update(meta.get("user_name") for meta in gone["metadatas"])
+        for i in range(0, len(removed), batch_size):
+            collection.delete(ids=removed[i:i + batch_size])
+
+    if manifest.get("schema", 1) < INDEX_SCHEMA:
+        # Metadata-only migration (e.g. ts_epoch) — vectors are unchanged
+        changed_ids = {m["id"] for m in changed}
+        stale = [m for m in messages if m["id"] in indexed and m["id"] not in changed_ids]
+        log.info(f"🔧 Migrating metadata for {len(stale)} indexed messages to schema {INDEX_SCHEMA}…")
+        for i in range(0, len(stale), batch_size):
+            batch = stale[i:i + batch_size]
+            collection.update(ids=[m["id"] for m in batch], metadatas=[message_metadata(m) for m in batch])
+        reset_search_backend()
+
+    if changed or removed or indexed != current or manifest.get("schema", 1) < INDEX_SCHEMA:
+        save_manifest(current)
+    if changed or removed:
+        reset_search_backend()
 
-    print(f"✅ Indexed {total} messages successfully using {EMBED_MODEL}.")
+    log.info(f"✅ Index in sync ({len(current)} messages, {len(changed)} upserted, {len(removed)} deleted).")
+    return {
+        "rebuilt": False,
+        "upserted": len(changed),
+        "deleted": len(removed),
+        "changed_users": sorted(u for u in changed_users if u),
+        "changed_ids": [m["id"] for m in changed],
+    }
 
 # ──────────────────────────────
 # User Detection
 # ──────────────────────────────
+_name_index = None
+
+
+def build_name_index(all_user_names):
+    """(Re)build the member-name index; call whenever the member list changes."""
+    global _name_index
+    _name_index = NameIndex(all_user_names)
+    log.info(f"🗂️ Built name index for {len(all_user_names)} members.")
+    return _name_index
+
+
 def detect_user_name(question, all_user_names):
     """
     Detect which member name is referenced in the question.
-    Hybrid approach:
-      1️⃣ Literal substring check (most reliable)
+    Hybrid approach over a precompiled NameIndex:
+      1️⃣ Literal / partial name-part match (most reliable)
       2️⃣ Fuzzy fallback (for partial or misspelled matches)
+    The index is rebuilt automatically if a new member list is passed in.
     """
-    norm_q = normalize_text(question)
-    best_match, best_score = None, 0
-
-    # 1️⃣ Literal check first
-    for u in all_user_names:
-        if u.lower() in question.lower():
-            print(f"🧭 Detected user literally: {u}")
-            return u
-
-        # check for partial match like "thiago" in "thiago's"
-        u_parts = normalize_text(u).split()
-        for part in u_parts:
-            if re.search(rf"\b{part}\b", norm_q):
-                print(f"🧭 Detected user (partial literal): {u}")
-                return u
-
-    # 2️⃣ Fuzzy fallback (only if literal match fails)
-    for u in all_user_names:
-        u_norm = normalize_text(u)
-        score = fuzz.partial_ratio(u_norm, norm_q)
-        if score > best_score:
-            best_score, best_match = score, u
-
-    if best_score >= 70:
-        print(f"🧭 Fuzzy-detected user: {best_match} (score {best_score})")
-        return best_match
-
-    print("⚠️ No user detected.")
+    index = _name_index
+    if index is None or index.is_stale(all_user_names):
+        index = build_name_index(all_user_names)
+
+    user, how = index.match(question)
+    if user:
+        log.debug("🧭 Detected user (%s): %s", how, user)
+        return user
+
+    log.debug("⚠️ No user detected.")
     return None
 
 # ──────────────────────────────
 # Retrieval Logic
 # ──────────────────────────────
-def retrieve_relevant_messages(question, top_k=5, user_name=None):
+def search_filter(user_name=None, window=None):
+    """Chroma `where` clause for an optional member and epoch range."""
+    clauses = []
+    if user_name:
+        clauses.append({"user_name": user_name})
+    if window:
+        clauses.append({"ts_epoch": {"$gte": window[0]}})
+        clauses.append({"ts_epoch": {"$lte": window[1]}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+# ──────────────────────────────
+# Lexical (BM25) retrieval + fusion
+# ──────────────────────────────
+def lexical_results(index, hits):
+    """BM25 hits as a single-query, Chroma-shaped result (distance = -BM25, lower is better)."""
+    store = index.store
+    rows = [r for r, _ in hits]
+    metadatas = store.metadata_view()
+    results = {
+        "ids": [[store.columns["id"][r] for r in rows]],
+        "documents": [[store.columns["message"][r] for r in rows]],
+        "metadatas": [[metadatas[r] for r in rows]],
+        "distances": [[-score for _, score in hits]],
+    }
+    if store.has_embeddings:
+        results["embeddings"] = [np.asarray(store.embeddings[rows], dtype=np.float32)]
+    return results
+
+
+def fuse_results(dense, index, hits, n_results):
     """
-    High-accuracy semantic retrieval pipeline (with detailed timing).
-      1️⃣ Encode the query.
-      2️⃣ Restrict search to user (with fallback to global).
-      3️⃣ Expand via centroid similarity for context.
-      4️⃣ Rank by recency + relevance.
-      5️⃣ Sort newest-first for clarity.
+    Reciprocal-rank fusion of one dense query result with BM25 hits:
+    score = Σ 1 / (RRF_K + rank) over the lists a message appears in.
+    Returns the top `n_results` as a Chroma-shaped result whose distance
+    is -score, so lower is still better.
     """
+    lexical = lexical_results(index, hits)
+    fused, source = {}, {}
+    for result in (dense, lexical):
+        for rank, doc_id in enumerate(result["ids"][0]):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+            source.setdefault(doc_id, (result, rank))
 
-    print(f"\n🔍 Starting retrieval for question: '{question}'")
-    start_total = time.perf_counter()
+    top = sorted(fused, key=fused.get, reverse=True)[:n_results]
+    with_embeddings = all(
+        r.get("embeddings") is not None and len(r["embeddings"]) and r["embeddings"][0] is not None
+        for r in (dense, lexical)
+    )
+    out = {key: [[]] for key in ("ids", "documents", "metadatas", "distances")}
+    embeddings = []
+    for doc_id in top:
+        result, rank = source[doc_id]
+        out["ids"][0].append(doc_id)
+        out["documents"][0].append(result["documents"][0][rank])
+        out["metadatas"][0].append(result["metadatas"][0][rank])
+        out["distances"][0].append(-fused[doc_id])
+        if with_embeddings:
+            embeddings.append(result["embeddings"][0][rank])
+    if with_embeddings:
+        out["embeddings"] = [np.asarray(embeddings, dtype=np.float32)]
+    return out
 
-    # 1️⃣ Encode question
-    t0 = time.perf_counter()
-    q_text = f"{user_name}: {question}" if user_name else question
-    q_emb = model.encode(q_text, normalize_embeddings=True).tolist()
-    t1 = time.perf_counter()
-    print(f"⏱️ [Step 1] Query embedding took {t1 - t0:.3f}s")
 
-    # 2️⃣ Primary search — within detected user's messages
-    if user_name:
-        print(f"🎯 Searching within {user_name}'s messages…")
-        query = {
-            "query_embeddings": [q_emb],
-            "n_results": top_k * 3,
-            "where": {"user_name": user_name},
-        }
-        t2 = time.perf_counter()
-        results = collection.query(**query)
-        t3 = time.perf_counter()
-        print(f"⏱️ [Step 2] User-specific Chroma query took {t3 - t2:.3f}s")
-    else:
-        t2 = time.perf_counter()
-        results = collection.query(query_embeddings=[q_emb], n_results=top_k * 3)
-        t3 = time.perf_counter()
-        print(f"⏱️ [Step 2] Global Chroma query took {t3 - t2:.3f}s")
-
-    # 3️⃣ Fallback to global if no user match
-    if not results.get("documents"):
-        print("⚠️ No user-specific matches — falling back to global search.")
-        t4 = time.perf_counter()
-        results = collection.query(query_embeddings=[q_emb], n_results=top_k * 3)
-        t5 = time.perf_counter()
-        print(f"⏱️ [Step 3] Fallback global query took {t5 - t4:.3f}s")
-    else:
-        t5 = t3
+def lexical_fast_path(index, question, hits, user_name):
+    """True when HYBRID_MODE=fast and the lexical hits alone are confident enough."""
+    if HYBRID_MODE != "fast" or index is None:
+        return False
+    if index.is_confident(question, hits, user_name, LEXICAL_FAST_MIN_SCORE):
+        metrics.inc("retrieval_lexical_fast_path")
+        return True
+    return False
 
-    # Extract results
-    docs = results["documents"][0]
-    metas = results["metadatas"][0]
-    scores = results.get("distances", [[]])[0]
-    print(f"📦 Retrieved {len(docs)} initial results.")
 
-    # 4️⃣ Centroid expansion for topical context
-    t6 = time.perf_counter()
-    if len(docs) > 1:
-        seed_embs = model.encode(
-            docs[: min(len(docs), 12)],
-            show_progress_bar=False,
-            normalize_embeddings=True,
-        )
-        centroid = np.mean(seed_embs, axis=0).tolist()
-        expand_results = collection.query(
-            query_embeddings=[centroid],
-            n_results=top_k,
-            where={"user_name": user_name} if user_name else None,
-        )
+def centroid_of(results, ids, row=0):
+    """Mean of the stored vectors of a query's top hits (seed for centroid expansion)."""
+    return np.mean(stored_embeddings(results, ids[:12], row), axis=0).tolist()
+
+
+def rank_results(results, expand_results=None, user_name=None, limit=10):
+    """
+    Turn one query's hits (plus its centroid-expansion hits) into context messages:
+    combine + score, deduplicate by text, sort newest-first, keep the member's own.
+    The two lists carry distances on different scales (cosine, -RRF, -BM25), so
+    every message is scored by reciprocal rank instead: `score` is
+    -Σ 1 / (RRF_K + rank) over the lists it appears in, lower is better.
+    """
+    docs = list(results["documents"][0])
+    metas = list(results["metadatas"][0])
+    ids = list(results["ids"][0])
+    if expand_results is not None:
         docs += expand_results["documents"][0]
         metas += expand_results["metadatas"][0]
-        scores += expand_results.get("distances", [[]])[0]
-        t7 = time.perf_counter()
-        print(f"⏱️ [Step 4] Centroid expansion query took {t7 - t6:.3f}s")
-    else:
-        t7 = t6
+        ids += expand_results["ids"][0]
 
-    # 5️⃣ Combine + score
-    t8 = time.perf_counter()
-    now = datetime.now(timezone.utc)
+    rrf = {}
+    for hits in (results, expand_results):
+        for rank, doc_id in enumerate(hits["ids"][0] if hits is not None else ()):
+            rrf[doc_id] = rrf.get(doc_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+
+    # Combine + score
     combined = []
-    for d, m, s in zip(docs, metas, scores):
-        ts = parse_timestamp(m.get("timestamp"))
+    for doc_id, d, m in zip(ids, docs, metas):
+        # ts_epoch is precomputed at ingest; only legacy rows fall back to ISO parsing
+        epoch = m.get("ts_epoch")
+        if epoch is None:
+            epoch = to_epoch(m.get("timestamp"))
         combined.append(
             {
+                "id": doc_id,
                 "text": d,
                 "user_name": m.get("user_name"),
                 "user_id": m.get("user_id"),
-                "timestamp": ts,
-                "score": s,
+                "timestamp": from_epoch(epoch),
+                "ts_epoch": epoch,
+                "score": -rrf[doc_id],
             }
         )
-    t9 = time.perf_counter()
-    print(f"⏱️ [Step 5] Combine + scoring took {t9 - t8:.3f}s")
 
-    # 6️⃣ Deduplicate
-    t10 = time.perf_counter()
+    # Deduplicate
     seen = set()
     unique = []
     for c in combined:
         if c["text"] not in seen:
             unique.append(c)
             seen.add(c["text"])
-    t11 = time.perf_counter()
-    print(f"⏱️ [Step 6] Deduplication took {t11 - t10:.3f}s")
 
-    # 7️⃣ Sort newest-first
-    t12 = time.perf_counter()
-    unique.sort(key=lambda x: (-x["timestamp"].timestamp(), x["score"]))
-    t13 = time.perf_counter()
-    print(f"⏱️ [Step 7] Sorting took {t13 - t12:.3f}s")
+    # Sort newest-first
+    unique.sort(key=lambda x: (-x["ts_epoch"], x["score"]))
 
-    # 8️⃣ Filter user-specific
+    # Filter user-specific
     if user_name:
         unique = [u for u in unique if u["user_name"] == user_name]
 
-    final = unique[:10]
+    return unique[:limit]
 
-    # 🕒 Total
-    total = time.perf_counter() - start_total
-    print(f"✅ [Total Retrieval Time] {total:.3f}s for user {user_name or 'unknown'} ({len(final)} messages).")
 
-    # Print sample
-    for msg in final[:5]:
-        ts = msg["timestamp"].isoformat() if msg["timestamp"] != datetime.min else "N/A"
-        print(f"  - [{ts}] {msg['user_name']}: {msg['text'][:90]}")
+def retrieve_relevant_messages(question, top_k=5, user_name=None, return_embedding=False):
+    """
+    High-accuracy semantic retrieval pipeline (each stage timed as a metrics span).
+      1️⃣ Look the question up in the member's BM25 partition; in "fast"
+         mode a confident lexical hit skips the encode and vector search.
+      2️⃣ Encode the query.
+      3️⃣ Restrict search to user (with fallback to global) and fuse with
+         the lexical hits by reciprocal rank.
+      4️⃣ Expand via centroid similarity for context.
+      5️⃣ Rank by recency + relevance, newest-first.
+    Relative dates in the question ("last month", "in March") become a
+    ts_epoch range filter on every search, dropped again if nothing matches.
+    Under a request deadline (deadline.py) the optional stages — the dense
+    encode when lexical hits exist, the global fallback and centroid
+    expansion — are skipped once they no longer fit the remaining budget.
+    With `return_embedding=True` returns `(messages, query_embedding)`;
+    the embedding is None when the lexical results were used alone.
+    """
+
+    log.debug("🔍 Starting retrieval for question: '%s'", question)
+    backend = search_backend()
+    window = parse_time_window(question) if TIME_FILTER else None
+    if window:
+        log.debug("📅 Time window: %s → %s", from_epoch(window[0]).date(), from_epoch(window[1]).date())
+
+    # 1️⃣ Lexical lookup (sub-millisecond, no model)
+    lex_index, lexical, lex_window = _lexical_index, None, window
+    if lex_index is not None:
+        with metrics.span("lexical"):
+            lexical = lex_index.search(question, user_name, k=top_k * 3, window=window)
+
+    q_emb = None
+    if lexical_fast_path(lex_index, question, lexical, user_name):
+        log.debug("⚡ Confident lexical match — skipping the dense encode.")
+        results = lexical_results(lex_index, lexical)
+    elif lexical and not deadline.allows("query_encode"):
+        log.debug("⏳ Deadline too close for the dense encode — using the lexical hits.")
+        results = lexical_results(lex_index, lexical)
+    else:
+        # 2️⃣ Encode question
+        with metrics.span("query_encode"):
+            q_text = f"{user_name}: {question}" if user_name else question
+            q_emb = query_encoder.encode(q_text).tolist()
+
+        # 3️⃣ Primary search — within detected user's messages
+        if user_name:
+            log.debug("🎯 Searching within %s's messages…", user_name)
+            query = {
+                "query_embeddings": [q_emb],
+                "n_results": top_k * 3,
+                "where": search_filter(user_name, window),
+                "include": QUERY_INCLUDE,
+            }
+            with metrics.span("search_user"):
+                results = backend.query(**query)
+            if window and not results["ids"][0]:
+                log.debug("⚠️ Nothing in the time window — searching the full history.")
+                window = None
+                query["where"] = search_filter(user_name, None)
+                with metrics.span("search_user"):
+                    results = backend.query(**query)
+        else:
+            with metrics.span("search_global"):
+                results = backend.query(
+                    query_embeddings=[q_emb], n_results=top_k * 3,
+                    where=search_filter(None, window), include=QUERY_INCLUDE,
+                )
+            if window and not results["ids"][0]:
+                log.debug("⚠️ Nothing in the time window — searching the full history.")
+                window = None
+                with metrics.span("search_global"):
+                    results = backend.query(
+                        query_embeddings=[q_emb], n_results=top_k * 3, include=QUERY_INCLUDE
+                    )
+
+        # Fallback to global if no user match
+        if not results["ids"][0] and deadline.allows("search_fallback"):
+            log.debug("⚠️ No user-specific matches — falling back to global search.")
+            with metrics.span("search_fallback"):
+                results = backend.query(
+                    query_embeddings=[q_emb], n_results=top_k * 3, include=QUERY_INCLUDE
+                )
+
+        if lexical is not None:
+            if window != lex_window:  # the dense search dropped the time window
+                lexical = lex_index.search(question, user_name, k=top_k * 3, window=window)
+            if lexical:
+                results = fuse_results(results, lex_index, lexical, top_k * 3)
+
+    docs = results["documents"][0]
+    ids = list(results["ids"][0])
+    log.debug("📦 Retrieved %d initial results.", len(docs))
+
+    # 4️⃣ Centroid expansion for topical context
+    expand_results = None
+    if len(docs) > 1 and deadline.allows("centroid_expansion"):
+        with metrics.span("centroid_expansion"):
+            expand_results = backend.query(
+                query_embeddings=[centroid_of(results, ids)],
+                n_results=top_k,
+                where=search_filter(user_name, window),
+            )
+
+    # 5️⃣ Combine, deduplicate, sort, filter
+    with metrics.span("scoring"):
+        final = rank_results(results, expand_results, user_name)
+    log.debug("✅ Retrieved %d messages for user %s.", len(final), user_name or "unknown")
+
+    if log.isEnabledFor(logging.DEBUG):
+        for msg in final[:5]:
+            ts = msg["timestamp"].isoformat() if msg["ts_epoch"] else "N/A"
+            log.debug("  - [%s] %s: %s", ts, msg["user_name"], msg["text"][:90])
+
+    if return_embedding:
+        return final, q_emb
+    return final
+
+
+def _query_row(results, row):
+    """The `row`-th query of a multi-vector result, shaped like a single-query result."""
+    return {
+        key: [val[row]] if key in ("ids", "documents", "metadatas", "distances", "embeddings") and val is not None else val
+        for key, val in results.items()
+    }
+
+
+def retrieve_relevant_messages_batch(questions, user_names=None, top_k=5):
+    """
+    `retrieve_relevant_messages` for many questions at once.
+      1️⃣ BM25 lookup per question (lexical fast-path hits skip 2–3).
+      2️⃣ Encode the remaining questions in one forward pass.
+      3️⃣ One multi-vector search per (member, time window) group, fused
+         with each question's lexical hits.
+      4️⃣ One multi-vector centroid expansion per group.
+    Questions whose time window matched nothing, or whose group search
+    failed, are re-run on their own so a failure stays with its question.
+    Returns, per question, `(messages, query_embedding)` or the exception it raised.
+    """
+    backend = search_backend()
+    user_names = user_names or [None] * len(questions)
+    windows = [parse_time_window(q) if TIME_FILTER else None for q in questions]
+    out = [None] * len(questions)
+
+    lex_index = _lexical_index
+    lexical = [None] * len(questions)
+    if lex_index is not None:
+        with metrics.span("lexical"):
+            lexical = [
+                lex_index.search(q, u, k=top_k * 3, window=w) for q, u, w in zip(questions, user_names, windows)
+            ]
+    dense = [
+        i for i in range(len(questions))
+        if not lexical_fast_path(lex_index, questions[i], lexical[i], user_names[i])
+    ]
+
+    q_embs = [None] * len(questions)
+    if dense:
+        with metrics.span("query_encode_batch"):
+            texts = [f"{user_names[i]}: {questions[i]}" if user_names[i] else questions[i] for i in dense]
+            for i, vec in zip(dense, np.asarray(query_encoder.encode_many(texts), dtype=np.float32).tolist()):
+                q_embs[i] = vec
+
+    groups = {}
+    for i in dense:
+        groups.setdefault((user_names[i], windows[i]), []).append(i)
+
+    first = [None] * len(questions)
+    expand = [None] * len(questions)
+    for (user_name, window), rows in groups.items():
+        try:
+            with metrics.span("search_batch"):
+                results = backend.query(
+                    query_embeddings=[q_embs[i] for i in rows], n_results=top_k * 3,
+                    where=search_filter(user_name, window), include=QUERY_INCLUDE,
+                )
+            for j, i in enumerate(rows):
+                row = _query_row(results, j)
+                if window and not row["ids"][0]:
+                    continue
+                first[i] = fuse_results(row, lex_index, lexical[i], top_k * 3) if lexical[i] else row
+
+            seeds = [i for i in rows if first[i] is not None and len(first[i]["ids"][0]) > 1]
+            if seeds:
+                with metrics.span("centroid_expansion_batch"):
+                    expanded = backend.query(
+                        query_embeddings=[centroid_of(first[i], first[i]["ids"][0]) for i in seeds],
+                        n_results=top_k, where=search_filter(user_name, window),
+                    )
+                for j, i in enumerate(seeds):
+                    expand[i] = _query_row(expanded, j)
+        except Exception as e:
+            log.warning(f"⚠️ Batched search failed for {user_name or 'global'} ({len(rows)} questions): {e}")
+            for i in rows:
+                first[i] = None
+
+    with metrics.span("scoring"):
+        for i, results in enumerate(first):
+            if results is not None:
+                out[i] = (rank_results(results, expand[i], user_names[i]), q_embs[i])
+
+    # Lexical fast path, empty time windows and failed groups go through the single-question path
+    for i, result in enumerate(out):
+        if result is None:
+            try:
+                out[i] = retrieve_relevant_messages(
+                    questions[i], top_k=top_k, user_name=user_names[i], return_embedding=True
+                )
+            except Exception as e:
+                out[i] = e
+    return out
+
+# ──────────────────────────────
+# Warmup
+# ──────────────────────────────
+def warmup():
+    """
+    Load the model and open the index, then run one dummy encode + search
+    so the first real request does not pay any cold-start cost.
+    Returns per-step timings in seconds.
+    """
+    timings = {}
+    t0 = time.perf_counter()
+    if not REMOTE_INDEX:
+        get_model()
+        if not _shared_reader:
+            get_collection()
+    timings["load"] = time.perf_counter() - t0
+
+    t1 = time.perf_counter()
+    q_emb = query_encoder.encode("warmup: upcoming trips").tolist()
+    backend = search_backend()
+    if backend.count() > 0:
+        backend.query(query_embeddings=[q_emb], n_results=1, include=QUERY_INCLUDE)
+    timings["encode_and_query"] = time.perf_counter() - t1
 
-    return final
\ No newline at end of file
+    log.info(f"🔥 Warmup done (load {timings['load']:.2f}s, first query {timings['encode_and_query']:.2f}s).")
+    return {k: round(v, 3) for k, v in timings.items()}
@@ -0,0 +1,34 @@
+import asyncio
+
+import metrics
+
+# ──────────────────────────────
+# Single-flight request coalescing
+# ──────────────────────────────
+class SingleFlight:
+    """
+    Runs at most one coroutine per key at a time.
+    Callers arriving while a key is in flight await the same task and
+    receive its result (or exception) instead of starting their own.
+    """
+
+    def __init__(self, name="singleflight"):
+        self.name = name
+        self._inflight = {}
+
+    async def do(self, key, coro_fn):
+        """Return `(result, coalesced)` where `coalesced` is True for followers."""
+        task = self._inflight.get(key)
+        if task is not None:
+            metrics.inc(f"{self.name}_coalesced")
+            return await asyncio.shield(task), True
+
+        task = asyncio.ensure_future(coro_fn())
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        metrics.inc(f"{self.name}_executions")
+        # Shielded so a disconnecting leader does not cancel the followers' work
+        return await asyncio.shield(task), False
+
+    def __len__(self):
+        return len(self._inflight)
@@ -0,0 +1,46 @@
+import numpy as np
+
+from bm25 import BM25Index
+
+TEXTS = [
+    "Please book a table at Nobu for four on Friday.",   # 0  Amira
+    "I need a private jet to Paris next week.",          # 1  Amira
+    "Book a table at Nobu again, it was great.",         # 2  Hans
+    "Arrange a Tesla for my stay in Zurich.",            # 3  Hans
+    "Cancel the Paris hotel, plans changed.",            # 4  Hans
+]
+SLICES = {"Amira": (0, 2), "Hans": (2, 5)}
+EPOCHS = np.array([100, 200, 300, 400, 500])
+
+
+def _index():
+    return BM25Index(TEXTS, slices=SLICES, ts_epoch=EPOCHS)
+
+
+def test_global_search_ranks_matching_rows():
+    rows = [row for row, _ in _index().search("table at Nobu", k=5)]
+    assert set(rows) == {0, 2}
+
+
+def test_search_stays_inside_the_member_partition():
+    index = _index()
+    assert [row for row, _ in index.search("Paris", user_name="Hans")] == [4]
+    assert [row for row, _ in index.search("Paris", user_name="Amira")] == [1]
+    assert index.search("Tesla", user_name="Amira") == []
+
+
+def test_scores_are_sorted_best_first_and_limited_to_k():
+    hits = _index().search("book table Nobu Paris jet", k=2)
+    assert len(hits) == 2
+    assert hits[0][1] >= hits[1][1]
+
+
+def test_time_window_filters_rows():
+    assert [row for row, _ in _index().search("Paris", window=(150, 250))] == [1]
+    assert _index().search("Paris", window=(1000, 2000)) == []
+
+
+def test_unknown_member_and_stopword_only_queries_return_nothing():
+    index = _index()
+    assert index.search("Nobu", user_name="Nobody") == []
+    assert index.search("the and of") == []
@@ -0,0 +1,45 @@
+import os
+import pickle
+
+import pytest
+
+from name_index import NameIndex, name_tokens
+
+CACHE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data_cache.pkl")
+
+
+@pytest.fixture(scope="module")
+def members():
+    if not os.path.exists(CACHE_FILE):
+        pytest.skip("data_cache.pkl is not available")
+    with open(CACHE_FILE, "rb") as f:
+        return sorted({m["user_name"] for m in pickle.load(f)})
+
+
+@pytest.fixture(scope="module")
+def index(members):
+    return NameIndex(members)
+
+
+def test_apostrophe_names_stay_whole():
+    assert name_tokens("lily o'sullivan") == ["lily", "o'sullivan"]
+    assert name_tokens("what did thiago's driver say") == ["what", "did", "thiago", "driver", "say"]
+
+
+def test_o_clock_does_not_match_an_apostrophe_name(index):
+    assert index.match("Who booked a table for 8 o'clock?") == (None, None)
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("What did Lily O'Sullivan ask for?", ("Lily O'Sullivan", "literal")),
+    ("Where is O’Sullivan going?", ("Lily O'Sullivan", "partial")),
+    ("What are Thiago's favorite restaurants?", ("Thiago Monteiro", "partial")),
+    ("How many cars does Vikram Desai have?", ("Vikram Desai", "literal")),
+])
+def test_members_are_matched(index, question, expected):
+    assert index.match(question) == expected
+
+
+def test_misspelled_name_falls_back_to_fuzzy(index):
+    name, how = index.match("What did Vikrum Dessai book?")
+    assert name == "Vikram Desai" and how.startswith("fuzzy")
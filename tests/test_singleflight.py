@@ -0,0 +1,31 @@
+import asyncio
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_run():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def main():
+        flight = SingleFlight("test")
+        results = await asyncio.gather(*(flight.do("q", work) for _ in range(5)))
+        return results, len(flight)
+
+    results, inflight = asyncio.run(main())
+    assert calls == [1]
+    assert sorted(coalesced for _, coalesced in results) == [False, True, True, True, True]
+    assert {value for value, _ in results} == {"answer"}
+    assert inflight == 0
+
+
+def test_different_keys_run_separately():
+    async def main():
+        flight = SingleFlight("test")
+        return await asyncio.gather(flight.do("a", lambda: asyncio.sleep(0, "A")), flight.do("b", lambda: asyncio.sleep(0, "B")))
+
+    assert asyncio.run(main()) == [("A", False), ("B", False)]
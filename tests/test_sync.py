@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from messages_stub import check_sync, synthetic_messages
+from utils import iter_json_items
+
+
+@pytest.mark.parametrize("max_limit", [None, 17])
+def test_full_and_incremental_sync_against_stub(max_limit):
+    report = check_sync(synthetic_messages(230), max_limit=max_limit, page_size=50, appended=25)
+    assert report["ok"] and report["messages"] == 255
+
+
+def _chunks(payload, size):
+    data = payload.encode("utf-8")
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+ITEMS = [
+    {"id": "a", "message": "Book the Ritz — 2 nights"},
+    {"id": "b", "message": "Café crème at 8 o'clock, {not json} [either]"},
+    {"id": "c", "message": "Dinner in Zürich 🍽️"},
+]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 10_000])
+@pytest.mark.parametrize("payload", [
+    json.dumps({"total": 3, "items": ITEMS}, ensure_ascii=False),
+    json.dumps(ITEMS, ensure_ascii=False),
+    "  \n" + json.dumps({"items": ITEMS, "total": 3}, indent=2, ensure_ascii=False),
+])
+def test_iter_json_items_across_chunk_boundaries(payload, size):
+    assert list(iter_json_items(_chunks(payload, size))) == ITEMS
+
+
+def test_iter_json_items_empty_page():
+    assert list(iter_json_items(_chunks('{"total": 0, "items": []}', 4))) == []
@@ -0,0 +1,37 @@
+from datetime import datetime, timezone
+
+from time_window import parse_time_window, from_epoch
+
+NOW = datetime(2025, 3, 19, 15, 30, tzinfo=timezone.utc)  # a Wednesday
+
+
+def _dates(window):
+    start, end = window
+    return from_epoch(start).date().isoformat(), from_epoch(end).date().isoformat()
+
+
+def test_no_time_reference():
+    assert parse_time_window("What are Layla's favorite restaurants?", now=NOW) is None
+
+
+def test_last_month_is_the_previous_calendar_month():
+    assert _dates(parse_time_window("What did Hans book last month?", now=NOW)) == ("2025-02-01", "2025-02-28")
+
+
+def test_last_week_starts_on_monday():
+    assert _dates(parse_time_window("Any requests last week?", now=NOW)) == ("2025-03-10", "2025-03-16")
+
+
+def test_past_n_days_ends_now():
+    start, end = parse_time_window("messages from the past 3 days", now=NOW)
+    assert end == int(NOW.timestamp()) - 1
+    assert start == int(NOW.timestamp()) - 3 * 86400
+
+
+def test_named_month_is_its_most_recent_occurrence():
+    assert _dates(parse_time_window("Where did Sophia travel in March?", now=NOW)) == ("2025-03-01", "2025-03-31")
+    assert _dates(parse_time_window("Where did Sophia travel in December?", now=NOW)) == ("2024-12-01", "2024-12-31")
+
+
+def test_named_month_with_year():
+    assert _dates(parse_time_window("What happened in May 2023?", now=NOW)) == ("2023-05-01", "2023-05-31")
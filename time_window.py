@@ -0,0 +1,102 @@
+import re
+from datetime import datetime, timedelta, timezone
+
+# ──────────────────────────────
+# Timestamp normalization
+# ──────────────────────────────
+def to_epoch(ts):
+    """ISO string / datetime → integer epoch seconds (0 when missing or invalid)."""
+    if not ts:
+        return 0
+    try:
+        if not isinstance(ts, datetime):
+            ts = datetime.fromisoformat(str(ts).replace("Z", "+00:00"))
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        return int(ts.timestamp())
+    except (ValueError, OverflowError, OSError):
+        return 0
+
+
+def from_epoch(epoch):
+    """Integer epoch seconds → timezone-aware datetime (datetime.min for 0)."""
+    if not epoch:
+        return datetime.min.replace(tzinfo=timezone.utc)
+    return datetime.fromtimestamp(epoch, tz=timezone.utc)
+
+# ──────────────────────────────
+# Relative date parsing
+# ──────────────────────────────
+MONTHS = {
+    name: i + 1
+    for i, names in enumerate([
+        ("january", "jan"), ("february", "feb"), ("march", "mar"), ("april", "apr"),
+        ("may",), ("june", "jun"), ("july", "jul"), ("august", "aug"),
+        ("september", "sep", "sept"), ("october", "oct"), ("november", "nov"), ("december", "dec"),
+    ])
+    for name in names
+}
+UNIT_DAYS = {"day": 1, "week": 7, "month": 30, "year": 365}
+
+_MONTH_RE = re.compile(
+    r"\b(?:in|during|since|for|of|from)\s+(" + "|".join(sorted(MONTHS, key=len, reverse=True)) + r")\b(?:\s+(\d{4}))?"
+)
+_PAST_N_RE = re.compile(r"\b(?:past|last|previous)\s+(\d+|a|one|two|three|few)\s+(day|week|month|year)s?\b")
+_WORD_NUM = {"a": 1, "one": 1, "two": 2, "three": 3, "few": 3}
+
+
+def _month_bounds(year, month):
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    end = datetime(year + (month == 12), month % 12 + 1, 1, tzinfo=timezone.utc)
+    return start, end
+
+
+def parse_time_window(question, now=None):
+    """
+    Detect a time range referenced in the question.
+    Returns `(start_epoch, end_epoch)` (inclusive) or None.
+    Handles: today / yesterday, this|last week|month|year,
+    past N days|weeks|months, and "in March [2025]".
+    """
+    now = now or datetime.now(timezone.utc)
+    q = question.lower()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    start = end = None
+
+    m = _PAST_N_RE.search(q)
+    if m:
+        n = _WORD_NUM.get(m.group(1)) or int(m.group(1))
+        start, end = now - timedelta(days=n * UNIT_DAYS[m.group(2)]), now
+    elif re.search(r"\btoday\b", q):
+        start, end = today, now
+    elif re.search(r"\byesterday\b", q):
+        start, end = today - timedelta(days=1), today
+    elif re.search(r"\bthis week\b", q):
+        start, end = today - timedelta(days=today.weekday()), now
+    elif re.search(r"\blast week\b", q):
+        this_week = today - timedelta(days=today.weekday())
+        start, end = this_week - timedelta(days=7), this_week
+    elif re.search(r"\bthis month\b", q):
+        start, end = today.replace(day=1), now
+    elif re.search(r"\blast month\b", q):
+        first = today.replace(day=1)
+        prev = first - timedelta(days=1)
+        start, end = _month_bounds(prev.year, prev.month)
+    elif re.search(r"\bthis year\b", q):
+        start, end = today.replace(month=1, day=1), now
+    elif re.search(r"\blast year\b", q):
+        start, end = datetime(now.year - 1, 1, 1, tzinfo=timezone.utc), datetime(now.year, 1, 1, tzinfo=timezone.utc)
+    else:
+        m = _MONTH_RE.search(q)
+        if m:
+            month = MONTHS[m.group(1)]
+            if m.group(2):
+                year = int(m.group(2))
+            else:
+                # most recent occurrence of that month (this year unless still ahead)
+                year = now.year if month <= now.month else now.year - 1
+            start, end = _month_bounds(year, month)
+
+    if start is None:
+        return None
+    return int(start.timestamp()), int(end.timestamp()) - 1
@@ -1,73 +1,241 @@
 # utils.py
 import os
+import logging
+import json
+import codecs
 import pickle
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from message_store import MessageStore
 
-API_URL = "https://november7-730026606190.europe-west1.run.app/messages"
-CACHE_FILE = "data_cache.pkl"
-CACHE_MAX_AGE_HOURS = 12  # auto-refresh cache after this many hours
+log = logging.getLogger("aurora.utils")
 
+# Overridable so the sync engine can be pointed at a local stand-in server
+API_URL = os.getenv("MESSAGES_API_URL", "https://november7-730026606190.europe-west1.run.app/messages")
+CACHE_FILE = "data_cache.pkl"  # legacy pickle cache, migrated into STORE_PATH
+STORE_PATH = "message_store"  # memory-mapped columnar store (see message_store.py)
+CACHE_MAX_AGE_HOURS = 12  # auto-refresh cache after this many hours
 
-def fetch_messages_from_api(limit_total: int = 3349):
+PAGE_SIZE = int(os.getenv("MESSAGES_PAGE_SIZE", "500"))
+FETCH_CONCURRENCY = int(os.getenv("MESSAGES_FETCH_CONCURRENCY", "4"))
+FETCH_TIMEOUT = (5, 30)  # (connect, read) seconds
+# Incremental syncs assume an append-only feed; a periodic full pass
+# picks up edits and deletions.
+FULL_RESYNC_HOURS = float(os.getenv("MESSAGES_FULL_RESYNC_HOURS", "168"))
+
+# ──────────────────────────────
+# HTTP session (pooled, with retries)
+# ──────────────────────────────
+_session = None
+
+
+def get_session():
+    global _session
+    if _session is None:
+        retry = Retry(
+            total=4,
+            backoff_factor=0.5,  # 0.5s, 1s, 2s, 4s
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET",),
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=max(FETCH_CONCURRENCY, 1))
+        _session = requests.Session()
+        _session.mount("http://", adapter)
+        _session.mount("https://", adapter)
+        _session.headers.update({"accept": "application/json"})
+    return _session
+
+# ──────────────────────────────
+# Streaming JSON parsing
+# ──────────────────────────────
+def iter_json_items(chunks):
     """
-    Fetch all messages in a single API request.
-    Attempts to pull all messages by setting limit=3349.
-    Falls back gracefully if the API enforces smaller limits.
+    Yield objects from a JSON response one at a time as bytes arrive.
+    Accepts either a top-level array or an object with an "items" array,
+    so the full payload is never held in memory.
     """
-    print(f"📡 Fetching all messages from API with limit={limit_total} (single request)...")
-
-    url = f"{API_URL}/?skip=0&limit={limit_total}"
-    headers = {"accept": "application/json"}
-    response = requests.get(url, headers=headers)
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf, pos, in_array = "", 0, False
+
+    for chunk in chunks:
+        buf = buf[pos:] + utf8.decode(chunk)
+        pos = 0
+
+        if not in_array:
+            start = buf.lstrip()
+            if start.startswith("["):
+                pos = buf.index("[") + 1
+            else:
+                key = buf.find('"items"')
+                bracket = buf.find("[", key) if key != -1 else -1
+                if bracket == -1:
+                    continue
+                pos = bracket + 1
+            in_array = True
+
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buf):
+                break
+            if buf[pos] == "]":
+                return
+            try:
+                item, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                break  # incomplete object — wait for more bytes
+            yield item
+
+# ──────────────────────────────
+# Paginated, concurrent fetch
+# ──────────────────────────────
+def _normalize(item):
+    # Normalize message text and user names
+    item["message"] = (item.get("message") or "").strip()
+    item["user_name"] = (item.get("user_name") or "").strip()
+    return item
 
-    if response.status_code in (404, 405):
-        print("⚠️ Pagination not supported — retrying base endpoint without params.")
-        response = requests.get(API_URL, headers=headers)
 
-    if response.status_code == 402:
-        raise RuntimeError("💰 API quota reached (HTTP 402 Payment Required).")
+def fetch_page(skip: int, limit: int):
+    """Fetch one `skip`/`limit` page, parsing items as they stream in."""
+    response = get_session().get(
+        f"{API_URL}/", params={"skip": skip, "limit": limit}, timeout=FETCH_TIMEOUT, stream=True
+    )
+    with response:
+        if response.status_code == 402:
+            raise RuntimeError("💰 API quota reached (HTTP 402 Payment Required).")
+        response.raise_for_status()
+        return [_normalize(item) for item in iter_json_items(response.iter_content(chunk_size=64 * 1024))]
 
-    response.raise_for_status()
-    data = response.json()
-    items = data.get("items", data)
 
-    # Normalize message text and user names
-    for item in items:
-        item["message"] = (item.get("message") or "").strip()
-        item["user_name"] = (item.get("user_name") or "").strip()
-
-    print(f"✅ Done! Total messages fetched: {len(items)}")
+def fetch_messages_from_api(skip: int = 0, page_size: int = PAGE_SIZE, concurrency: int = FETCH_CONCURRENCY):
+    """
+    Fetch every message from `skip` onward.
+    The first page is fetched alone: it gives the API's `total` and reveals a
+    server-side cap on `limit` (a short first page while more remain), which
+    then becomes the step between offsets. Later pages are requested
+    `concurrency` at a time over a pooled session (retries with backoff on
+    transient errors) until an empty page or `total` marks the end.
+    Falls back to the unpaginated endpoint if the API rejects skip/limit.
+    """
+    log.info(f"📡 Fetching messages from API (skip={skip}, page size {page_size}, {concurrency} concurrent)...")
+
+    session = get_session()
+    probe = session.get(f"{API_URL}/", params={"skip": skip, "limit": page_size}, timeout=FETCH_TIMEOUT)
+    if probe.status_code in (404, 405):
+        log.warning("⚠️ Pagination not supported — retrying base endpoint without params.")
+        response = session.get(API_URL, timeout=FETCH_TIMEOUT, stream=True)
+        with response:
+            response.raise_for_status()
+            items = [_normalize(i) for i in iter_json_items(response.iter_content(chunk_size=64 * 1024))]
+        return items[skip:]
+    if probe.status_code == 402:
+        raise RuntimeError("💰 API quota reached (HTTP 402 Payment Required).")
+    probe.raise_for_status()
+
+    body = probe.json()
+    first = body.get("items", []) if isinstance(body, dict) else body
+    total = body.get("total") if isinstance(body, dict) else None
+    items = [_normalize(item) for item in first]
+    if not items or (total is not None and skip + len(items) >= total):
+        log.info(f"✅ Done! Total messages fetched: {len(items)}")
+        return items
+
+    step = len(items) if len(items) < page_size else page_size  # the server capped `limit`
+    if step < page_size:
+        log.warning(f"⚠️ API returns at most {step} messages per page — paging by {step}.")
+
+    next_skip = skip + len(items)
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1), thread_name_prefix="fetch") as pool:
+        while True:
+            offsets = [next_skip + i * step for i in range(max(concurrency, 1))]
+            if total is not None:
+                offsets = [off for off in offsets if off < total] or offsets[:1]
+            pages = list(pool.map(lambda off: fetch_page(off, step), offsets))
+            for page in pages:
+                items.extend(page)
+            next_skip = offsets[-1] + step
+            if any(not page for page in pages) or (total is not None and next_skip >= total):
+                break
+
+    if total is not None and skip + len(items) < total:
+        log.warning(f"⚠️ Fetched {len(items)} messages but the API reports {total - skip} past skip={skip}.")
+    log.info(f"✅ Done! Total messages fetched: {len(items)}")
     return items
 
-
-def is_cache_fresh() -> bool:
-    """Returns True if cache exists and is newer than CACHE_MAX_AGE_HOURS."""
-    if not os.path.exists(CACHE_FILE):
+# ──────────────────────────────
+# Incremental sync into the store
+# ──────────────────────────────
+def sync_messages(force_full: bool = False, page_size: int = PAGE_SIZE):
+    """
+    Bring STORE_PATH up to date with the API.
+    Normally fetches only messages past the stored high-water mark
+    (`next_skip`); does a full pass when there is no store, when forced,
+    or every FULL_RESYNC_HOURS.
+    Returns `(store, changed)`.
+    """
+    existing = MessageStore(STORE_PATH) if MessageStore.exists(STORE_PATH) else None
+    state = existing.sync_state if existing is not None else {}
+    now = datetime.now()
+
+    last_full = state.get("last_full_sync")
+    full_due = not last_full or now - datetime.fromisoformat(last_full) > timedelta(hours=FULL_RESYNC_HOURS)
+    if existing is None or force_full or full_due or "next_skip" not in state:
+        messages = fetch_messages_from_api(skip=0, page_size=page_size)
+        state = {"next_skip": len(messages), "last_full_sync": now.isoformat()}
+    else:
+        new = fetch_messages_from_api(skip=state["next_skip"], page_size=page_size)
+        if not new:
+            existing.touch()
+            log.debug(f"💤 No new messages since the last sync ({len(existing)} stored).")
+            return existing, False
+        known = {m["id"]: m for m in existing}
+        known.update((m["id"], m) for m in new)
+        messages = list(known.values())
+        state = {**state, "next_skip": state["next_skip"] + len(new)}
+
+    state["last_sync"] = now.isoformat()
+    store = MessageStore.write(STORE_PATH, messages, sync_state=state)
+    log.info(f"💾 Stored {len(store)} messages in {STORE_PATH}.")
+    return store, True
+
+
+def is_cache_fresh(path: str = None) -> bool:
+    """Returns True if the store (or `path`) exists and is newer than CACHE_MAX_AGE_HOURS."""
+    path = path or os.path.join(STORE_PATH, "meta.json")
+    if not os.path.exists(path):
         return False
-    file_age = datetime.now() - datetime.fromtimestamp(os.path.getmtime(CACHE_FILE))
+    file_age = datetime.now() - datetime.fromtimestamp(os.path.getmtime(path))
     return file_age < timedelta(hours=CACHE_MAX_AGE_HOURS)
 
 
-def load_messages(force_refresh: bool = False, limit_per_page: int = 3349):
+def load_messages(force_refresh: bool = False, limit_per_page: int = PAGE_SIZE):
     """
-    Load messages from cache (if fresh) or fetch from API.
+    Load messages from the columnar store (if fresh) or sync from the API.
+    Returns a memory-mapped MessageStore, which behaves like a list of message dicts.
     """
     if not force_refresh and is_cache_fresh():
         try:
-            with open(CACHE_FILE, "rb") as f:
-                messages = pickle.load(f)
-            print(f"💾 Loaded {len(messages)} messages from cache.")
-            return messages
+            store = MessageStore(STORE_PATH)
+            log.info(f"💾 Loaded {len(store)} messages from {STORE_PATH} (memory-mapped).")
+            return store
         except Exception as e:
-            print(f"⚠️ Cache read error ({e}) — refetching...")
+            log.warning(f"⚠️ Store read error ({e}) — refetching...")
 
-    # 🚀 Fetch all messages (no artificial cap)
-    messages = fetch_messages_from_api(limit_total=limit_per_page)
-
-    # Save to cache
-    with open(CACHE_FILE, "wb") as f:
-        pickle.dump(messages, f)
-    print(f"💾 Cached {len(messages)} messages to {CACHE_FILE}.")
+    # One-time migration from the old pickle cache
+    if not force_refresh and not MessageStore.exists(STORE_PATH) and is_cache_fresh(CACHE_FILE):
+        try:
+            with open(CACHE_FILE, "rb") as f:
+                store = MessageStore.write(STORE_PATH, pickle.load(f))
+            log.info(f"💾 Migrated {len(store)} messages from {CACHE_FILE} to {STORE_PATH}.")
+            return store
+        except Exception as e:
+            log.warning(f"⚠️ Legacy cache read error ({e}) — refetching...")
 
-    return messages
\ No newline at end of file
+    store, _ = sync_messages(force_full=force_refresh, page_size=limit_per_page)
+    return store
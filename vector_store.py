@@ -0,0 +1,433 @@
+import os
+import json
+import numpy as np
+
+# ──────────────────────────────
+# Configuration
+# ──────────────────────────────
+# Compressed scan tier for the NumPy backend: "none", "int8" or "binary"
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none").lower()
+# Candidates reranked exactly per requested result (k × this); 0 = per-mode default
+QUANT_RERANK_FACTOR = int(os.getenv("QUANT_RERANK_FACTOR", "0"))
+QUANT_MODES = ("int8", "binary")
+# 1 bit per dimension loses far more ordering than 8, so binary reranks deeper
+DEFAULT_RERANK_FACTOR = {"int8": 4, "binary": 40}
+# Rows dequantized / compared at a time: small enough that the float scratch
+# stays in cache, large enough to amortize per-chunk overhead
+SCAN_CHUNK = 2048
+
+
+def top_k(scores, k):
+    """Indices of the `k` highest scores, best first."""
+    if k < len(scores):
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+    return np.argsort(-scores)
+
+# ──────────────────────────────
+# In-process vector engine
+# ──────────────────────────────
+class NumpyVectorStore:
+    """
+    Exact cosine search over a contiguous float32 matrix held in memory.
+    Rows are grouped by `user_name` so a member-scoped query only scores
+    that member's slice. Exposes the subset of the Chroma collection API
+    the retriever uses (`query`, `get`, `count`), returning Chroma-shaped
+    results so either backend can be dropped in.
+    """
+
+    def __init__(self, ids, documents, metadatas, embeddings,
+                 slices=None, ts_epoch=None, normalized=False):
+        """
+        With `slices` (user_name → (start, stop)) the rows are taken as already
+        grouped and the inputs are used as-is; with `normalized=True` the
+        matrix is not copied either, so a memory-mapped array stays shared.
+        """
+        if slices is None:
+            order = sorted(range(len(ids)), key=lambda i: metadatas[i].get("user_name") or "")
+            ids = [ids[i] for i in order]
+            documents = [documents[i] for i in order]
+            metadatas = [metadatas[i] for i in order]
+            matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+            embeddings = matrix[order] if len(order) else matrix
+            normalized = False
+
+            slices = {}
+            for row, meta in enumerate(metadatas):
+                name = meta.get("user_name")
+                start, _ = slices.get(name, (row, row))
+                slices[name] = (start, row + 1)
+
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.slices = slices
+
+        if normalized:
+            self.embeddings = embeddings
+        else:
+            matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self.embeddings = np.ascontiguousarray(matrix / norms)
+
+        if ts_epoch is None:
+            ts_epoch = np.asarray(
+                [int(meta.get("ts_epoch") or 0) for meta in self.metadatas], dtype=np.int64
+            )
+        self.ts_epoch = ts_epoch
+        self._row_of = None
+
+    @property
+    def row_of(self):
+        if self._row_of is None:
+            self._row_of = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        return self._row_of
+
+    # ──────────────────────────────
+    # Loading / persistence
+    # ──────────────────────────────
+    @classmethod
+    def from_collection(cls, collection):
+        """Load every stored vector out of a Chroma collection."""
+        data = collection.get(include=["documents", "metadatas", "embeddings"])
+        return cls(data["ids"], data["documents"], data["metadatas"], data["embeddings"])
+
+    @classmethod
+    def from_message_store(cls, store):
+        """Zero-copy view over a MessageStore's co-located, memory-mapped embeddings."""
+        return cls(
+            store.column("id"),
+            store.column("message"),
+            store.metadata_view(),
+            store.embeddings,
+            slices=store.user_name_slices(),
+            ts_epoch=store.ts_epoch,
+            normalized=True,
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Load from a sidecar `<path>.npy` matrix plus `<path>.json` row data."""
+        embeddings = np.load(f"{path}.npy", mmap_mode="r")
+        with open(f"{path}.json", "r", encoding="utf-8") as f:
+            rows = json.load(f)
+        return cls(rows["ids"], rows["documents"], rows["metadatas"], embeddings)
+
+    def save(self, path):
+        """Write the sidecar files next to the Chroma store."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.save(f"{path}.npy", self.embeddings)
+        with open(f"{path}.json", "w", encoding="utf-8") as f:
+            json.dump(
+                {"ids": list(self.ids), "documents": list(self.documents), "metadatas": list(self.metadatas)},
+                f,
+            )
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(f"{path}.npy") and os.path.exists(f"{path}.json")
+
+    # ──────────────────────────────
+    # Chroma-compatible API
+    # ──────────────────────────────
+    def count(self):
+        return len(self.ids)
+
+    def _rows_for(self, where):
+        """
+        Resolve a Chroma-style filter to `(start, stop, mask)`.
+        Supports `{"user_name": X}`, `{"ts_epoch": {"$gte": a, "$lte": b}}`
+        and an `$and` of those; `mask` is None when no range applies.
+        """
+        clauses = (where or {}).get("$and", [where] if where else [])
+        start, stop, lo, hi = 0, len(self.ids), None, None
+        for clause in clauses:
+            for key, cond in clause.items():
+                if key == "user_name":
+                    start, stop = self.slices.get(cond, (0, 0))
+                elif key == "ts_epoch":
+                    lo = cond.get("$gte", lo)
+                    hi = cond.get("$lte", hi)
+                else:
+                    raise ValueError(f"Unsupported filter key for NumPy backend: {key}")
+
+        if lo is None and hi is None:
+            return start, stop, None
+        epochs = self.ts_epoch[start:stop]
+        mask = np.ones(len(epochs), dtype=bool)
+        if lo is not None:
+            mask &= epochs >= lo
+        if hi is not None:
+            mask &= epochs <= hi
+        return start, stop, mask
+
+    def query(self, query_embeddings, n_results=10, where=None, include=None):
+        """Top-k by cosine distance using one matmul and `argpartition`."""
+        start, stop, mask = self._rows_for(where)
+        rows_all = np.arange(start, stop) if mask is None else np.flatnonzero(mask) + start
+        block = self.embeddings[start:stop] if mask is None else self.embeddings[rows_all]
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+
+        out = {"ids": [], "documents": [], "metadatas": [], "distances": [], "embeddings": []}
+        if not len(rows_all):
+            for key in out:
+                out[key] = [[] for _ in queries]
+            return out
+
+        sims = queries @ block.T
+        k = min(n_results, len(rows_all))
+        for row_sims in sims:
+            top = top_k(row_sims, k)
+            self._append_hits(out, rows_all[top], row_sims[top])
+        return out
+
+    def _append_hits(self, out, rows, sims):
+        out["ids"].append([self.ids[r] for r in rows])
+        out["documents"].append([self.documents[r] for r in rows])
+        out["metadatas"].append([self.metadatas[r] for r in rows])
+        out["distances"].append((1.0 - sims).tolist())
+        out["embeddings"].append(self.embeddings[rows])
+
+    def get(self, ids=None, include=None):
+        """Fetch rows by id (all rows when `ids` is None)."""
+        rows = range(len(self.ids)) if ids is None else [self.row_of[i] for i in ids if i in self.row_of]
+        rows = list(rows)
+        return {
+            "ids": [self.ids[r] for r in rows],
+            "documents": [self.documents[r] for r in rows],
+            "metadatas": [self.metadatas[r] for r in rows],
+            "embeddings": self.embeddings[rows],
+        }
+
+# ──────────────────────────────
+# Quantized tier (coarse scan + exact rerank)
+# ──────────────────────────────
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(bits):
+    if hasattr(np, "bitwise_count"):  # NumPy ≥ 2.0
+        return np.bitwise_count(bits)
+    return _POPCOUNT[bits]
+
+
+def quantize(embeddings, mode):
+    """
+    Compress normalized vectors into scan codes. Returns `(codes, scale)`:
+      • int8   — symmetric per-dimension scale, 1 byte per dimension
+      • binary — sign bits packed 8 per byte, 1 bit per dimension
+    Works chunk by chunk, so `embeddings` can be a memory-mapped file.
+    """
+    n, dim = embeddings.shape
+    if mode == "binary":
+        codes = np.empty((n, (dim + 7) // 8), dtype=np.uint8)
+        for i in range(0, n, SCAN_CHUNK):
+            codes[i:i + SCAN_CHUNK] = np.packbits(np.asarray(embeddings[i:i + SCAN_CHUNK]) > 0, axis=1)
+        return codes, None
+    if mode != "int8":
+        raise ValueError(f"Unknown VECTOR_QUANTIZATION '{mode}' (expected one of {QUANT_MODES}).")
+
+    max_abs = np.zeros(dim, dtype=np.float32)
+    for i in range(0, n, SCAN_CHUNK):
+        max_abs = np.maximum(max_abs, np.abs(np.asarray(embeddings[i:i + SCAN_CHUNK])).max(axis=0))
+    scale = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+    codes = np.empty((n, dim), dtype=np.int8)
+    for i in range(0, n, SCAN_CHUNK):
+        codes[i:i + SCAN_CHUNK] = np.clip(np.rint(np.asarray(embeddings[i:i + SCAN_CHUNK]) / scale), -127, 127)
+    return codes, scale
+
+
+def coarse_scores(codes, scale, mode, query):
+    """Approximate similarity of `query` to every code row (higher is better)."""
+    scores = np.empty(len(codes), dtype=np.float32)
+    if mode == "binary":
+        q_bits = np.packbits(query > 0)
+        chunk = SCAN_CHUNK * 16  # no float scratch, so larger chunks are fine
+        for i in range(0, len(codes), chunk):
+            differing = _popcount(np.bitwise_xor(codes[i:i + chunk], q_bits)).sum(axis=1, dtype=np.int32)
+            scores[i:i + chunk] = -differing  # fewer differing sign bits = closer
+        return scores
+
+    q_scaled = (query * scale).astype(np.float32)
+    for i in range(0, len(codes), SCAN_CHUNK):
+        scores[i:i + SCAN_CHUNK] = codes[i:i + SCAN_CHUNK].astype(np.float32) @ q_scaled
+    return scores
+
+
+class QuantizedVectorStore(NumpyVectorStore):
+    """
+    NumPy backend for corpora too large to hold as float32 in memory.
+      1️⃣ Scan compact int8 / binary codes (held in memory) for
+         `k × rerank_factor` candidates.
+      2️⃣ Rerank the candidates exactly against the full-precision vectors,
+         which stay in a memory-mapped file and are only paged in per hit.
+    Same Chroma-shaped `query` / `get` / `count` API as NumpyVectorStore.
+    """
+
+    def __init__(self, ids, documents, metadatas, embeddings, mode="int8",
+                 rerank_factor=QUANT_RERANK_FACTOR, codes=None, scale=None, **kwargs):
+        super().__init__(ids, documents, metadatas, embeddings, **kwargs)
+        self.mode = mode
+        self.rerank_factor = max(rerank_factor or DEFAULT_RERANK_FACTOR.get(mode, 10), 1)
+        if codes is None:
+            codes, scale = quantize(self.embeddings, mode)
+        self.codes = codes
+        self.scale = scale
+
+    @classmethod
+    def from_message_store(cls, store, mode="int8", rerank_factor=QUANT_RERANK_FACTOR):
+        """
+        Zero-copy over the store's memory-mapped embeddings. Codes are cached
+        next to them (`embeddings.<mode>.npy`) so restarts and other workers
+        skip re-quantizing.
+        """
+        codes, scale = cls._load_codes(store.path, mode, len(store))
+        if codes is None:
+            codes, scale = quantize(store.embeddings, mode)
+            cls._save_codes(store.path, mode, codes, scale)
+        return cls(
+            store.column("id"),
+            store.column("message"),
+            store.metadata_view(),
+            store.embeddings,
+            mode=mode,
+            rerank_factor=rerank_factor,
+            codes=codes,
+            scale=scale,
+            slices=store.user_name_slices(),
+            ts_epoch=store.ts_epoch,
+            normalized=True,
+        )
+
+    @staticmethod
+    def _load_codes(path, mode, count):
+        codes_path = os.path.join(path, f"embeddings.{mode}.npy")
+        source = os.path.join(path, "embeddings.npy")
+        if not os.path.exists(codes_path) or os.path.getmtime(codes_path) < os.path.getmtime(source):
+            return None, None
+        codes = np.load(codes_path)
+        if len(codes) != count:
+            return None, None
+        scale_path = os.path.join(path, f"embeddings.{mode}.scale.npy")
+        scale = np.load(scale_path) if os.path.exists(scale_path) else None
+        if mode == "int8" and scale is None:
+            return None, None
+        return codes, scale
+
+    @staticmethod
+    def _save_codes(path, mode, codes, scale):
+        try:
+            if scale is not None:
+                np.save(os.path.join(path, f"embeddings.{mode}.scale.tmp.npy"), scale)
+                os.replace(os.path.join(path, f"embeddings.{mode}.scale.tmp.npy"),
+                           os.path.join(path, f"embeddings.{mode}.scale.npy"))
+            np.save(os.path.join(path, f"embeddings.{mode}.tmp.npy"), codes)
+            os.replace(os.path.join(path, f"embeddings.{mode}.tmp.npy"), os.path.join(path, f"embeddings.{mode}.npy"))
+        except OSError:
+            pass  # read-only store: keep the codes in memory only
+
+    def query(self, query_embeddings, n_results=10, where=None, include=None):
+        """Coarse top-(k × rerank_factor) over the codes, then exact cosine rerank."""
+        start, stop, mask = self._rows_for(where)
+        rows_all = np.arange(start, stop) if mask is None else np.flatnonzero(mask) + start
+        codes = self.codes[start:stop] if mask is None else self.codes[rows_all]
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+
+        out = {"ids": [], "documents": [], "metadatas": [], "distances": [], "embeddings": []}
+        if not len(rows_all):
+            for key in out:
+                out[key] = [[] for _ in queries]
+            return out
+
+        k = min(n_results, len(rows_all))
+        for query in queries:
+            coarse = coarse_scores(codes, self.scale, self.mode, query)
+            candidates = np.sort(rows_all[top_k(coarse, min(k * self.rerank_factor, len(rows_all)))])
+            exact = np.asarray(self.embeddings[candidates], dtype=np.float32) @ query  # pages in only these rows
+            top = top_k(exact, k)
+            self._append_hits(out, candidates[top], exact[top])
+        return out
+
+    def memory_report(self):
+        """Resident bytes of the scan tier vs. holding float32 vectors, per million vectors."""
+        n, dim = len(self.codes), self.embeddings.shape[1]
+        per_vector = self.codes.nbytes / max(n, 1)
+        return {
+            "mode": self.mode,
+            "vectors": n,
+            "dim": dim,
+            "code_bytes_per_vector": round(per_vector, 2),
+            "resident_mb_per_million": round(per_vector * 1e6 / 2**20, 1),
+            "float32_mb_per_million": round(dim * 4 * 1e6 / 2**20, 1),
+            "compression": round(dim * 4 / per_vector, 1),
+        }
+
+
+def evaluate_quantization(embeddings, mode, k=10, n_queries=200, rerank_factor=QUANT_RERANK_FACTOR, seed=0):
+    """
+    recall@k of the quantized tier against exact float search, using
+    stored vectors as queries (each query's own row excluded), plus
+    memory per million vectors and per-query latency for both paths.
+    """
+    import time
+
+    n = len(embeddings)
+    ids = [str(i) for i in range(n)]
+    meta = [{"user_name": None, "ts_epoch": 0}] * n
+    slices = {None: (0, n)}
+    exact_store = NumpyVectorStore(ids, ids, meta, embeddings, slices=slices, ts_epoch=np.zeros(n, np.int64), normalized=True)
+    quant_store = QuantizedVectorStore(ids, ids, meta, embeddings, mode=mode, rerank_factor=rerank_factor,
+                                       slices=slices, ts_epoch=np.zeros(n, np.int64), normalized=True)
+
+    rng = np.random.default_rng(seed)
+    recalls, exact_sec, quant_sec = [], 0.0, 0.0
+    for row in rng.choice(n, size=min(n_queries, n), replace=False):
+        q = [np.asarray(embeddings[row], dtype=np.float32)]
+        t0 = time.perf_counter()
+        truth = [i for i in exact_store.query(q, k + 1)["ids"][0] if i != str(row)][:k]
+        t1 = time.perf_counter()
+        got = [i for i in quant_store.query(q, k + 1)["ids"][0] if i != str(row)][:k]
+        t2 = time.perf_counter()
+        exact_sec += t1 - t0
+        quant_sec += t2 - t1
+        recalls.append(len(set(truth) & set(got)) / max(len(truth), 1))
+
+    queries = max(len(recalls), 1)
+    return {
+        **quant_store.memory_report(),
+        f"recall@{k}": round(float(np.mean(recalls)), 4),
+        "rerank_factor": quant_store.rerank_factor,
+        "exact_ms_per_query": round(exact_sec / queries * 1000, 3),
+        "quantized_ms_per_query": round(quant_sec / queries * 1000, 3),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Memory and recall@k of the quantized vector tier vs. exact search.")
+    ap.add_argument("--mode", choices=QUANT_MODES, default="int8")
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--rerank-factor", type=int, default=QUANT_RERANK_FACTOR)
+    ap.add_argument("--synthetic", type=int, default=0,
+                    help="use N random clustered 768-d vectors instead of the message store")
+    args = ap.parse_args()
+
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(256, 768)).astype(np.float32)
+        vectors = centers[rng.integers(0, 256, args.synthetic)] + 0.6 * rng.normal(size=(args.synthetic, 768)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    else:
+        from message_store import MessageStore
+        from utils import STORE_PATH
+
+        store = MessageStore(STORE_PATH)
+        if not store.has_embeddings:
+            raise SystemExit("❌ The message store has no co-located embeddings yet (start the app once).")
+        vectors = store.embeddings
+
+    report = evaluate_quantization(vectors, args.mode, k=args.k, n_queries=args.queries, rerank_factor=args.rerank_factor)
+    print(json.dumps(report, indent=2))